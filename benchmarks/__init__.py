@@ -0,0 +1,6 @@
+"""
+CONVERTPDF
+Benchmarks of the conversion pipeline.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
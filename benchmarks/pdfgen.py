@@ -0,0 +1,247 @@
+"""
+PDFGEN
+Generates synthetic floor plans, the files are the same on every run (fixed seeds).
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['PLANS', 'generate']
+
+import os
+import random
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Constants
+A0 = 3370, 2384  # Landscape (points)
+A1 = 2384, 1684
+A3 = 1191, 842
+
+
+class _Page(object):
+    """
+    Page of a synthetic plan.
+    """
+
+    def __init__(self, size: Tuple[int, int], rotate: int = 0) -> None:
+        """
+        Constructor.
+
+        :param size: Page size (points)
+        :param rotate: Page rotation (deg)
+        """
+        self.content: List[str] = []
+        self.image: Optional[Tuple[int, int, bytes]] = None  # Width, height, RGB data
+        self.rotate = rotate
+        self.size = size
+
+
+def _walls(page: _Page, rng: random.Random, n: int) -> None:
+    """
+    Draw the walls and the room labels of a plan.
+
+    :param page: Page
+    :param rng: Random generator
+    :param n: Number of wall segments
+    """
+    w, h = page.size
+    c = page.content
+    c.append('0 0 0 RG 1 J 1 j')
+    for _ in range(n):
+        x, y = rng.uniform(20, w - 20), rng.uniform(20, h - 20)
+        if rng.random() < 0.5:
+            x2, y2 = min(w - 20, x + rng.uniform(5, 300)), y
+        else:
+            x2, y2 = x, min(h - 20, y + rng.uniform(5, 300))
+        c.append(f'{rng.choice((0.25, 0.5, 1, 2.5))} w {x:.2f} {y:.2f} m {x2:.2f} {y2:.2f} l S')
+    c.append('BT /F1 9 Tf')
+    for i in range(n // 50):
+        c.append(f'1 0 0 1 {rng.uniform(20, w - 80):.2f} {rng.uniform(20, h - 20):.2f} Tm (ROOM {i + 1}) Tj')
+    c.append('ET')
+
+
+def _hatches(page: _Page, rng: random.Random, n: int) -> None:
+    """
+    Draw clipped regions filled with diagonal lines.
+
+    :param page: Page
+    :param rng: Random generator
+    :param n: Number of regions
+    """
+    w, h = page.size
+    c = page.content
+    for _ in range(n):
+        rw, rh = rng.uniform(40, 200), rng.uniform(40, 200)
+        x, y = rng.uniform(0, w - rw), rng.uniform(0, h - rh)
+        c.append(f'q {x:.2f} {y:.2f} {rw:.2f} {rh:.2f} re W n 0.3 w 0.4 0.4 0.4 RG')
+        d = rng.choice((2, 3, 4))
+        k = -rh
+        while k < rw:
+            c.append(f'{x + k:.2f} {y:.2f} m {x + k + rh:.2f} {y + rh:.2f} l')
+            k += d
+        c.append(f'S 0 0 0 RG 1 w {x:.2f} {y:.2f} {rw:.2f} {rh:.2f} re S Q')
+
+
+def _raster(page: _Page, rng: random.Random, size: int) -> None:
+    """
+    Embed a raster image (e.g. a scanned site plan) at the background of the page.
+
+    :param page: Page
+    :param rng: Random generator
+    :param size: Image width and height (px)
+    """
+    row = bytearray()
+    noise = bytes(rng.randrange(256) for _ in range(251))
+    data = bytearray()
+    for y in range(size):
+        row.clear()
+        for x in range(size):
+            v = (x ^ y) & 0xff
+            row += bytes((v, (v + noise[(x + y) % 251]) & 0xff, 255 - v))
+        data += row
+    page.image = size, size, bytes(data)
+    w, h = page.size
+    page.content.insert(0, f'q {w * 0.6:.2f} 0 0 {h * 0.6:.2f} {w * 0.2:.2f} {h * 0.2:.2f} cm /Im0 Do Q')
+
+
+def _write(filename: str, pages: List[_Page]) -> None:
+    """
+    Write a pdf with an uncompressed xref table.
+
+    :param filename: Pdf file
+    :param pages: Pages
+    """
+    objs: List[bytes] = []
+
+    def add(data: bytes) -> int:
+        objs.append(data)
+        return len(objs)
+
+    def stream(header: str, data: bytes) -> bytes:
+        return f'<< {header} /Length {len(data)} >>\nstream\n'.encode('latin-1') + data + b'\nendstream'
+
+    add(b'')  # Catalog
+    add(b'')  # Page tree
+    font = add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+    kids = []
+    for p in pages:
+        resources = f'/Font << /F1 {font} 0 R >>'
+        if p.image is not None:
+            iw, ih, data = p.image
+            im = add(stream(f'/Type /XObject /Subtype /Image /Width {iw} /Height {ih} /ColorSpace /DeviceRGB '
+                            f'/BitsPerComponent 8 /Filter /FlateDecode', zlib.compress(data)))
+            resources += f' /XObject << /Im0 {im} 0 R >>'
+        content = add(stream('/Filter /FlateDecode', zlib.compress('\n'.join(p.content).encode('latin-1'))))
+        kids.append(add(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {p.size[0]} {p.size[1]}] /Rotate {p.rotate} '
+                        f'/Resources << {resources} >> /Contents {content} 0 R >>'.encode('latin-1')))
+    objs[0] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    objs[1] = f'<< /Type /Pages /Kids [{" ".join(f"{k} 0 R" for k in kids)}] /Count {len(kids)} >>'.encode('latin-1')
+
+    out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for i, o in enumerate(objs):
+        offsets.append(len(out))
+        out += f'{i + 1} 0 obj\n'.encode('latin-1') + o + b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objs) + 1}\n0000000000 65535 f \n'.encode('latin-1')
+    out += b''.join(f'{o:010d} 00000 n \n'.encode('latin-1') for o in offsets)
+    out += f'trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode('latin-1')
+    with open(filename, 'wb') as f:
+        f.write(out)
+
+
+def _vector() -> List[_Page]:
+    """
+    Single A0 plan with many wall segments and labels.
+
+    :return: Pages
+    """
+    rng = random.Random(1)
+    page = _Page(A0)
+    _walls(page, rng, 30000)
+    return [page]
+
+
+def _hatched() -> List[_Page]:
+    """
+    A1 plan with hatched regions.
+
+    :return: Pages
+    """
+    rng = random.Random(2)
+    page = _Page(A1)
+    _walls(page, rng, 3000)
+    _hatches(page, rng, 400)
+    return [page]
+
+
+def _embedded() -> List[_Page]:
+    """
+    A1 plan over an embedded raster image.
+
+    :return: Pages
+    """
+    rng = random.Random(3)
+    page = _Page(A1)
+    _raster(page, rng, 1024)
+    _walls(page, rng, 3000)
+    return [page]
+
+
+def _multipage() -> List[_Page]:
+    """
+    Six A3 plans.
+
+    :return: Pages
+    """
+    rng = random.Random(4)
+    pages = []
+    for _ in range(6):
+        page = _Page(A3)
+        _walls(page, rng, 2000)
+        _hatches(page, rng, 40)
+        pages.append(page)
+    return pages
+
+
+def _rotated() -> List[_Page]:
+    """
+    Two A1 plans rotated 90 and 270 deg.
+
+    :return: Pages
+    """
+    rng = random.Random(5)
+    pages = []
+    for rotate in (90, 270):
+        page = _Page(A1, rotate)
+        _walls(page, rng, 5000)
+        pages.append(page)
+    return pages
+
+
+PLANS: Dict[str, Callable[[], List[_Page]]] = {
+    'vector': _vector,
+    'hatches': _hatched,
+    'raster': _embedded,
+    'multipage': _multipage,
+    'rotated': _rotated
+}
+
+
+def generate(folder: str, names: Optional[List[str]] = None) -> List[str]:
+    """
+    Generate the synthetic plans, existing files are not generated again.
+
+    :param folder: Output folder
+    :param names: Plans to generate, if None generates all
+    :return: Pdf files
+    """
+    files = []
+    for name in names if names is not None else list(PLANS.keys()):
+        if name not in PLANS:
+            raise ValueError(f'Invalid plan "{name}", valid: {", ".join(PLANS.keys())}')
+        filename = os.path.join(folder, f'{name}.pdf')
+        if not os.path.isfile(filename):
+            _write(filename, PLANS[name]())
+        files.append(filename)
+    return files
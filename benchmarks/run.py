@@ -0,0 +1,198 @@
+"""
+RUN
+Times the conversion core over the synthetic plans, for each combination of
+width, angle, backend and workers. Usage: python -m benchmarks.run --help
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['main', 'run']
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from benchmarks.pdfgen import PLANS, generate
+from resources.backends import BACKENDS
+from resources.converter import Converter
+from resources.metrics import MetricsWriter
+from typing import Any, Dict, Iterator, List, Optional
+
+# Constants
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_KEYS = ('maxwidth', 'angle', 'backend', 'workers')
+
+
+@contextmanager
+def _quiet() -> Iterator[None]:
+    """
+    Discard the standard output, including the messages of the worker processes.
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(devnull)
+        os.close(saved)
+
+
+def _environment() -> Dict[str, Any]:
+    """
+    :return: Description of the machine and the render programs
+    """
+    env = {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+           'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    for name, backend in BACKENDS.items():
+        exe = backend().executable
+        if exe is None:
+            continue
+        try:
+            out = subprocess.run([exe, '--version'], capture_output=True, timeout=30).stdout
+            env[name] = out.decode('utf-8', 'replace').strip().splitlines()[0]
+        except (OSError, IndexError, subprocess.SubprocessError):
+            env[name] = exe
+    return env
+
+
+def run(files: List[str], lang: Dict[str, str], maxwidth: int, angle: float, backend: str, workers: int,
+        memory: int = 0) -> Dict[str, Any]:
+    """
+    Convert the files with a configuration, the render cache is disabled.
+
+    :param files: Pdf files
+    :param lang: Language dict
+    :param maxwidth: Maximum width/height (px)
+    :param angle: Angle (deg)
+    :param backend: Render backend
+    :param workers: Number of parallel conversions
+    :param memory: Memory limit of each conversion (MB)
+    :return: Result
+    """
+    for f in files:  # Images of the previous configuration
+        name = os.path.splitext(f)[0]
+        for image in glob.glob(name + '.png') + glob.glob(name + '-*.png'):
+            os.remove(image)
+    fd, records = tempfile.mkstemp(suffix='.jsonl')
+    os.close(fd)
+    try:
+        converter = Converter(lang, {'MAXWIDTH': maxwidth, 'ANGLE': angle, 'PAGES': '', 'BACKEND': backend},
+                              workers=workers, memory_limit=memory, overwrite=True,
+                              metrics=MetricsWriter(records))
+        with _quiet():
+            t0 = time.perf_counter()
+            _, failed = converter.convert_many(files)
+            seconds = time.perf_counter() - t0
+        with open(records, encoding='utf-8') as f:
+            pages = [json.loads(line) for line in f]
+    finally:
+        os.remove(records)
+    ok = [p for p in pages if p['status'] == 'ok']
+    stages: Dict[str, float] = {}
+    for p in ok:
+        for s, t in p['stages'].items():
+            stages[s] = round(stages.get(s, 0) + t, 6)
+    mpx = sum(p['width'] * p['height'] for p in ok) / 1e6
+    return {
+        'maxwidth': maxwidth, 'angle': angle, 'backend': backend, 'workers': workers,
+        'pages': len(ok), 'failed': len(failed),
+        'seconds': round(seconds, 3),
+        'pages_s': round(len(ok) / seconds, 3),
+        'mpx_s': round(mpx / seconds, 3),
+        'peak_rss_mb': round(max([p['peak_rss'] for p in ok] + [0]) / 1024 / 1024, 1),
+        'bytes': sum(p['bytes'] for p in ok),
+        'stages': stages
+    }
+
+
+def _compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """
+    Compare the throughput against a previous run.
+
+    :param results: Results
+    :param baseline: Results of the previous run
+    :param tolerance: Allowed slowdown (fraction)
+    :return: Regressions
+    """
+    previous = {tuple(r[k] for k in _KEYS): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = previous.get(tuple(r[k] for k in _KEYS))
+        if b is None or b['pages_s'] == 0:
+            continue
+        change = r['pages_s'] / b['pages_s'] - 1
+        r['change'] = round(change, 3)
+        if change < -tolerance or r['peak_rss_mb'] > b['peak_rss_mb'] * (1 + tolerance) + 1:
+            regressions.append(', '.join(f'{k}={r[k]}' for k in _KEYS) +
+                               f': {b["pages_s"]} -> {r["pages_s"]} pages/s, '
+                               f'{b["peak_rss_mb"]} -> {r["peak_rss_mb"]} MB')
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run the benchmarks.
+
+    :param argv: Command line arguments
+    :return: Exit code, 1 if there are regressions
+    """
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='Benchmark the pdf conversion')
+    parser.add_argument('--plans', nargs='+', default=list(PLANS.keys()), choices=list(PLANS.keys()))
+    parser.add_argument('--maxwidth', nargs='+', type=int, default=[1920, 4800, 9600, 12500])
+    parser.add_argument('--angle', nargs='+', type=float, default=[0, 90])
+    parser.add_argument('--backend', nargs='+', default=list(BACKENDS.keys()), choices=list(BACKENDS.keys()))
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, os.cpu_count() or 1])
+    parser.add_argument('--memory', type=int, default=0, help='memory limit of each conversion (MB)')
+    parser.add_argument('--folder', default='', help='folder of the plans, a temporary folder by default')
+    parser.add_argument('--output', default='', help='store the results as json')
+    parser.add_argument('--baseline', default='', help='results of a previous run, regressions fail the run')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed slowdown against the baseline')
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(_ROOT, 'resources', 'lang_en.json'), encoding='utf8') as json_data:
+        lang = json.load(json_data)
+    backends = [b for b in args.backend if BACKENDS[b]().available()]
+    if len(backends) == 0:
+        print('No render backend available')
+        return 1
+
+    folder = args.folder if args.folder != '' else tempfile.mkdtemp(prefix='convertpdf_bench_')
+    os.makedirs(folder, exist_ok=True)
+    files = generate(folder, args.plans)
+    print(f'Plans: {", ".join(args.plans)} ({folder})')
+    print(f'{"maxwidth":>8} {"angle":>6} {"backend":>12} {"workers":>7} {"pages":>5} {"s":>8} {"pages/s":>8} '
+          f'{"Mpx/s":>8} {"rss MB":>8}')
+    results = []
+    for maxwidth, angle, backend, workers in itertools.product(args.maxwidth, args.angle, backends,
+                                                               sorted(set(args.workers))):
+        r = run(files, lang, maxwidth, angle, backend, workers, args.memory)
+        results.append(r)
+        print(f'{maxwidth:>8} {angle:>6} {backend:>12} {workers:>7} {r["pages"]:>5} {r["seconds"]:>8} '
+              f'{r["pages_s"]:>8} {r["mpx_s"]:>8} {r["peak_rss_mb"]:>8}' + (' FAILED' if r['failed'] else ''),
+              flush=True)
+
+    regressions = []
+    if args.baseline != '':
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = _compare(results, json.load(f)['results'], args.tolerance)
+        for r in regressions:
+            print(f'REGRESSION {r}')
+    if args.output != '':
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'environment': _environment(), 'plans': args.plans, 'results': results}, f, indent=2)
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,28 +4,38 @@ Converts a plan from pdf to png, keep transparency.
 
 Requires:
     ghostscript
-    imagemagick
+    imagemagick (optional, fallback backend)
 
 Author: Pablo Pizarro R. @ppizarror.com
 """
 
-__all__ = ['App', 'VERSION']
+__all__ = ['App', 'batch', 'serve', 'watch', 'VERSION']
 
+import argparse
+import asyncio
 import ctypes
 import json
-import math
-import subprocess
+import queue
+import sys
 import time
 import tkinter.messagebox
-from tkinter.filedialog import askopenfilename
-import traceback
+from tkinter.filedialog import askdirectory, askopenfilenames
 from tkinter import *
-from tkinter import font
-from resources.utils import Cd, get_local_path
-from resources.vframe import VerticalScrolledFrame
+from tkinter import font, ttk
+from resources.backends import BACKENDS
+from resources.console import ConsoleBuffer
+from resources.converter import AsyncConverter, Converter, expand_inputs
+from resources.formats import FORMATS
+from resources.metrics import MetricsWriter
+from resources.png import COMPRESSION_PROFILES
+from resources.server import ConversionServer
+from resources.utils import ProcessLimits
+from resources.preview import preview_photo
+from resources.watch import Watcher
+from resources.worker import ConversionJob, ConversionWorker, JOB_CANCELLED, JOB_DONE, JOB_FAILED, JOB_QUEUED, \
+    JOB_RUNNING
 from settings import SettingsDialog
-from typing import List, Dict, Union, Optional
-import shutil
+from typing import Any, List, Dict, Union, Optional, Tuple
 import os
 
 _actualpath = str(os.path.abspath(os.path.dirname(__file__))).replace('\\', '/')
@@ -38,10 +48,34 @@ try:
 except:
     WSOUND_MODULE = False
 
+# noinspection PyBroadException
+try:
+    from tkinterdnd2 import DND_FILES, TkinterDnD
+
+    DND_MODULE = True
+except:
+    DND_MODULE = False
+
 # Constants
+EVENTS_POLL = 100  # Interval between the reads of the worker events (ms)
+SETTINGS_PREVIEW = 'settings'  # Tag of the previews requested by the settings dialog
 VERSION = '2.4'
 
 
+def _load_config() -> Tuple[Dict[str, Union[str, int, Dict[str, Union[str, int]]]], Dict[str, str]]:
+    """
+    Load the configuration and the language.
+
+    :return: Configuration, language
+    """
+    with open(os.path.join(_actualpath, 'resources/config.json')) as json_data:
+        config = json.load(json_data)
+    config['ROOT'] = _actualpath + '/'
+    with open(os.path.join(_actualpath, config['LANG']), encoding='utf8') as json_data:
+        lang = json.load(json_data)
+    return config, lang
+
+
 # noinspection PyUnusedLocal,PyBroadException,PyTypeChecker
 class App(object):
     """
@@ -65,36 +99,10 @@ class App(object):
             """
             Destroy the application.
             """
+            self._worker.close()
             self._root.destroy()
             exit()
 
-        def _scroll_console(event) -> None:
-            """
-            Scroll console.
-
-            :param event: Event
-            """
-            if 0 < event.x < 420 and 38 < event.y < 150:
-                if os.name == 'nt':  # Windows
-                    if -1 * (event.delta / 100) < 0:
-                        move = -1
-                    else:
-                        move = 2
-                elif os.name == 'darwin':  # OSX
-                    if -1 * event.delta < 0:
-                        move = -2
-                    else:
-                        move = 2
-                else:
-                    if -1 * (event.delta / 100) < 0:
-                        move = -1
-                    else:
-                        move = 2
-                print(len(self._console), move)
-                if len(self._console) < 5 and move < 0:
-                    return
-                self._info_slider.canv.yview_scroll(move, 'units')
-
         # Configure dpi awareness
         if os.name == 'nt':
             try:
@@ -102,23 +110,26 @@ class App(object):
             except Exception:
                 ctypes.windll.user32.SetProcessDPIAware()
 
-        self._root = Tk()
+        self._root = TkinterDnD.Tk() if DND_MODULE else Tk()
         self._root.protocol('WM_DELETE_WINDOW', _kill)
 
         # Load configuration
-        with open(os.path.join(_actualpath, 'resources/config.json')) as json_data:
-            d = json.load(json_data)
-            self._config: Dict[str, Union[str, int, Dict[str, Union[str, int]]]] = d
-        self._config['ROOT'] = str(os.path.abspath(os.path.dirname(__file__))).replace(
-            '\\', '/') + '/'
-        with open(os.path.join(_actualpath, self._config['LANG']), encoding='utf8') as json_data:
-            d = json.load(json_data)
-            self._lang = d
+        self._config, self._lang = _load_config()
 
         # Conversion settings
         self._conversion = {
             'MAXWIDTH': 9600,
-            'ANGLE': 0
+            'ANGLE': 0,
+            'PAGES': '',
+            'BACKEND': self._config['CONVERSION']['BACKEND'],
+            'TILED': False,
+            'COMPRESSION': self._config['CONVERSION']['COMPRESSION'],
+            'FORMAT': self._config['CONVERSION']['FORMAT'],
+            'CROP': self._config['POSTPROCESS']['CROP'],
+            'WHITE': self._config['POSTPROCESS']['WHITE'],
+            'DERIVATIVES': self._config['POSTPROCESS']['DERIVATIVES'],
+            'SIZES': self._config['POSTPROCESS']['SIZES'],
+            'TILE_SIZE': self._config['POSTPROCESS']['TILE_SIZE']
         }
 
         # Window properties
@@ -136,17 +147,24 @@ class App(object):
 
         f1 = Frame(self._root, border=5)
         f1.pack(fill=X)
+        f3 = Frame(self._root)
+        f3.pack(side=BOTTOM, fill=X)
         f2 = Frame(self._root)
-        f2.pack(fill=BOTH)
+        f2.pack(fill=BOTH, expand=True)
 
         # Load file
         self._loadbutton = Button(f1, text=self._lang['LOAD_FILE_BUTTON'], state='normal', relief=GROOVE,
                                   command=self.load_file, cursor='hand2')
         self._loadbutton.pack(side=LEFT, padx=5, anchor=W)
 
+        # Load all pdf files of a folder
+        self._loadfolderbutton = Button(f1, text=self._lang['LOAD_FOLDER_BUTTON'], state='normal', relief=GROOVE,
+                                        command=self.load_folder, cursor='hand2')
+        self._loadfolderbutton.pack(side=LEFT, padx=(0, 5), anchor=W)
+
         # Label that shows loaded configuration name
         self._mainlabelstr = StringVar()
-        self._mainlabel = Label(f1, textvariable=self._mainlabelstr, foreground='#555', width=35, anchor='w')
+        self._mainlabel = Label(f1, textvariable=self._mainlabelstr, foreground='#555', width=20, anchor='w')
         self._mainlabel.pack(side=LEFT, padx=3)
 
         # Convert
@@ -156,20 +174,50 @@ class App(object):
         self._convertbutton.image = upimg
         self._convertbutton.pack(side=RIGHT, padx=(5, 2), anchor=E)
 
+        # Cancel the running conversion
+        self._cancelbutton = Button(f1, text=self._lang['CANCEL'], relief=GROOVE, state='disabled',
+                                    command=self.cancel_jobs)
+        self._cancelbutton.pack(side=RIGHT, padx=5, anchor=E)
+
         # Request configs
         self._configurebutton = Button(f1, text=self._lang['SETTINGS'], relief=GROOVE, command=self.request_settings)
         self._configurebutton.pack(side=RIGHT, padx=5, anchor=E)
 
-        # Console
-        self._info_slider = VerticalScrolledFrame(f2)
-        self._info_slider.canv.config(bg='#000000')
-        self._info_slider.pack(pady=2, anchor=NE, fill=BOTH, padx=1)
-        self._info = Label(self._info_slider.interior, text='', justify=LEFT, anchor=NW,
-                           bg='black', fg='white', wraplength=self._config['APP']['WIDTH'] - 20,  # Discount slider
-                           font=font.Font(family='Courier', size=9), relief=FLAT, border=2, cursor='arrow')
-        self._info.pack(anchor=NW, fill=BOTH)
-        self._console = []
-        self._cnextnl = False
+        # Preview the first loaded file
+        self._previewbutton = Button(f1, text=self._lang['PREVIEW_BUTTON'], relief=GROOVE, state='disabled',
+                                     command=self.preview)
+        self._previewbutton.pack(side=RIGHT, padx=(5, 0), anchor=E)
+
+        # Preview panel, next to the console
+        panel = self._config['PREVIEW']['PANEL']
+        f4 = Frame(f2, width=panel, bg='black')
+        f4.pack(side=RIGHT, fill=Y, padx=(0, 1), pady=2)
+        f4.pack_propagate(False)
+        self._preview = Label(f4, bg='black')
+        self._preview.pack(fill=BOTH, expand=True)
+
+        # Console, the text is only appended; thus, printing does not depend on the number of lines
+        info_slider = Scrollbar(f2, orient=VERTICAL)
+        info_slider.pack(side=RIGHT, fill=Y, pady=2)
+        self._info = Text(f2, bg='black', fg='white', font=font.Font(family='Courier', size=9), relief=FLAT, border=2,
+                          cursor='arrow', wrap=WORD, height=1, state=DISABLED, yscrollcommand=info_slider.set)
+        self._info.pack(pady=2, anchor=NE, fill=BOTH, expand=True, padx=(1, 0))
+        info_slider.configure(command=self._info.yview)
+
+        # Job queue
+        self._queue = ttk.Treeview(f3, columns=('file', 'settings', 'state'), show='headings',
+                                   height=self._config['APP']['QUEUE_ROWS'])
+        for c, w in (('file', 300), ('settings', 180), ('state', 100)):
+            self._queue.heading(c, text=self._lang[f'QUEUE_{c.upper()}'], anchor=W)
+            self._queue.column(c, width=w, anchor=W)
+        queue_slider = Scrollbar(f3, orient=VERTICAL, command=self._queue.yview)
+        self._queue.configure(yscrollcommand=queue_slider.set)
+        queue_slider.pack(side=RIGHT, fill=Y)
+        self._queue.pack(side=LEFT, fill=X, expand=True, padx=(1, 0))
+        self._console = ConsoleBuffer(self._config['CONSOLE']['LIMIT_MESSAGES_CONSOLE'])
+        self._console_redraw: Optional[str] = None  # Scheduled redraw
+        self._console_last = 0.0  # Time of the last redraw
+        self._console_scroll = 1
         self._settings = None  # Opened
         _about()
 
@@ -180,20 +228,38 @@ class App(object):
             self._lastfolder = lsession['LAST_FOLDER']
         else:
             self._lastfolder = self._config['ROOT']
-        self._loadedfile = {}
+        self._loadedfiles: List[str] = []
         self._lastloadedfile = ''
         self._clearstatus()
 
+        # Conversions run in background threads, the cpu cores are shared by the jobs
+        workers = max(1, self._config['CONVERSION']['QUEUE_WORKERS'])
+        self._worker = ConversionWorker(self._lang, {
+            'memory_limit': self._config['CONVERSION']['WORKER_MEMORY_MB'],
+            'cache_size': self._config['CONVERSION']['CACHE_SIZE_MB'],
+            'threads': max(1, (os.cpu_count() or 1) // workers),
+            'pool_jobs': self._config['CONVERSION']['POOL_JOBS'],
+            'pool_memory': self._config['CONVERSION']['POOL_MEMORY_MB'],
+            'limits': ProcessLimits(*[self._config['CONVERSION'][k] for k in ('TIMEOUT', 'MAX_MEMORY_MB',
+                                                                              'MAX_CPU_TIME', 'MAX_DISK_MB')]),
+            'metrics': MetricsWriter(*[os.path.join(_actualpath, f) if f != '' else ''
+                                       for f in (self._config['METRICS']['JSONL'], self._config['METRICS']['PROMETHEUS'])])
+        }, workers)
+
         # Events
-        self._root.bind('<MouseWheel>', _scroll_console)
+        if DND_MODULE:
+            self._root.drop_target_register(DND_FILES)
+            self._root.dnd_bind('<<Drop>>', lambda e: self._load(list(self._root.tk.splitlist(e.data))))
+        self._root.after(EVENTS_POLL, self._poll_events)
 
     def _clearstatus(self) -> None:
         """
         Clear a loaded status.
         """
         self._convertbutton.configure(state='disabled', cursor='arrow')
+        self._previewbutton.configure(state='disabled', cursor='arrow')
         self._mainlabelstr.set('')
-        self._loadedfile = {}
+        self._loadedfiles = []
         self._generationok = False
         self._lastloadedfile = ''
 
@@ -203,17 +269,27 @@ class App(object):
 
         :param scrolldir: Scroll direction
         """
+        self._console.clear()
+        self._console_scroll = scrolldir
+        self._info.configure(state=NORMAL)
+        self._info.delete('1.0', END)
+        self._info.configure(state=DISABLED)
 
-        # noinspection PyShadowingNames,PyUnusedLocal
-        def _slide(*args) -> None:
-            """
-            Move scroll.
-            """
-            self._info_slider.canv.yview_scroll(1000 * scrolldir, 'units')
-
-        self._console = []
-        self._info.config(text='')
-        self._root.after(10, _slide)
+    def _redraw_console(self) -> None:
+        """
+        Append the messages printed since the last redraw, then scroll the console once.
+        """
+        self._console_redraw = None
+        self._console_last = time.perf_counter()
+        reset, text, dropped = self._console.flush()
+        self._info.configure(state=NORMAL)
+        if reset:
+            self._info.delete('1.0', END)
+        self._info.insert(END, text)
+        if dropped > 0:  # Oldest lines of the ring buffer
+            self._info.delete('1.0', f'{dropped + 1}.0')
+        self._info.configure(state=DISABLED)
+        self._info.yview_moveto(1 if self._console_scroll > 0 else 0)
 
     def _errorsound(self) -> None:
         """
@@ -224,38 +300,77 @@ class App(object):
 
     def load_file(self) -> None:
         """
-        Load a file pdf to convert to png.
+        Load pdf files to convert to png.
         """
         if not self._check_settings_closed:
             return
         self._print(self._lang['LOAD_WAITING_USER'], end='', hour=True)
         if self._config['REMEMBER_LAST_FOLDER'] and self._lastfolder != '':
-            filename = askopenfilename(
+            filenames = askopenfilenames(
                 title=self._lang['LOAD_FILE_PICKWINDOW_TITLE'],
                 filetypes=[(self._lang['LOAD_FILE_PDF'], '.pdf')],
                 initialdir=self._lastfolder)
         else:
-            filename = askopenfilename(
+            filenames = askopenfilenames(
                 title=self._lang['LOAD_FILE_PICKWINDOW_TITLE'],
                 filetypes=[(self._lang['LOAD_FILE_PDF'], '.pdf')])
 
-        # Check if the filename is not empty
-        if filename == '' or 'pdf' not in filename.lower():
-            self._print(self._lang['LOAD_CANCELLED'] if filename == '' else self._lang['LOAD_FAILED'])
+        # Check if the selection is not empty
+        if len(filenames) == 0:
+            self._print(self._lang['LOAD_CANCELLED'])
             self._clearstatus()
             return
+        self._print(self._lang['PROCESS_OK'])
+        self._load(list(filenames))
+
+    def load_folder(self) -> None:
+        """
+        Load all pdf files of a folder.
+        """
+        if not self._check_settings_closed:
+            return
+        self._print(self._lang['LOAD_WAITING_USER'], end='', hour=True)
+        if self._config['REMEMBER_LAST_FOLDER'] and self._lastfolder != '':
+            folder = askdirectory(title=self._lang['LOAD_FOLDER_PICKWINDOW_TITLE'], initialdir=self._lastfolder)
         else:
-            self._print(self._lang['PROCESS_OK'])
+            folder = askdirectory(title=self._lang['LOAD_FOLDER_PICKWINDOW_TITLE'])
+        if folder == '':
+            self._print(self._lang['LOAD_CANCELLED'])
+            self._clearstatus()
+            return
+        self._print(self._lang['PROCESS_OK'])
+        self._load([folder])
+
+    def _load(self, inputs: List[str]) -> None:
+        """
+        Load the pdf files of the selected files and folders.
+
+        :param inputs: Files or folders
+        """
+        if not self._check_settings_closed:
+            return
+        files = expand_inputs(inputs)
+        if len(files) == 0:
+            self._print(self._lang['LOAD_FAILED'], hour=True)
+            self._clearstatus()
+            return
 
         # Store last folder
-        filepath = os.path.split(filename)
+        filepath = os.path.split(files[-1])
         self._lastfolder = filepath[0]
         self._lastloadedfile = filepath[1]
+        self._loadedfiles = files
 
         # Validate file
-        self._print(self._lang['START_LOADING'].format(filename), hour=True, end='')
-        self._print(self._lang['LOAD_OK'])
+        if len(files) == 1:
+            self._print(self._lang['START_LOADING'].format(files[0]), hour=True, end='')
+            self._print(self._lang['LOAD_OK'])
+            self._mainlabelstr.set(self._lastloadedfile)
+        else:
+            self._print(self._lang['LOAD_OK_MANY'].format(len(files)), hour=True)
+            self._mainlabelstr.set(self._lang['LOAD_FILES'].format(len(files)))
         self._convertbutton.configure(state='normal', cursor='hand2')
+        self._previewbutton.configure(state='normal', cursor='hand2')
         if self._config['AUTO_START']:
             self._root.after(50, self.request_settings)
 
@@ -268,17 +383,6 @@ class App(object):
         :param scrolldir: Scroll direction
         """
 
-        def _consoled(c: List[str]) -> str:
-            """
-            Generates string with hour of message.
-            :param c: List
-            :return: Text
-            """
-            text = ''
-            for i in c:
-                text = text + i + '\n'
-            return text
-
         def _get_hour() -> str:
             """
             Return system hour.
@@ -287,32 +391,19 @@ class App(object):
             """
             return time.ctime(time.time())[11:19]
 
-        def _slide(*args) -> None:
-            """
-            Scroll the console.
-            """
-            self._info_slider.canv.yview_scroll(2000 * scrolldir, 'units')
-
         try:
             msg = str(msg)
             if hour:
                 msg = self._config['CONSOLE']['MSG_FORMAT'].format(_get_hour(), msg)
-            if len(self._console) == 0 or self._console[len(self._console) - 1] != msg:
-                if self._cnextnl:
-                    self._console[len(self._console) - 1] += msg
-                else:
-                    self._console.append(msg)
-                if end == '':
-                    self._cnextnl = True
-                else:
-                    self._cnextnl = False
-
-            if len(self._console) > self._config['CONSOLE']['LIMIT_MESSAGES_CONSOLE']:
-                self._console.pop()
+            self._console.write(msg, end)
             print(msg, end=end)
 
-            self._info.config(text=_consoled(self._console))
-            self._root.after(100, _slide)
+            # The redraws are coalesced, at most REDRAWS_PER_SECOND
+            self._console_scroll = scrolldir
+            if self._console_redraw is None:
+                interval = 1 / max(1, self._config['CONSOLE']['REDRAWS_PER_SECOND'])
+                wait = self._console_last + interval - time.perf_counter()
+                self._console_redraw = self._root.after(max(0, int(wait * 1000)), self._redraw_console)
         except:
             self._clearconsole()
 
@@ -323,19 +414,33 @@ class App(object):
         if self._settings is not None:
             return self._settings.focus()
         self._print(self._lang['REQUESTING_SETTINGS'], end='', hour=True)
+        preview = self._settings_preview if len(self._loadedfiles) > 0 else None
         self._settings = SettingsDialog(
-            [self._lang, os.path.join(_actualpath, 'resources/settings.ico'), 'basic_settings', [420, 165],
-             self._conversion])
+            [self._lang, os.path.join(_actualpath, 'resources/settings.ico'), 'basic_settings', [420, 220],
+             self._conversion, preview])
         self._settings.w.mainloop(1)
         if self._settings.sent:
             self._print(self._lang['PROCESS_OK'], hour=True)
             self._conversion['MAXWIDTH'] = int(self._settings.values[0])
             # noinspection PyTypeChecker,PyTypedDict
             self._conversion['ANGLE'] = float(self._settings.values[1])
+            self._conversion['PAGES'] = self._settings.values[2]
+            self._conversion['TILED'] = self._settings.values[3]
         else:
             self._print(self._lang['PROCESS_CANCEL'], hour=True)
         self._settings = None
 
+    def _settings_preview(self, angle: float) -> None:
+        """
+        Render in background the preview of the first loaded file with the angle of the
+        settings dialog, the events poll sends it to the dialog.
+
+        :param angle: Angle of the dialog (deg)
+        """
+        self._worker.preview(self._loadedfiles[0], dict(self._conversion, ANGLE=angle),
+                             self._config['PREVIEW']['WIDTH'], self._config['PREVIEW']['CACHE_SIZE_MB'],
+                             SETTINGS_PREVIEW)
+
     def run(self) -> None:
         """
         Run the app.
@@ -367,78 +472,332 @@ class App(object):
             return False
         return True
 
+    def _job_state(self, job: ConversionJob, state: str) -> None:
+        """
+        Report a state of a job.
+
+        :param job: Job
+        :param state: State of the event, the job may be in a later state
+        """
+        self._queue.set(str(job.id), 'state', self._lang[f'QUEUE_STATE_{state.upper()}'])
+        if state == JOB_RUNNING:
+            self._queue.see(str(job.id))
+        elif state == JOB_DONE:
+            self._root.focus_force()
+        elif state == JOB_FAILED:
+            self._errorsound()
+            self._print(job.error)
+        elif state == JOB_CANCELLED:
+            self._print(self._lang['JOB_CANCELLED'].format(os.path.basename(job.filename)), hour=True)
+
+    def _poll_events(self) -> None:
+        """
+        Consume the events of the conversion worker within the Tk main loop.
+        """
+        try:
+            while True:
+                kind, data = self._worker.events.get_nowait()
+                if kind == 'print':
+                    self._print(*data)
+                elif kind == 'state':
+                    self._job_state(*data)
+                elif kind == 'preview' and data[0] == SETTINGS_PREVIEW:
+                    if self._settings is not None:
+                        self._settings.preview_done(*data[2:])
+                elif kind == 'preview':
+                    self._preview_done(*data)
+        except queue.Empty:
+            pass
+        self._cancelbutton.configure(state='normal' if self._worker.busy else 'disabled',
+                                     cursor='hand2' if self._worker.busy else 'arrow')
+        self._root.after(EVENTS_POLL, self._poll_events)
+
+    def cancel_jobs(self) -> None:
+        """
+        Cancel the selected jobs of the queue, or the running jobs if none is selected.
+        """
+        jobs = [self._worker.get(int(i)) for i in self._queue.selection()]
+        if len(jobs) == 0:
+            jobs = self._worker.running
+        for job in jobs:
+            if job is not None and job.state in (JOB_QUEUED, JOB_RUNNING):
+                self._print(self._lang['JOB_CANCELLING'].format(os.path.basename(job.filename)), hour=True)
+                self._worker.cancel(job)
+        self._queue.selection_set(())
+
+    def preview(self) -> None:
+        """
+        Render the preview of the first loaded file.
+        """
+        if len(self._loadedfiles) == 0:
+            return
+        self._request_preview(self._loadedfiles[0])
+
+    def _request_preview(self, filename: str, tag: Any = None) -> None:
+        """
+        Render a preview in background with the current settings.
+
+        :param filename: Pdf file
+        :param tag: Files and settings waiting for the confirmation, None if only displayed
+        """
+        self._print(self._lang['PREVIEW_RENDERING'].format(os.path.basename(filename)), hour=True)
+        self._worker.preview(filename, self._conversion, self._config['PREVIEW']['WIDTH'],
+                             self._config['PREVIEW']['CACHE_SIZE_MB'], tag)
+
+    def _preview_done(self, tag: Optional[Tuple[List[str], Dict[str, Any]]], filename: str, data: bytes,
+                      error: str) -> None:
+        """
+        Display a rendered preview, then ask for the confirmation of the conversion if requested.
+
+        :param tag: Files and settings waiting for the confirmation
+        :param filename: Pdf file
+        :param data: Png data
+        :param error: Error message, empty if rendered
+        """
+        if error != '':
+            self._errorsound()
+            self._print(self._lang['PREVIEW_FAILED'].format(os.path.basename(filename), error), hour=True)
+        else:
+            photo = preview_photo(self._root, data, self._config['PREVIEW']['PANEL'])
+            self._preview.configure(image=photo)
+            self._preview.image = photo
+        if tag is None:
+            return
+        files, conversion = tag
+        if tkinter.messagebox.askyesno(self._lang['PREVIEW_CONFIRM_TITLE'], self._lang['PREVIEW_CONFIRM'].format(
+                len(files), conversion['MAXWIDTH'], conversion['ANGLE'])):
+            self._submit(files, conversion)
+        else:
+            self._print(self._lang['PROCESS_CANCEL'], hour=True)
+            if len(self._loadedfiles) > 0:
+                self._convertbutton.configure(state='normal', cursor='hand2')
+
     def upload(self) -> None:
         """
-        Convert the image.
+        Queue the conversion of the loaded files, other files can be loaded meanwhile.
+        Each job stores the current settings. If configured, the conversion is queued
+        after the preview of the first file is confirmed.
         """
-        if not self._check_settings_closed:
+        if not self._check_settings_closed or len(self._loadedfiles) == 0:
+            return
+        if self._config['PREVIEW']['CONFIRM']:
+            self._convertbutton.configure(state='disabled', cursor='arrow')
+            self._request_preview(self._loadedfiles[0], (list(self._loadedfiles), dict(self._conversion)))
             return
+        self._submit(self._loadedfiles, self._conversion)
 
-        def _callback():
-            try:
-                t0 = time.time()
-                with open(os.devnull, 'w') as FNULL:
-                    with Cd(self._lastfolder):
-                        current_image = os.path.join(get_local_path(), '__convert__.png')  # Remove if exist
-                        if os.path.isfile(current_image):
-                            os.remove(current_image)
-
-                        # Final name of the conversion
-                        final_image = self._lastloadedfile.split('.')
-                        final_image.pop()
-                        final_image.append('png')
-                        final_image = '.'.join(final_image)
-                        if os.path.isfile(final_image):
-                            raise ValueError(self._lang['CONVERSION_ALREADY_EXISTS'].format(final_image))
-
-                        # First, retrieve the pdf size
-                        wh = subprocess.check_output(['magick', 'identify', '-verbose', self._lastloadedfile],
-                                                     shell=True).decode('utf-8')
-                        wh = wh.split('Print size: ')
-                        if len(wh) != 2:
-                            raise ValueError('Invalid PDF. Print size not allowed')
-                        wh = wh[1].split('\n')[0].strip().split('x')  # Format wxh
-                        if len(wh) != 2:
-                            raise ValueError('Invalid print size. Requires format wxh')
-                        density = math.ceil(abs(self._conversion['MAXWIDTH'] / max(float(wh[0]), float(wh[1]))))
-
-                        # Convert from pdf to png
-                        self._print(self._lang['CONVERSION_CONV'].format(self._lastloadedfile, density,
-                                                                         self._conversion['MAXWIDTH']), hour=True)
-                        subprocess.call(['magick', '-density', str(density), self._lastloadedfile, current_image],
-                                        shell=True)
-
-                        # Apply angle
-                        angle = self._conversion['ANGLE']
-                        if angle != 0:
-                            self._print(self._lang['CONVERSION_ANGLE'].format(angle), hour=True)
-                            rotated_image = os.path.join(get_local_path(), '__convertrot__.png')
-                            subprocess.call(['magick', current_image, '-rotate', str(angle), rotated_image], shell=True)
-                            os.remove(current_image)
-                            current_image = rotated_image
-
-                        # Rename image
-                        if os.path.isfile(final_image):
-                            os.remove(final_image)
-                        shutil.move(current_image, final_image)
-                        self._print(self._lang['CONVERSION_FINISHED'].format(round(time.time() - t0, 1)), hour=True)
-                        self._root.focus_force()
-
-                self.save_last_session()
-                self._clearstatus()
-            except Exception as e:
-                self._errorsound()
-                self._print(traceback.format_exc())
-
-            self._loadbutton.configure(state='active', cursor='arrow')
-            self._root.configure(cursor='arrow')
-
-        self._root.configure(cursor='wait')
-        self._convertbutton.configure(state='disabled', cursor='arrow')
-        self._loadbutton.configure(state='disabled', cursor='arrow')
-        self._print(self._lang['PROCESS_STARTED'], hour=True)
-        self._root.after(500, _callback)
+    def _submit(self, files: List[str], conversion: Dict[str, Any]) -> None:
+        """
+        Queue the conversion of the files.
+
+        :param files: Pdf files
+        :param conversion: Conversion settings
+        """
+        pending = self._worker.pending + len(self._worker.running)
+        for f in files:
+            job = self._worker.submit(f, conversion)
+            pages = job.conversion['PAGES'] if job.conversion['PAGES'] != '' else self._lang['QUEUE_ALL_PAGES']
+            self._queue.insert('', END, iid=str(job.id), values=(
+                os.path.basename(f), f'{job.conversion["MAXWIDTH"]} px, {job.conversion["ANGLE"]}°, {pages}',
+                self._lang['QUEUE_STATE_QUEUED']))
+        if pending == 0 and len(files) == 1:
+            self._print(self._lang['PROCESS_STARTED'], hour=True)
+        else:
+            self._print(self._lang['JOB_QUEUED'].format(len(files), pending), hour=True)
+        self.save_last_session()
+        self._clearstatus()
+
+
+def _conversion_parser(prog: str, description: str, config: Dict[str, Any]) -> argparse.ArgumentParser:
+    """
+    Create the parser of the conversion arguments, shared by the command line modes.
+
+    :param prog: Program name
+    :param description: Description
+    :param config: Configuration
+    :return: Parser
+    """
+    parser = argparse.ArgumentParser(prog=prog, description=description)
+    parser.add_argument('-w', '--maxwidth', type=int, default=9600, help='maximum width/height (px)')
+    parser.add_argument('-a', '--angle', type=float, default=0, help='image angle (deg)')
+    parser.add_argument('-p', '--pages', default='', help='page range, e.g. 1-3,5,8- (all pages by default)')
+    parser.add_argument('-b', '--backend', default=config['CONVERSION']['BACKEND'], choices=list(BACKENDS.keys()),
+                        help='render backend, falls back to any available backend')
+    parser.add_argument('-j', '--workers', type=int, default=config['CONVERSION']['WORKERS'],
+                        help='number of parallel conversions, 0 uses all cpu cores')
+    parser.add_argument('-m', '--memory', type=int, default=config['CONVERSION']['WORKER_MEMORY_MB'],
+                        help='memory limit of each conversion (MB), 0 disables the limit')
+    parser.add_argument('-c', '--cache', type=int, default=config['CONVERSION']['CACHE_SIZE_MB'],
+                        help='size of the render cache (MB), 0 disables the cache')
+    parser.add_argument('-z', '--compression', default=config['CONVERSION']['COMPRESSION'],
+                        choices=list(COMPRESSION_PROFILES.keys()), help='compression profile of the output format')
+    parser.add_argument('-f', '--format', default=config['CONVERSION']['FORMAT'], choices=list(FORMATS.keys()),
+                        help='output format: png, lossless webp, or raw rgba compressed with zstd')
+    parser.add_argument('-t', '--tiled', action='store_true',
+                        help='render the pages in bands with bounded memory, allows widths up to 40000 px')
+    parser.add_argument('--crop', action='store_true', default=config['POSTPROCESS']['CROP'],
+                        help='crop the images to the bounds of their content')
+    parser.add_argument('--white', type=int, default=config['POSTPROCESS']['WHITE'],
+                        help='pixels whose red, green and blue are at least this value (0-255) become transparent, '
+                             '0 disables it')
+    parser.add_argument('--derivatives', type=int, nargs='*', default=config['POSTPROCESS']['DERIVATIVES'],
+                        help='also write each image reduced by these factors, e.g. 2 4')
+    parser.add_argument('--sizes', type=int, nargs='*', default=config['POSTPROCESS']['SIZES'],
+                        help='also write each image resized to these widths (px), derived from the same render, '
+                             'e.g. 1920 4800')
+    parser.add_argument('--tiles', type=int, default=config['POSTPROCESS']['TILE_SIZE'],
+                        help='also write a deep zoom (dzi) tile pyramid of each image with tiles of this size (px), '
+                             '0 disables it')
+    parser.add_argument('--pool-jobs', type=int, default=config['CONVERSION']['POOL_JOBS'],
+                        help='pages rendered by each warm ghostscript process before it is replaced, 0 starts a '
+                             'new process for each page')
+    parser.add_argument('--pool-memory', type=int, default=config['CONVERSION']['POOL_MEMORY_MB'],
+                        help='memory of a warm ghostscript process (MB) that replaces it, 0 disables the limit')
+    parser.add_argument('--timeout', type=float, default=config['CONVERSION']['TIMEOUT'],
+                        help='wall-clock time of each render program (s), 0 disables the timeout')
+    parser.add_argument('--max-memory', type=int, default=config['CONVERSION']['MAX_MEMORY_MB'],
+                        help='address space of each render program (MB, Linux only), 0 disables the limit')
+    parser.add_argument('--max-cpu', type=int, default=config['CONVERSION']['MAX_CPU_TIME'],
+                        help='cpu time of each render program (s, Linux only), 0 disables the limit')
+    parser.add_argument('--max-disk', type=int, default=config['CONVERSION']['MAX_DISK_MB'],
+                        help='disk used by the imagemagick pixel cache (MB), 0 disables the limit')
+    parser.add_argument('--metrics', default=config['METRICS']['JSONL'],
+                        help='append the timing record of each page to a JSON lines file')
+    parser.add_argument('--prometheus', default=config['METRICS']['PROMETHEUS'],
+                        help='write the conversion totals to a Prometheus text file')
+    return parser
+
+
+def _conversion(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Create the conversion settings from the command line arguments.
+
+    :param args: Parsed arguments
+    :return: Conversion settings
+    """
+    return {'MAXWIDTH': args.maxwidth, 'ANGLE': args.angle, 'PAGES': args.pages, 'BACKEND': args.backend,
+            'TILED': args.tiled, 'COMPRESSION': args.compression, 'FORMAT': args.format, 'CROP': args.crop,
+            'WHITE': args.white, 'DERIVATIVES': args.derivatives, 'SIZES': args.sizes, 'TILE_SIZE': args.tiles}
+
+
+def _limits(args: argparse.Namespace) -> ProcessLimits:
+    """
+    Create the limits of the render programs from the command line arguments.
+
+    :param args: Parsed arguments
+    :return: Limits
+    """
+    return ProcessLimits(args.timeout, args.max_memory, args.max_cpu, args.max_disk)
+
+
+def _converter(args: argparse.Namespace, lang: Dict[str, str], overwrite: bool = False) -> Converter:
+    """
+    Create the converter from the command line arguments.
+
+    :param args: Parsed arguments
+    :param lang: Language
+    :param overwrite: Replace the existing images
+    :return: Converter
+    """
+    return Converter(lang, _conversion(args),
+                     workers=args.workers, memory_limit=args.memory, cache_size=args.cache, overwrite=overwrite,
+                     metrics=MetricsWriter(args.metrics, args.prometheus), pool_jobs=args.pool_jobs,
+                     pool_memory=args.pool_memory, limits=_limits(args))
+
+
+def batch(argv: List[str]) -> int:
+    """
+    Convert several pdf files without the graphical interface.
+
+    :param argv: Command line arguments
+    :return: Exit code
+    """
+    config, lang = _load_config()
+    parser = _conversion_parser('python -m convert batch', lang['BATCH_DESCRIPTION'], config)
+    parser.add_argument('inputs', nargs='+', help='pdf files, folders or glob patterns')
+    parser.add_argument('--asyncio', action='store_true',
+                        help='convert the pages within one process using asyncio subprocesses, --workers pages at '
+                             'the same time')
+    args = parser.parse_args(argv)
+
+    files = expand_inputs(args.inputs)
+    if len(files) == 0:
+        print(lang['BATCH_NO_FILES'])
+        return 1
+    if args.asyncio:
+        concurrency = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+        converter = AsyncConverter(
+            lang, _conversion(args), concurrency=concurrency, timeout=args.timeout, memory_limit=args.memory,
+            threads=max(1, (os.cpu_count() or 1) // concurrency), cache_size=args.cache,
+            metrics=MetricsWriter(args.metrics, args.prometheus), limits=_limits(args))
+        _, failed = asyncio.run(converter.convert_many(files))
+        return 1 if len(failed) > 0 else 0
+    _, failed = _converter(args, lang).convert_many(files)
+    return 1 if len(failed) > 0 else 0
+
+
+def watch(argv: List[str]) -> int:
+    """
+    Watch a folder tree and convert the new or changed pdf files.
+
+    :param argv: Command line arguments
+    :return: Exit code
+    """
+    config, lang = _load_config()
+    parser = _conversion_parser('python -m convert watch', lang['WATCH_DESCRIPTION'], config)
+    parser.add_argument('folder', help='folder to watch')
+    parser.add_argument('-i', '--interval', type=float, default=config['WATCH']['INTERVAL'],
+                        help='polling interval (s)')
+    parser.add_argument('-d', '--debounce', type=float, default=config['WATCH']['DEBOUNCE'],
+                        help='time a file must remain unchanged before its conversion (s)')
+    parser.add_argument('--poll', action='store_true', help='scan the folder instead of using inotify')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.folder):
+        parser.error(f'folder "{args.folder}" does not exist')
+    watcher = Watcher(_converter(args, lang, overwrite=True), lang, args.folder,
+                      os.path.join(_actualpath, config['WATCH']['STATE_FILE']),
+                      interval=args.interval, debounce=args.debounce, poll=args.poll)
+    watcher.run()
+    return 0
+
+
+def serve(argv: List[str]) -> int:
+    """
+    Serve the conversion through a local HTTP service.
+
+    :param argv: Command line arguments
+    :return: Exit code
+    """
+    config, lang = _load_config()
+    parser = _conversion_parser('python -m convert serve', lang['SERVER_DESCRIPTION'], config)
+    parser.add_argument('--host', default=config['SERVER']['HOST'], help='address of the service')
+    parser.add_argument('--port', type=int, default=config['SERVER']['PORT'], help='port of the service')
+    parser.add_argument('-q', '--queue', type=int, default=config['SERVER']['QUEUE_SIZE'],
+                        help='maximum number of queued files, further requests are rejected with 429')
+    parser.add_argument('--keep', type=int, default=config['SERVER']['KEEP_JOBS'],
+                        help='number of finished jobs kept for the clients')
+    parser.add_argument('--max-upload', type=int, default=config['SERVER']['MAX_UPLOAD_MB'],
+                        help='maximum size of an uploaded pdf (MB)')
+    args = parser.parse_args(argv)
+
+    # Each file is converted by a worker thread, the cpu cores are shared by the workers
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    server = ConversionServer(lang, _conversion(args), {
+        'memory_limit': args.memory, 'cache_size': args.cache,
+        'threads': max(1, (os.cpu_count() or 1) // workers), 'metrics': MetricsWriter(args.metrics, args.prometheus),
+        'pool_jobs': args.pool_jobs, 'pool_memory': args.pool_memory, 'limits': _limits(args)
+    }, host=args.host, port=args.port, workers=workers, queue_size=args.queue, keep_jobs=args.keep,
+        max_upload=args.max_upload)
+    server.serve()
+    return 0
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        sys.exit(batch(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'watch':
+        sys.exit(watch(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        sys.exit(serve(sys.argv[2:]))
     App().run()
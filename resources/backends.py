@@ -0,0 +1,407 @@
+"""
+BACKENDS
+Render backends, rasterize a pdf page to a transparent png, or to a raw RGBA image
+if the page is processed before the encode.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['BACKENDS', 'GhostscriptBackend', 'ImageMagickBackend', 'RenderBackend', 'get_backend']
+
+import asyncio
+import os
+import shutil
+import tempfile
+from resources.metrics import Stages
+from resources.pool import PoolError, RenderPool
+from resources.png import COMPRESSION_PROFILES, PngWriter, read_png_rows, recompress_png
+from resources.raster import PIL_MODULE, rotate_png
+from resources.rawimage import raw_from_png
+from resources.utils import CancelToken, ProcessLimits, acall, call, pipe
+from typing import Dict, List, Optional, Tuple, Type
+
+
+class RenderBackend(object):
+    """
+    Base render backend.
+    """
+    name: str = ''
+    tiled: bool = False  # Supports tiled rendering
+    warm: bool = False  # Renders within a pool of warm processes
+
+    def __init__(self, memory_limit: int = 0, threads: int = 1, compression: str = 'balanced') -> None:
+        """
+        Constructor.
+
+        :param memory_limit: Memory limit of the render (MB), if 0 there is no limit
+        :param threads: Number of rendering and compression threads
+        :param compression: Png compression profile
+        """
+        self._compression = compression
+        self._level = COMPRESSION_PROFILES[compression]
+        self._memory_limit = memory_limit
+        self._threads = max(1, threads)
+        self.pool: Optional[RenderPool] = None  # Warm processes, if None each page starts a new process
+        self.process_limits = ProcessLimits()  # Limits of each external program
+        self.stages = Stages()  # Time of the render stages, replaced by the converter for each page
+        self.token: Optional[CancelToken] = None  # Kills the external programs if the conversion is cancelled
+
+    @property
+    def executable(self) -> Optional[str]:
+        """
+        :return: Path of the backend executable, None if not found
+        """
+        raise NotImplementedError()
+
+    @property
+    def compression(self) -> str:
+        """
+        :return: Png compression profile
+        """
+        return self._compression
+
+    def available(self) -> bool:
+        """
+        :return: True if the backend can be used
+        """
+        return self.executable is not None
+
+    def server_args(self) -> List[str]:
+        """
+        :return: Arguments of the warm processes of the pool
+        """
+        raise NotImplementedError()
+
+    def render(self, filename: str, index: int, density: float, output: str, angle: float = 0) -> None:
+        """
+        Render a page of the pdf. The rotation is applied within the same render,
+        thus, the image is encoded only once.
+
+        :param filename: Pdf file
+        :param index: Page index (starting at 0)
+        :param density: Resolution (dpi)
+        :param output: Output png
+        :param angle: Rotation angle (deg, clockwise)
+        """
+        raise NotImplementedError()
+
+    async def render_async(self, filename: str, index: int, density: float, output: str, angle: float = 0) -> None:
+        """
+        Render a page of the pdf from asyncio, the programs are asyncio subprocesses
+        and the work in memory runs within a thread. By default, the whole render
+        runs within a thread.
+
+        :param filename: Pdf file
+        :param index: Page index (starting at 0)
+        :param density: Resolution (dpi)
+        :param output: Output png
+        :param angle: Rotation angle (deg, clockwise)
+        """
+        await asyncio.to_thread(self.render, filename, index, density, output, angle)
+
+    def render_raw(self, filename: str, index: int, density: float, output: str) -> None:
+        """
+        Render a page of the pdf to a raw RGBA image, which is not rotated.
+
+        :param filename: Pdf file
+        :param index: Page index (starting at 0)
+        :param density: Resolution (dpi)
+        :param output: Output raw image
+        """
+        raise NotImplementedError()
+
+    async def render_raw_async(self, filename: str, index: int, density: float, output: str) -> None:
+        """
+        Render a page of the pdf to a raw RGBA image from asyncio. By default, the
+        whole render runs within a thread.
+
+        :param filename: Pdf file
+        :param index: Page index (starting at 0)
+        :param density: Resolution (dpi)
+        :param output: Output raw image
+        """
+        await asyncio.to_thread(self.render_raw, filename, index, density, output)
+
+    def render_tiled(self, filename: str, index: int, density: float, output: str, size: Tuple[int, int],
+                     band_height: int) -> None:
+        """
+        Render a page of the pdf in horizontal bands, which are appended to the
+        output png as they are rendered. Thus, the memory is bounded by the band size.
+
+        :param filename: Pdf file
+        :param index: Page index (starting at 0)
+        :param density: Resolution (dpi)
+        :param output: Output png
+        :param size: Size of the page (px)
+        :param band_height: Height of each band (px)
+        """
+        raise NotImplementedError()
+
+
+class GhostscriptBackend(RenderBackend):
+    """
+    Render straight with Ghostscript, avoiding the ImageMagick pixel cache.
+    """
+    name = 'ghostscript'
+    tiled = True
+    warm = True
+
+    @property
+    def executable(self) -> Optional[str]:
+        names = ['gswin64c', 'gswin32c'] if os.name == 'nt' else ['gs']
+        for n in names:
+            path = shutil.which(n)
+            if path is not None:
+                return path
+        return None
+
+    def args(self, filename: str, index: int, density: float, output: str, max_bitmap: int = 0) -> List[str]:
+        """
+        :param max_bitmap: Maximum size of the page bitmap (bytes), 0 uses the memory limit
+        :return: Ghostscript arguments to render the page
+        """
+        return self.server_args(max_bitmap) + ['-dBATCH', f'-r{density}', f'-dFirstPage={index + 1}',
+                                               f'-dLastPage={index + 1}', f'-sOutputFile={output}', filename]
+
+    def server_args(self, max_bitmap: int = 0) -> List[str]:
+        """
+        :param max_bitmap: Maximum size of the page bitmap (bytes), 0 uses the memory limit
+        :return: Ghostscript arguments shared by all the renders
+        """
+        args = [self.executable or 'gs', '-q', '-dSAFER', '-dNOPAUSE', '-sDEVICE=pngalpha', '-dTextAlphaBits=4',
+                '-dGraphicsAlphaBits=4', f'-dNumRenderingThreads={self._threads}']
+        max_bitmap = max_bitmap if max_bitmap > 0 else self._memory_limit * 1024 * 1024
+        if max_bitmap > 0:
+            # Pages greater than the limit are rendered in bands instead of a full page bitmap
+            args.append(f'-dMaxBitmap={max_bitmap}')
+        return args
+
+    def _render_pooled(self, filename: str, index: int, density: float, output: str) -> None:
+        """
+        Render a page to a png file within a warm process of the pool. If the warm
+        process fails, the page is rendered again by a new process.
+        """
+        with self.stages.stage('render'):  # Includes the encode
+            try:
+                self.pool.render(filename, index, density, output, self.token, self.stages)
+            except PoolError:
+                call(self.args(filename, index, density, output), token=self.token, stages=self.stages,
+                     limits=self.process_limits)
+
+    def _render_warm(self, filename: str, index: int, density: float, output: str, angle: float = 0) -> None:
+        """
+        Render a page within a warm process of the pool, which writes the png file.
+        """
+        if angle % 360 == 0 and self._level == COMPRESSION_PROFILES['balanced']:
+            self._render_pooled(filename, index, density, output)
+            return
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(output)) as tmp:
+            image = os.path.join(tmp, 'page.png')
+            self._render_pooled(filename, index, density, image)
+            self._finish(image, angle, output)
+
+    def _finish(self, image: str, angle: float, output: str) -> None:
+        """
+        Rotate or compress again a rendered png file.
+
+        :param image: Rendered png, at the balanced level
+        :param angle: Rotation angle (deg, clockwise)
+        :param output: Output png
+        """
+        if angle % 360 == 0:
+            recompress_png(image, output, self._level, self._threads, self.stages)
+        elif PIL_MODULE:
+            with open(image, 'rb') as f:
+                rotate_png(f.read(), angle, output, self._level, self.stages)
+        else:
+            self._rotate(image, angle, output)
+
+    def _rotate(self, image: str, angle: float, output: str) -> None:
+        """
+        Rotate an image with ImageMagick, used if Pillow is not installed.
+        """
+        magick = ImageMagickBackend(self._memory_limit, compression=self._compression)
+        magick.stages, magick.token, magick.process_limits = self.stages, self.token, self.process_limits
+        magick.rotate(image, angle, output)
+
+    def render(self, filename: str, index: int, density: float, output: str, angle: float = 0) -> None:
+        if self.pool is not None:
+            self._render_warm(filename, index, density, output, angle)
+        elif angle % 360 == 0:
+            if self._level == COMPRESSION_PROFILES['balanced']:  # Same level of the Ghostscript png device
+                with self.stages.stage('render'):  # Includes the encode
+                    call(self.args(filename, index, density, output), token=self.token, stages=self.stages,
+                         limits=self.process_limits)
+            else:
+                # The rows are compressed again as they are piped, without holding the image
+                with self.stages.stage('render'), \
+                        pipe(self.args(filename, index, density, '-'), token=self.token, stages=self.stages,
+                             limits=self.process_limits) as stdout:
+                    recompress_png(stdout, output, self._level, self._threads, self.stages)
+        elif PIL_MODULE:
+            # The page is piped from Ghostscript, then it is rotated in memory
+            with self.stages.stage('render'):
+                data = call(self.args(filename, index, density, '-'), output=True, token=self.token,
+                            stages=self.stages, limits=self.process_limits)
+            rotate_png(data, angle, output, self._level, self.stages)
+        else:
+            with tempfile.TemporaryDirectory(dir=os.path.dirname(output)) as tmp:
+                image = os.path.join(tmp, 'page.png')
+                with self.stages.stage('render'):
+                    call(self.args(filename, index, density, image), token=self.token, stages=self.stages,
+                         limits=self.process_limits)
+                self._rotate(image, angle, output)
+
+    async def render_async(self, filename: str, index: int, density: float, output: str, angle: float = 0) -> None:
+        if angle % 360 == 0 and self._level == COMPRESSION_PROFILES['balanced']:
+            with self.stages.stage('render'):  # Includes the encode
+                await acall(self.args(filename, index, density, output), token=self.token, limits=self.process_limits)
+            return
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(output)) as tmp:
+            image = os.path.join(tmp, 'page.png')
+            with self.stages.stage('render'):
+                await acall(self.args(filename, index, density, image), token=self.token, limits=self.process_limits)
+            await asyncio.to_thread(self._finish, image, angle, output)
+
+    def render_raw(self, filename: str, index: int, density: float, output: str) -> None:
+        # The png device is the only one with alpha, thus, the piped png is decoded once
+        if self.pool is not None:
+            with tempfile.TemporaryDirectory(dir=os.path.dirname(output)) as tmp:
+                image = os.path.join(tmp, 'page.png')
+                self._render_pooled(filename, index, density, image)
+                with self.stages.stage('decode'):
+                    raw_from_png(image, output)
+            return
+        # The rows are decoded as they are piped, without holding the png
+        with self.stages.stage('render'), \
+                pipe(self.args(filename, index, density, '-'), token=self.token, stages=self.stages,
+                     limits=self.process_limits) as stdout:  # Includes the decode
+            raw_from_png(stdout, output)
+
+    async def render_raw_async(self, filename: str, index: int, density: float, output: str) -> None:
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(output)) as tmp:
+            image = os.path.join(tmp, 'page.png')
+            with self.stages.stage('render'):
+                await acall(self.args(filename, index, density, image), token=self.token, limits=self.process_limits)
+            with self.stages.stage('decode'):
+                await asyncio.to_thread(raw_from_png, image, output)
+
+    def render_tiled(self, filename: str, index: int, density: float, output: str, size: Tuple[int, int],
+                     band_height: int) -> None:
+        # The page is interpreted once into a display list, then the bitmap bound makes Ghostscript
+        # rasterize it in bands; the rows are piped to the writer without decoding them
+        with self.stages.stage('render'), \
+                pipe(self.args(filename, index, density, '-', band_height * size[0] * 4), token=self.token,
+                     stages=self.stages, limits=self.process_limits) as stdout:  # Includes the encode
+            width, height, rows = read_png_rows(stdout)
+            if (width, height) != tuple(size):
+                raise ValueError(f'Invalid page size {width}x{height}, expected {size[0]}x{size[1]}')
+            with PngWriter(output, width, height, self._level, self._threads, self.stages) as png:
+                for row in rows:
+                    png.write_filtered(row)
+
+
+class ImageMagickBackend(RenderBackend):
+    """
+    Render through ImageMagick, which delegates the pdf to Ghostscript.
+    """
+    name = 'imagemagick'
+
+    @property
+    def executable(self) -> Optional[str]:
+        return shutil.which('magick')
+
+    def limits(self) -> List[str]:
+        """
+        :return: ImageMagick arguments that bound the memory and disk of the conversion
+        """
+        limits = []
+        if self._memory_limit > 0:
+            # Once the memory and map limits are reached the pixel cache is stored on disk
+            limits += ['-limit', 'memory', f'{self._memory_limit}MiB', '-limit', 'map', f'{2 * self._memory_limit}MiB']
+        if self.process_limits.disk > 0:
+            limits += ['-limit', 'disk', f'{self.process_limits.disk}MiB']
+        return limits
+
+    def png_options(self) -> List[str]:
+        """
+        :return: ImageMagick arguments of the png compression
+        """
+        return ['-define', f'png:compression-level={self._level}']
+
+    def rotate(self, image: str, angle: float, output: str) -> None:
+        """
+        Rotate an image, used if the image cannot be rotated in memory.
+
+        :param image: Image
+        :param angle: Rotation angle (deg, clockwise)
+        :param output: Output png
+        """
+        with self.stages.stage('rotate'):  # Includes the encode
+            call([self.executable or 'magick', *self.limits(), image, '-background', 'none', '-rotate', str(angle),
+                  *self.png_options(), output], token=self.token, stages=self.stages, limits=self.process_limits)
+
+    def args(self, filename: str, index: int, density: float, output: str, angle: float = 0) -> List[str]:
+        """
+        :return: ImageMagick arguments to render the page
+        """
+        rotate = ['-background', 'none', '-rotate', str(angle)] if angle % 360 != 0 else []
+        return [self.executable or 'magick', *self.limits(), '-density', str(density), f'{filename}[{index}]',
+                *rotate, *self.png_options(), output]
+
+    def raw_args(self, filename: str, index: int, density: float, output: str) -> List[str]:
+        """
+        :return: ImageMagick arguments to render the page to a raw image (8-bit RGBA pam)
+        """
+        return [self.executable or 'magick', *self.limits(), '-density', str(density), f'{filename}[{index}]',
+                '-alpha', 'set', '-depth', '8', f'PAM:{output}']
+
+    def render(self, filename: str, index: int, density: float, output: str, angle: float = 0) -> None:
+        with self.stages.stage('render'):  # Includes the rotate and encode
+            call(self.args(filename, index, density, output, angle), token=self.token, stages=self.stages,
+                 limits=self.process_limits)
+
+    def render_raw(self, filename: str, index: int, density: float, output: str) -> None:
+        with self.stages.stage('render'):
+            call(self.raw_args(filename, index, density, output), token=self.token, stages=self.stages,
+                 limits=self.process_limits)
+
+    async def render_raw_async(self, filename: str, index: int, density: float, output: str) -> None:
+        with self.stages.stage('render'):
+            await acall(self.raw_args(filename, index, density, output), token=self.token,
+                        limits=self.process_limits)
+
+    async def render_async(self, filename: str, index: int, density: float, output: str, angle: float = 0) -> None:
+        with self.stages.stage('render'):  # Includes the rotate and encode
+            await acall(self.args(filename, index, density, output, angle), token=self.token,
+                        limits=self.process_limits)
+
+
+BACKENDS: Dict[str, Type[RenderBackend]] = {
+    GhostscriptBackend.name: GhostscriptBackend,
+    ImageMagickBackend.name: ImageMagickBackend
+}
+
+
+def get_backend(name: str, memory_limit: int = 0, threads: int = 1, compression: str = 'balanced') -> RenderBackend:
+    """
+    Return a render backend. If it is not available, the first available backend is returned.
+
+    :param name: Backend name
+    :param memory_limit: Memory limit of the render (MB), if 0 there is no limit
+    :param threads: Number of rendering and compression threads
+    :param compression: Png compression profile
+    :return: Backend
+    """
+    if name not in BACKENDS:
+        raise ValueError(f'Invalid backend "{name}", valid: {", ".join(BACKENDS.keys())}')
+    if compression not in COMPRESSION_PROFILES:
+        raise ValueError(f'Invalid compression "{compression}", valid: {", ".join(COMPRESSION_PROFILES.keys())}')
+    backend = BACKENDS[name](memory_limit, threads, compression)
+    if backend.available():
+        return backend
+    for b in BACKENDS.values():
+        fallback = b(memory_limit, threads, compression)
+        if fallback.available():
+            return fallback
+    return backend  # Fails when rendering
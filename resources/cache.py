@@ -0,0 +1,165 @@
+"""
+CACHE
+Content-addressed cache of the rendered pages.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['RenderCache', 'file_digest']
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from resources.utils import get_local_path, make_path_if_not_exists
+from typing import Any, Dict, Optional
+
+# Constants
+_CHUNK_SIZE = 1024 * 1024
+_USED_SUFFIX = '.used'  # Sidecar of each entry, its modification time is the last use
+
+
+def file_digest(filename: str) -> str:
+    """
+    Compute the hash of a file, reading it by chunks.
+
+    :param filename: File
+    :return: Hex digest
+    """
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class RenderCache(object):
+    """
+    Stores the rendered pages by the hash of the pdf and the conversion parameters.
+    The entries are copied, thus, they never share a file with the outputs. The least
+    recently used entries are removed if the cache exceeds its size.
+    """
+
+    def __init__(self, max_size: int, path: Optional[str] = None) -> None:
+        """
+        Constructor.
+
+        :param max_size: Maximum size (MB)
+        :param path: Cache folder, if None uses the app local path
+        """
+        self._max_size = max_size * 1024 * 1024
+        self._path = make_path_if_not_exists(path if path is not None else os.path.join(get_local_path(), 'cache'))
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(digest: str, index: int, conversion: Dict[str, Any], extension: str = '.png') -> str:
+        """
+        Return the key of a page, which is also the name of its entry.
+
+        :param digest: Pdf hash
+        :param index: Page index
+        :param conversion: Conversion settings, the page range is not considered
+        :param extension: Extension of the output format
+        :return: Key
+        """
+        params = json.dumps({k: v for k, v in conversion.items() if k != 'PAGES'}, sort_keys=True)
+        return hashlib.sha256(f'{digest}:{index}:{extension}:{params}'.encode('utf-8')).hexdigest() + extension
+
+    def _entry(self, key: str) -> str:
+        """
+        :param key: Key
+        :return: Entry file
+        """
+        return os.path.join(self._path, key)
+
+    @staticmethod
+    def _touch(entry: str) -> None:
+        """
+        Mark an entry as the most recently used.
+
+        :param entry: Entry file
+        """
+        with open(entry + _USED_SUFFIX, 'a'):
+            pass
+        os.utime(entry + _USED_SUFFIX)
+
+    def get(self, key: str, output: str) -> bool:
+        """
+        Restore an entry, the entry is copied to the output.
+
+        :param key: Key
+        :param output: Output file
+        :return: True if the entry was found
+        """
+        entry = self._entry(key)
+        try:
+            shutil.copyfile(entry, output)
+        except OSError:
+            if os.path.isfile(output):
+                os.remove(output)
+            self.misses += 1
+            return False
+        try:
+            self._touch(entry)
+        except OSError:  # Removed by other worker, the output is complete
+            pass
+        self.hits += 1
+        return True
+
+    def put(self, key: str, image: str) -> None:
+        """
+        Store an image.
+
+        :param key: Key
+        :param image: Image
+        """
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self._path)
+        os.close(fd)
+        os.remove(tmp)
+        try:
+            shutil.copyfile(image, tmp)
+            os.replace(tmp, self._entry(key))
+            self._touch(self._entry(key))
+        except OSError:
+            if os.path.isfile(tmp):
+                os.remove(tmp)
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used entries until the cache fits its size.
+        """
+        entries, size = [], 0
+        for e in os.scandir(self._path):
+            if e.name.endswith(_USED_SUFFIX):
+                if not os.path.isfile(e.path[:-len(_USED_SUFFIX)]):  # The entry was removed while it was used
+                    try:
+                        os.remove(e.path)
+                    except OSError:
+                        pass
+                continue
+            if e.name.endswith('.tmp'):
+                continue
+            try:
+                st = e.stat()
+            except OSError:  # Removed by other worker
+                continue
+            try:
+                used = os.stat(e.path + _USED_SUFFIX).st_mtime
+            except OSError:  # Being stored
+                used = st.st_mtime
+            entries.append((used, st.st_size, e.path))
+            size += st.st_size
+        entries.sort()
+        for _, sz, path in entries:
+            if size <= self._max_size:
+                break
+            for f in (path, path + _USED_SUFFIX):
+                try:
+                    os.remove(f)
+                except OSError:
+                    pass
+            size -= sz
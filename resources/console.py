@@ -0,0 +1,78 @@
+"""
+CONSOLE
+Bounded log of the app console, does not require a display. The messages are
+kept in a ring buffer, and the changes since the last redraw are collected, thus,
+the console widget only appends the new text and removes the oldest lines.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['ConsoleBuffer']
+
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+
+class ConsoleBuffer(object):
+    """
+    Ring buffer of the console lines. A message printed with an empty end is
+    continued by the next message, as print does.
+    """
+
+    def __init__(self, limit: int) -> None:
+        """
+        Constructor.
+
+        :param limit: Maximum number of lines, the oldest ones are removed first
+        """
+        self._dropped = 0  # Oldest lines removed since the last flush
+        self._open = False  # The last line continues with the next message
+        self._pending: List[str] = []  # Text added since the last flush
+        self._reset = False  # The whole buffer must be drawn again
+        self.lines: Deque[str] = deque(maxlen=max(1, limit))
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def write(self, msg: str, end: Optional[str] = None) -> None:
+        """
+        Add a message, a message equal to the last line is ignored.
+
+        :param msg: Message
+        :param end: Line end, if empty the line continues with the next message
+        """
+        if len(self.lines) > 0 and self.lines[-1] == msg:
+            return
+        if self._open:
+            self.lines[-1] += msg
+        else:
+            if len(self.lines) == self.lines.maxlen:
+                self._dropped += 1
+            self.lines.append(msg)
+        self._open = end == ''
+        if self._dropped >= self.lines.maxlen:  # The drawn lines were replaced, the pending text is not needed
+            self._reset = True
+        if not self._reset:
+            self._pending.append(msg if self._open else msg + '\n')
+
+    def clear(self) -> None:
+        """
+        Remove all lines.
+        """
+        self.lines.clear()
+        self._dropped, self._open, self._pending, self._reset = 0, False, [], False
+
+    def flush(self) -> Tuple[bool, str, int]:
+        """
+        Return the changes since the last flush. The widget first removes all its
+        text if reset, then appends the text, then removes the oldest lines.
+
+        :return: Reset, text to append, number of lines to remove from the top
+        """
+        if self._reset:
+            text = '\n'.join(self.lines) + ('' if self._open else '\n')
+            changes = True, text, 0
+        else:
+            changes = False, ''.join(self._pending), self._dropped
+        self._dropped, self._pending, self._reset = 0, [], False
+        return changes
@@ -0,0 +1,850 @@
+"""
+CONVERTER
+Conversion core, does not require a display. Used by the app and the batch mode.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['AsyncConverter', 'Converter', 'PageJob', 'expand_inputs', 'parse_page_range']
+
+import asyncio
+import glob
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from resources.backends import get_backend
+from resources.cache import RenderCache, file_digest
+from resources.formats import PngFormat, get_format
+from resources.metrics import MetricsWriter, Stages
+from resources.pdfinfo import PdfPage, read_pages
+from resources.png import COMPRESSION_PROFILES
+from resources.pool import get_pool
+from resources.postprocess import NUMPY_MODULE, content_bounds, downsample, rotate_pixels, white_to_alpha
+from resources.pyramid import pyramid_levels, resize_width, write_dzi
+from resources.rawimage import open_raw
+from resources.sizing import render_density, render_size
+from resources.utils import CancelToken, ConversionCancelled, LimitExceeded, ProcessLimits, get_local_path, \
+    print_console
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+# Constants
+_RE_PAGE_RANGE = re.compile(r'^\s*(\d+)\s*(?:(-)\s*(\d*)\s*)?$')
+_PREVIEW_WIDTH = 800
+_MIN_TILE_SIZE = 16
+_TILE_MEMORY = 256  # Memory of each band if the conversion has no memory limit (MB)
+_TILE_MIN_HEIGHT = 16
+
+
+def expand_inputs(inputs: List[str]) -> List[str]:
+    """
+    Expand a list of files, folders or glob patterns into the pdf files to convert.
+
+    :param inputs: Input list
+    :return: Sorted pdf list, without duplicates
+    """
+    files = []
+    for i in inputs:
+        if os.path.isdir(i):
+            found = glob.glob(os.path.join(i, '*.pdf')) + glob.glob(os.path.join(i, '*.PDF'))
+        elif os.path.isfile(i):
+            found = [i]
+        else:
+            found = glob.glob(i, recursive=True)
+        for f in found:
+            f = os.path.abspath(f)
+            if os.path.isfile(f) and f.lower().endswith('.pdf') and f not in files:
+                files.append(f)
+    files.sort()
+    return files
+
+
+def parse_page_range(pages: str, count: int) -> List[int]:
+    """
+    Parse a page range, for example "1-3,5,8-". Pages start at 1, an empty range
+    selects all pages. Pages greater than the number of pages are ignored.
+
+    :param pages: Page range
+    :param count: Number of pages of the pdf
+    :return: Selected page indices (starting at 0)
+    """
+    if pages.strip() == '':
+        return list(range(count))
+    selected = []
+    for r in pages.split(','):
+        m = _RE_PAGE_RANGE.match(r)
+        if m is None:
+            raise ValueError(f'Invalid page range "{pages}"')
+        first = int(m.group(1))
+        last = first if m.group(2) is None else (int(m.group(3)) if m.group(3) else max(first, count))
+        if first < 1 or last < first:
+            raise ValueError(f'Invalid page range "{pages}"')
+        for i in range(first - 1, min(last, count)):
+            if i not in selected:
+                selected.append(i)
+    return selected
+
+
+class PageJob(NamedTuple):
+    """
+    Conversion of a single page.
+    """
+    filename: str
+    index: int  # Starts at 0
+    count: int  # Number of pages of the pdf
+    page: PdfPage
+    digest: str = ''  # Hash of the pdf, used by the render cache
+    probe: float = 0  # Time reading the pdf, only stored by the first page (s)
+    extension: str = '.png'  # Extension of the output format
+
+    @property
+    def stem(self) -> str:
+        """
+        :return: Name of the converted files without extension, pages are numbered if the pdf has more than one
+        """
+        name = os.path.splitext(self.filename)[0]
+        if self.count == 1:
+            return name
+        return f'{name}-{self.index + 1:0{len(str(self.count))}d}'
+
+    @property
+    def final_image(self) -> str:
+        """
+        :return: Converted image
+        """
+        return self.stem + self.extension
+
+    def derivative(self, factor: int) -> str:
+        """
+        :param factor: Reduction factor
+        :return: Converted image reduced by the factor
+        """
+        return f'{self.stem}-1_{factor}{self.extension}'
+
+    def sized(self, width: int) -> str:
+        """
+        :param width: Width (px)
+        :return: Converted image resized to the width
+        """
+        return f'{self.stem}-{width}px{self.extension}'
+
+    @property
+    def manifest(self) -> str:
+        """
+        :return: Manifest of the image sizes and tiles of the page
+        """
+        return self.stem + '.json'
+
+    @property
+    def tiles(self) -> str:
+        """
+        :return: Deep Zoom descriptor of the page, the tiles are stored within <name>_files
+        """
+        return self.stem + '.dzi'
+
+
+def _convert_job(lang: Dict[str, str], conversion: Dict[str, Union[int, float, str]], options: Dict[str, Any],
+                 job: PageJob) -> Tuple[str, int, Dict[str, Any]]:
+    """
+    Convert a page within a worker process.
+
+    :param lang: Language dict
+    :param conversion: Conversion settings
+    :param options: Converter options of the worker
+    :param job: Page job
+    :return: Converted image (empty if failed), number of cache hits, metrics record
+    """
+    converter = Converter(lang, conversion, **options)
+    try:
+        image = converter.convert_page(job)
+    except Exception:  # The error is stored by the record
+        image = ''
+    return image, converter.cache.hits if converter.cache is not None else 0, converter.record
+
+
+class Converter(object):
+    """
+    Converts pdf files to png.
+    """
+
+    def __init__(
+            self,
+            lang: Dict[str, str],
+            conversion: Dict[str, Union[int, float, str]],
+            printer: Optional[Callable[..., None]] = None,
+            workers: int = 1,
+            memory_limit: int = 0,
+            threads: int = 0,
+            cache_size: int = 0,
+            overwrite: bool = False,
+            token: Optional[CancelToken] = None,
+            metrics: Optional[MetricsWriter] = None,
+            pool_jobs: int = 0,
+            pool_memory: int = 0,
+            limits: Optional[ProcessLimits] = None
+    ) -> None:
+        """
+        Constructor.
+
+        :param lang: Language dict
+        :param conversion: Conversion settings (MAXWIDTH, ANGLE, PAGES, BACKEND, TILED, COMPRESSION, CROP, WHITE,
+            DERIVATIVES)
+        :param printer: Print function, uses the same signature as App._print
+        :param workers: Number of parallel conversions, if 0 uses all cpu cores
+        :param memory_limit: Memory limit of each conversion (MB), if 0 there is no limit
+        :param threads: Rendering threads of each conversion, if 0 uses all cpu cores
+        :param cache_size: Size of the render cache (MB), if 0 the cache is disabled
+        :param overwrite: Replace the existing images instead of failing
+        :param token: Cancel token, checked between pages and passed to the backend
+        :param metrics: Stores a record of each converted page
+        :param pool_jobs: Pages rendered by each warm process before it is replaced, if 0 the pool is disabled
+        :param pool_memory: Memory of a warm process (MB) that replaces it, if 0 there is no limit
+        :param limits: Timeout, memory and cpu limits of each render program, a page that exceeds them fails
+        """
+        self._lang = lang
+        self._conversion = dict(conversion)
+        self._memory_limit = memory_limit
+        self._print = printer if printer is not None else print_console
+        self._threads = threads if threads > 0 else (os.cpu_count() or 1)
+        self._workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self._crop = bool(self._conversion.get('CROP', False))
+        self._white = int(self._conversion.get('WHITE', 0))
+        self._derivatives = sorted({int(f) for f in self._conversion.get('DERIVATIVES', [])})
+        self._sizes = sorted({int(w) for w in self._conversion.get('SIZES', [])}, reverse=True)
+        self._tile_size = int(self._conversion.get('TILE_SIZE', 0))
+        if self._white < 0 or self._white > 255 or any(f < 2 for f in self._derivatives) or \
+                any(w < 1 for w in self._sizes) or not (self._tile_size == 0 or self._tile_size >= _MIN_TILE_SIZE):
+            raise ValueError(self._lang['CONVERSION_POSTPROCESS_INVALID'])
+        self._postprocess = self._crop or self._white > 0
+        self._pyramid = len(self._sizes) > 0 or self._tile_size > 0
+        compression = str(self._conversion.get('COMPRESSION', 'balanced'))
+        self._level = COMPRESSION_PROFILES.get(compression, COMPRESSION_PROFILES['balanced'])
+        self._backend = get_backend(str(self._conversion.get('BACKEND', 'ghostscript')), memory_limit, self._threads,
+                                    compression)
+        self._format = get_format(str(self._conversion.get('FORMAT', PngFormat.name)), compression, self._threads)
+        if not self._format.available():
+            raise ValueError(self._lang['CONVERSION_FORMAT_UNAVAILABLE'].format(self._format.name,
+                                                                                self._format.requires))
+        # The page is rendered to a raw image, then encoded by the output format
+        self._raw = self._postprocess or self._format.name != PngFormat.name
+        if self._backend.name != self._conversion.get('BACKEND', self._backend.name):
+            self._print(self._lang['CONVERSION_BACKEND_FALLBACK'].format(
+                self._conversion['BACKEND'], self._backend.name), hour=True)
+        self._conversion['BACKEND'] = self._backend.name
+        if self._conversion.get('TILED', False):
+            if not self._backend.tiled:
+                raise ValueError(self._lang['CONVERSION_TILED_BACKEND'].format(self._backend.name))
+            if self._conversion['ANGLE'] % 360 != 0:
+                raise ValueError(self._lang['CONVERSION_TILED_ANGLE'])
+            if self._postprocess or len(self._derivatives) > 0 or self._pyramid:
+                raise ValueError(self._lang['CONVERSION_TILED_POSTPROCESS'])
+            if self._format.name != PngFormat.name:
+                raise ValueError(self._lang['CONVERSION_TILED_FORMAT'])
+        if (self._raw or len(self._derivatives) > 0 or self._pyramid) and not NUMPY_MODULE:
+            raise ValueError(self._lang['CONVERSION_POSTPROCESS_NUMPY'])
+        self._backend.token = token
+        self._limits = limits if limits is not None else ProcessLimits()
+        self._backend.process_limits = self._limits
+        if pool_jobs > 0 and self._backend.warm:
+            self._backend.pool = get_pool(self._backend.server_args(), pool_jobs, pool_memory, self._limits)
+        self._cache_size = cache_size
+        self._metrics = metrics if metrics is not None and metrics.enabled else None
+        self._overwrite = overwrite
+        self._pool_jobs = pool_jobs
+        self._pool_memory = pool_memory
+        self._token = token
+        self.record: Dict[str, Any] = {}  # Metrics of the last converted page
+        self.cache = RenderCache(cache_size) if cache_size > 0 else None
+
+    def _print_cache_stats(self) -> None:
+        """
+        Print the cache hits and misses.
+        """
+        if self.cache is not None:
+            self._print(self._lang['CACHE_STATS'].format(self.cache.hits, self.cache.misses), hour=True)
+
+    def band_height(self, width: int) -> int:
+        """
+        Return the height of the bands of the tiled render, the band bitmap (RGBA)
+        uses half of the memory limit.
+
+        :param width: Width of the page (px)
+        :return: Band height (px)
+        """
+        memory = self._memory_limit // 2 if self._memory_limit > 0 else _TILE_MEMORY
+        return max(_TILE_MIN_HEIGHT, memory * 1024 * 1024 // (4 * width))
+
+    def page_jobs(self, filename: str) -> List[PageJob]:
+        """
+        Return the jobs of the selected pages of a pdf.
+
+        :param filename: Pdf file
+        :return: Page jobs
+        """
+        t0 = time.perf_counter()
+        filename = os.path.abspath(filename)
+        pages = read_pages(filename)
+        selected = parse_page_range(str(self._conversion.get('PAGES', '')), len(pages))
+        if len(selected) == 0:
+            raise ValueError(self._lang['CONVERSION_NO_PAGES'].format(self._conversion['PAGES'], len(pages)))
+        digest = file_digest(filename) if self.cache is not None else ''
+        probe = time.perf_counter() - t0
+        return [PageJob(filename, i, len(pages), pages[i], digest, probe if k == 0 else 0, self._format.extension)
+                for k, i in enumerate(selected)]
+
+    def preview(self, filename: str, width: int = _PREVIEW_WIDTH, cache_size: int = 0) -> bytes:
+        """
+        Render the first selected page of a pdf at a small width, to check its orientation
+        and the angle before the conversion. The previews are cached by the pdf hash,
+        the page, the width and the angle.
+
+        :param filename: Pdf file
+        :param width: Maximum width/height of the preview (px)
+        :param cache_size: Size of the preview cache (MB), if 0 the cache is disabled
+        :return: Png data
+        """
+        t0 = time.time()
+        filename = os.path.abspath(filename)
+        pages = read_pages(filename)
+        selected = parse_page_range(str(self._conversion.get('PAGES', '')), len(pages))
+        if len(selected) == 0:
+            raise ValueError(self._lang['CONVERSION_NO_PAGES'].format(self._conversion['PAGES'], len(pages)))
+        index, angle = selected[0], self._conversion['ANGLE']
+        cache, key = None, ''
+        if cache_size > 0:
+            cache = RenderCache(cache_size, os.path.join(get_local_path(), 'preview'))
+            key = cache.key(file_digest(filename), index, {'ANGLE': angle, 'BACKEND': self._backend.name,
+                                                           'MAXWIDTH': width})
+        jobdir = tempfile.mkdtemp(prefix='__preview__', dir=get_local_path())
+        image = os.path.join(jobdir, '__preview__.png')
+        try:
+            if cache is None or not cache.get(key, image):
+                self._backend.render(filename, index, render_density(pages[index], width, angle), image, angle)
+                if cache is not None:
+                    cache.put(key, image)
+            with open(image, 'rb') as f:
+                data = f.read()
+        finally:
+            shutil.rmtree(jobdir, ignore_errors=True)
+        self._print(self._lang['PREVIEW_FINISHED'].format(os.path.basename(filename), index + 1,
+                                                          round(time.time() - t0, 1)), hour=True)
+        return data
+
+    def convert(self, filename: str) -> List[str]:
+        """
+        Convert the selected pages of a pdf file. The images are stored within the same folder of the pdf.
+
+        :param filename: Pdf file
+        :return: Converted images
+        """
+        images = []
+        for job in self.page_jobs(filename):
+            if self._token is not None:
+                self._token.check()
+            images.append(self.convert_page(job))
+        self._print_cache_stats()
+        return images
+
+    def _new_record(self, job: PageJob) -> Dict[str, Any]:
+        """
+        :param job: Page job
+        :return: Metrics record of the page
+        """
+        return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'file': job.filename, 'page': job.index + 1,
+                'pages': job.count, 'backend': self._backend.name, 'format': self._format.name, 'cache_hit': False,
+                'density': 0, 'crop': [], 'encode': None,
+                'status': 'ok', 'error': '', 'width': 0, 'height': 0, 'bytes': 0,
+                'conversion': {k: v for k, v in self._conversion.items() if k != 'BACKEND'}}
+
+    def _close_record(self, job: PageJob, record: Dict[str, Any], stages: Stages, t0: float) -> None:
+        """
+        Store the times of a page within its record, then write it.
+
+        :param job: Page job
+        :param record: Metrics record of the page
+        :param stages: Stages of the conversion
+        :param t0: Start of the conversion (perf counter)
+        """
+        if job.probe > 0:
+            stages.times['probe'] = job.probe
+        record['stages'] = {k: round(v, 6) for k, v in stages.times.items()}
+        record['total'] = round(time.perf_counter() - t0 + job.probe, 6)
+        record['peak_rss'] = stages.peak_rss
+        self.record = record
+        if self._metrics is not None:
+            self._metrics.write(record)
+
+    def convert_page(self, job: PageJob) -> str:
+        """
+        Convert a page.
+
+        :param job: Page job
+        :return: Converted image
+        """
+        # Each job uses its own temporary folder, thus, parallel jobs do not overwrite their files
+        jobdir = tempfile.mkdtemp(prefix='__convert__', dir=get_local_path())
+        stages = Stages()
+        self._backend.stages = stages
+        record = self._new_record(job)
+        t0 = time.perf_counter()
+        try:
+            image = self._convert_page(job, jobdir, stages, record)
+            record['width'], record['height'] = self._format.size(image)
+            record['bytes'] = os.path.getsize(image)
+            return image
+        except ConversionCancelled:
+            record['status'] = 'cancelled'
+            raise
+        except LimitExceeded as e:
+            record['status'], record['error'] = e.status, str(e)
+            raise
+        except Exception as e:
+            record['status'], record['error'] = 'failed', str(e)
+            raise
+        finally:
+            shutil.rmtree(jobdir, ignore_errors=True)
+            self._close_record(job, record, stages, t0)
+
+    def _restore(self, job: PageJob, stages: Stages, record: Dict[str, Any]) -> str:
+        """
+        Remove the previous image of the page, then restore the page if it was
+        rendered before with the same parameters (the record stores the cache hit).
+
+        :param job: Page job
+        :param stages: Stages of the conversion
+        :param record: Metrics record of the page
+        :return: Cache key of the page, empty if the cache is disabled
+        """
+        final_image = job.final_image
+        outputs = [final_image] + [job.derivative(f) for f in self._derivatives] + [job.sized(w) for w in self._sizes]
+        if self._pyramid:
+            outputs.append(job.manifest)
+        if self._tile_size > 0:
+            outputs += [job.tiles, os.path.splitext(job.tiles)[0] + '_files']
+        for image in outputs:
+            if os.path.exists(image):
+                if not self._overwrite:
+                    raise ValueError(self._lang['CONVERSION_ALREADY_EXISTS'].format(os.path.basename(image)))
+                if os.path.isdir(image):
+                    shutil.rmtree(image)
+                else:
+                    os.remove(image)
+        key = ''
+        if self.cache is not None and job.digest != '':
+            key = self.cache.key(job.digest, job.index, self._conversion, self._format.extension)
+            with stages.stage('cache'):
+                record['cache_hit'] = self.cache.get(key, final_image)
+            if record['cache_hit']:
+                self._print(self._lang['CACHE_HIT'].format(os.path.basename(final_image)), hour=True)
+        return key
+
+    def _density(self, job: PageJob, record: Dict[str, Any]) -> float:
+        """
+        Return the density of the page, computed from the exact page size and
+        rotation; thus, the image has the maximum width.
+
+        :param job: Page job
+        :param record: Metrics record of the page
+        :return: Density (dpi)
+        """
+        angle = self._conversion['ANGLE']
+        density = render_density(job.page, int(self._conversion['MAXWIDTH']), angle)
+        record['density'] = round(density, 4)
+        if job.count == 1:
+            self._print(self._lang['CONVERSION_CONV'].format(os.path.basename(job.filename), round(density, 2),
+                                                             self._conversion['MAXWIDTH']), hour=True)
+        else:
+            self._print(self._lang['CONVERSION_CONV_PAGE'].format(os.path.basename(job.filename), job.index + 1,
+                                                                  job.count, round(density, 2),
+                                                                  self._conversion['MAXWIDTH']),
+                        hour=True)
+        if angle != 0:
+            self._print(self._lang['CONVERSION_ANGLE'].format(angle), hour=True)
+        return density
+
+    def _bands(self, job: PageJob, density: float) -> Tuple[Tuple[int, int], int]:
+        """
+        Return the size of the tiled render, same as the full page device of the backend.
+
+        :param job: Page job
+        :param density: Density (dpi)
+        :return: Size of the page (px), band height (px)
+        """
+        size = render_size(job.page, density)
+        band = self.band_height(size[0])
+        self._print(self._lang['CONVERSION_TILED'].format(size[0], size[1], math.ceil(size[1] / band), band),
+                    hour=True)
+        return size, band
+
+    def _store(self, job: PageJob, image: str, key: str, stages: Stages, t0: float) -> str:
+        """
+        Move the rendered image to its final name, then store it within the cache.
+
+        :param job: Page job
+        :param image: Rendered image
+        :param key: Cache key of the page
+        :param stages: Stages of the conversion
+        :param t0: Start of the conversion (time)
+        :return: Converted image
+        """
+        final_image = job.final_image
+        with stages.stage('move'):
+            shutil.move(image, final_image)
+        if key != '':
+            with stages.stage('cache'):
+                self.cache.put(key, final_image)
+        self._print(self._lang['CONVERSION_FINISHED'].format(round(time.time() - t0, 1)), hour=True)
+        return final_image
+
+    def _process(self, job: PageJob, raw: str, image: str, stages: Stages, record: Dict[str, Any]) -> None:
+        """
+        Post-process the rendered raw image: rotate it, turn the white background into
+        alpha, crop it to the content bounds, and write its derivatives. The pixels are
+        modified in place within the memory map, and the image is encoded only once.
+
+        :param job: Page job
+        :param raw: Rendered raw image
+        :param image: Output image
+        :param stages: Stages of the conversion
+        :param record: Metrics record of the page
+        """
+        with stages.stage('rotate'):  # Multiples of 90 deg are a view of the pixels
+            pixels = rotate_pixels(open_raw(raw), self._conversion['ANGLE'])
+        with stages.stage('postprocess'):
+            if self._white > 0:
+                white_to_alpha(pixels, self._white)
+            if self._crop:
+                bounds = content_bounds(pixels)
+                if bounds is not None:  # Blank pages are not cropped
+                    pixels = pixels[bounds[1]:bounds[3], bounds[0]:bounds[2]]
+                    record['crop'] = list(bounds)
+            encode = stages.times.get('encode', 0)
+            self._format.encode(pixels, image, stages)
+            self._encoded(image, stages, encode, record)
+            self._derive(job, image, stages, pixels)
+
+    def _encoded(self, image: str, stages: Stages, since: float, record: Dict[str, Any]) -> None:
+        """
+        Store the encode time of the converted image within its record. If the render
+        program wrote the png itself, the encode is part of the render and it is not known.
+
+        :param image: Converted image
+        :param stages: Stages of the conversion
+        :param since: Encode stage time before the image was encoded (s)
+        :param record: Metrics record of the page
+        """
+        encode = stages.times.get('encode', 0) - since
+        if encode <= 0:
+            record['encode'] = None
+            return
+        record['encode'] = round(encode, 6)
+        self._print(self._lang['CONVERSION_ENCODED'].format(
+            self._format.name, round(record['encode'], 2), round(os.path.getsize(image) / 1024)), hour=True)
+
+    def _derive(self, job: PageJob, image: str, stages: Stages, pixels: Optional[Any] = None) -> None:
+        """
+        Write the derivatives of the converted image, reduced by each factor, and its
+        pyramid.
+
+        :param job: Page job
+        :param image: Converted image
+        :param stages: Stages of the conversion
+        :param pixels: Pixels of the image, decoded if not given
+        """
+        if len(self._derivatives) == 0 and not self._pyramid:
+            return
+        with stages.stage('postprocess'):
+            if pixels is None:
+                pixels = self._format.decode(image)
+            for f in self._derivatives:
+                self._format.encode(downsample(pixels, f), job.derivative(f), stages)
+        if self._pyramid:
+            self._write_pyramid(job, stages, pixels)
+
+    def _write_pyramid(self, job: PageJob, stages: Stages, pixels: Any) -> None:
+        """
+        Write the smaller sizes and the tiles of the converted image, derived from its
+        levels, and the manifest of the page.
+
+        :param job: Page job
+        :param stages: Stages of the conversion
+        :param pixels: Pixels of the image
+        """
+        with stages.stage('pyramid'):
+            height, width = pixels.shape[:2]
+            levels = pyramid_levels(pixels)
+            manifest = {'width': width, 'height': height,
+                        'images': [{'file': os.path.basename(job.final_image), 'width': width, 'height': height}]}
+            for w in self._sizes:
+                if w >= width:  # The image is not enlarged
+                    continue
+                resized = resize_width(levels, w)
+                self._format.encode(resized, job.sized(w), stages)
+                manifest['images'].append({'file': os.path.basename(job.sized(w)), 'width': resized.shape[1],
+                                           'height': resized.shape[0]})
+            if self._tile_size > 0:
+                manifest['tiles'] = write_dzi(levels, job.tiles, self._tile_size, self._level, self._threads)
+            with open(job.manifest, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+
+    def _convert_page(self, job: PageJob, jobdir: str, stages: Stages, record: Dict[str, Any]) -> str:
+        """
+        Convert a page.
+
+        :param job: Page job
+        :param jobdir: Temporary folder of the job
+        :param stages: Stages of the conversion
+        :param record: Metrics record of the page
+        :return: Converted image
+        """
+        t0 = time.time()
+        current_image = os.path.join(jobdir, '__convert__' + job.extension)
+        key = self._restore(job, stages, record)
+        if record['cache_hit']:
+            self._derive(job, job.final_image, stages)
+            return job.final_image
+
+        # Convert from pdf to png, the page is selected by its index. The angle is applied by the backend, or by
+        # the post-process
+        density = self._density(job, record)
+        encode = stages.times.get('encode', 0)
+        if self._conversion.get('TILED', False):
+            size, band = self._bands(job, density)
+            self._backend.render_tiled(job.filename, job.index, density, current_image, size, band)
+            self._encoded(current_image, stages, encode, record)
+        elif self._raw:
+            # The stages exchange a raw image instead of a png, which is encoded at the end
+            raw = os.path.join(jobdir, '__convert__.pam')
+            self._backend.render_raw(job.filename, job.index, density, raw)
+            self._process(job, raw, current_image, stages, record)
+        else:
+            self._backend.render(job.filename, job.index, density, current_image, self._conversion['ANGLE'])
+            self._encoded(current_image, stages, encode, record)
+            self._derive(job, current_image, stages)
+        return self._store(job, current_image, key, stages, t0)
+
+    def convert_many(self, files: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Convert several pdf files, a failed file does not stop the others. If
+        there is more than one worker, each page is converted in parallel.
+
+        :param files: Pdf files
+        :return: Converted images, failed pdf files
+        """
+        t0 = time.time()
+        converted, failed = [], []
+        jobs: List[PageJob] = []
+        for f in files:
+            try:
+                jobs += self.page_jobs(f)
+            except Exception as e:
+                self._print(self._lang['BATCH_FILE_FAILED'].format(f, e), hour=True)
+                failed.append(f)
+        workers = min(self._workers, len(jobs))
+        if workers <= 1:
+            position = {os.path.abspath(f): i + 1 for i, f in enumerate(files)}
+            for i, job in enumerate(jobs):
+                if i == 0 or jobs[i - 1].filename != job.filename:
+                    self._print(self._lang['BATCH_FILE'].format(position[job.filename], len(files), job.filename),
+                                hour=True)
+                if self._token is not None:
+                    self._token.check()
+                try:
+                    converted.append(self.convert_page(job))
+                except ConversionCancelled:
+                    raise
+                except Exception as e:
+                    self._print(self._lang['BATCH_PAGE_FAILED'].format(job.filename, job.index + 1, e), hour=True)
+                    if job.filename not in failed:
+                        failed.append(job.filename)
+        else:
+            self._print(self._lang['BATCH_PARALLEL'].format(len(files), len(jobs), workers), hour=True)
+            # The cpu cores are shared by the workers
+            options = {'memory_limit': self._memory_limit, 'threads': max(1, self._threads // workers),
+                       'cache_size': self._cache_size, 'overwrite': self._overwrite, 'pool_jobs': self._pool_jobs,
+                       'pool_memory': self._pool_memory, 'limits': self._limits}
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(_convert_job, self._lang, self._conversion, options, job): job
+                           for job in jobs}
+                for j in as_completed(futures):
+                    job = futures[j]
+                    try:
+                        image, hits, record = j.result()
+                        if self._metrics is not None:
+                            self._metrics.write(record)
+                        if self.cache is not None:
+                            self.cache.hits += hits
+                            self.cache.misses += 1 - hits
+                        if image == '':
+                            raise ValueError(record['error'])
+                        converted.append(image)
+                    except Exception as e:
+                        self._print(self._lang['BATCH_PAGE_FAILED'].format(job.filename, job.index + 1, e), hour=True)
+                        if job.filename not in failed:
+                            failed.append(job.filename)
+        self._print(self._lang['BATCH_FINISHED'].format(
+            len(converted), len(failed), round(time.time() - t0, 1)), hour=True)
+        self._print_cache_stats()
+        return converted, failed
+
+
+class AsyncConverter(Converter):
+    """
+    Converts pdf files to png from asyncio. The render programs are asyncio
+    subprocesses, thus, many pages are converted by one process without a thread
+    per page. The pages converted at the same time are limited by a semaphore, and
+    a page that exceeds the timeout is stopped, killing its programs. Cancelling
+    the task of a page (or of the whole conversion) also kills its programs.
+    """
+
+    def __init__(
+            self,
+            lang: Dict[str, str],
+            conversion: Dict[str, Union[int, float, str]],
+            concurrency: int = 0,
+            timeout: float = 0,
+            **kwargs
+    ) -> None:
+        """
+        Constructor.
+
+        :param lang: Language dict
+        :param conversion: Conversion settings (MAXWIDTH, ANGLE, PAGES, BACKEND, TILED, COMPRESSION)
+        :param concurrency: Number of pages converted at the same time, if 0 uses all cpu cores
+        :param timeout: Timeout of each page (s), if 0 there is no timeout
+        :param kwargs: Converter options, the warm pool is not used
+        """
+        kwargs['pool_jobs'] = 0
+        super().__init__(lang, conversion, **kwargs)
+        self._concurrency = concurrency if concurrency > 0 else (os.cpu_count() or 1)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._timeout = timeout
+
+    async def convert(self, filename: str) -> List[str]:
+        """
+        Convert the selected pages of a pdf file at the same time. The images are
+        stored within the same folder of the pdf.
+
+        :param filename: Pdf file
+        :return: Converted images
+        """
+        jobs = await asyncio.to_thread(self.page_jobs, filename)
+        images = await asyncio.gather(*(self.convert_page(job) for job in jobs))
+        self._print_cache_stats()
+        return list(images)
+
+    async def convert_page(self, job: PageJob) -> str:
+        """
+        Convert a page, waits for the semaphore.
+
+        :param job: Page job
+        :return: Converted image
+        """
+        if self._semaphore is None:  # Created within the running loop
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        async with self._semaphore:
+            if self._token is not None:
+                self._token.check()
+            # Concurrent pages use their own backend, which stores the stages and the programs of the page
+            backend = get_backend(self._backend.name, self._memory_limit, self._threads, self._backend.compression)
+            backend.stages = Stages()
+            backend.token = CancelToken()
+            backend.process_limits = self._limits
+            jobdir = tempfile.mkdtemp(prefix='__convert__', dir=get_local_path())
+            record = self._new_record(job)
+            t0 = time.perf_counter()
+            try:
+                task = self._convert_page_async(job, backend, jobdir, record)
+                image = await asyncio.wait_for(task, self._timeout if self._timeout > 0 else None)
+                record['width'], record['height'] = self._format.size(image)
+                record['bytes'] = os.path.getsize(image)
+                return image
+            except asyncio.TimeoutError:
+                record['status'] = 'timeout'
+                record['error'] = self._lang['CONVERSION_TIMEOUT'].format(self._timeout)
+                raise LimitExceeded('timeout', record['error'])
+            except (ConversionCancelled, asyncio.CancelledError):
+                record['status'] = 'cancelled'
+                raise
+            except LimitExceeded as e:
+                record['status'], record['error'] = e.status, str(e)
+                raise
+            except Exception as e:
+                record['status'], record['error'] = 'failed', str(e)
+                raise
+            finally:
+                # The programs of the threads (tiled render) are not stopped by the task cancel
+                backend.token.cancel()
+                shutil.rmtree(jobdir, ignore_errors=True)
+                self._close_record(job, record, backend.stages, t0)
+
+    async def _convert_page_async(self, job: PageJob, backend: Any, jobdir: str, record: Dict[str, Any]) -> str:
+        """
+        Convert a page.
+
+        :param job: Page job
+        :param backend: Render backend of the page
+        :param jobdir: Temporary folder of the job
+        :param record: Metrics record of the page
+        :return: Converted image
+        """
+        t0 = time.time()
+        current_image = os.path.join(jobdir, '__convert__' + job.extension)
+        key = self._restore(job, backend.stages, record)
+        if record['cache_hit']:
+            await asyncio.to_thread(self._derive, job, job.final_image, backend.stages)
+            return job.final_image
+        density = self._density(job, record)
+        encode = backend.stages.times.get('encode', 0)
+        if self._conversion.get('TILED', False):
+            size, band = self._bands(job, density)
+            await asyncio.to_thread(backend.render_tiled, job.filename, job.index, density, current_image, size,
+                                    band)
+            self._encoded(current_image, backend.stages, encode, record)
+        elif self._raw:
+            raw = os.path.join(jobdir, '__convert__.pam')
+            await backend.render_raw_async(job.filename, job.index, density, raw)
+            await asyncio.to_thread(self._process, job, raw, current_image, backend.stages, record)
+        else:
+            await backend.render_async(job.filename, job.index, density, current_image, self._conversion['ANGLE'])
+            self._encoded(current_image, backend.stages, encode, record)
+            await asyncio.to_thread(self._derive, job, current_image, backend.stages)
+        return self._store(job, current_image, key, backend.stages, t0)
+
+    async def convert_many(self, files: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Convert several pdf files, a failed page does not stop the others. All
+        pages are queued at once, the semaphore limits the running ones.
+
+        :param files: Pdf files
+        :return: Converted images, failed pdf files
+        """
+        t0 = time.time()
+        converted, failed = [], []
+        jobs: List[PageJob] = []
+        for f in files:
+            try:
+                jobs += await asyncio.to_thread(self.page_jobs, f)
+            except Exception as e:
+                self._print(self._lang['BATCH_FILE_FAILED'].format(f, e), hour=True)
+                failed.append(f)
+        self._print(self._lang['BATCH_PARALLEL'].format(len(files), len(jobs), min(self._concurrency, len(jobs))),
+                    hour=True)
+        results = await asyncio.gather(*(self.convert_page(job) for job in jobs), return_exceptions=True)
+        for job, r in zip(jobs, results):
+            if isinstance(r, ConversionCancelled):
+                raise r
+            if isinstance(r, BaseException):
+                self._print(self._lang['BATCH_PAGE_FAILED'].format(job.filename, job.index + 1, r), hour=True)
+                if job.filename not in failed:
+                    failed.append(job.filename)
+            else:
+                converted.append(r)
+        self._print(self._lang['BATCH_FINISHED'].format(
+            len(converted), len(failed), round(time.time() - t0, 1)), hour=True)
+        self._print_cache_stats()
+        return converted, failed
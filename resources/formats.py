@@ -0,0 +1,211 @@
+"""
+FORMATS
+Output formats of the converted images. Each format encodes the RGBA pixels with the
+settings of the compression profile (fast, balanced, small), and decodes them back.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['FORMATS', 'OutputFormat', 'PngFormat', 'RawFormat', 'WebpFormat', 'get_format']
+
+from resources.metrics import Stages
+from resources.png import COMPRESSION_PROFILES, png_size
+from resources.postprocess import NUMPY_MODULE, read_pixels, write_png
+from resources.rawimage import pam_header, read_pam_header
+from typing import BinaryIO, Dict, Optional, Tuple, Type
+
+# noinspection PyBroadException
+try:
+    import numpy as np
+    from PIL import Image, features
+
+    WEBP_MODULE = features.check('webp')
+except:
+    WEBP_MODULE = False
+
+# noinspection PyBroadException
+try:
+    import zstandard
+
+    ZSTD_MODULE = True
+except:
+    ZSTD_MODULE = False
+
+# Constants
+_BLOCK_ROWS = 512
+_MAX_HEADER = 1024
+_WEBP_MAX_SIZE = 16383  # px
+_WEBP_PROFILES = {'fast': (0, 0), 'balanced': (3, 50), 'small': (6, 100)}  # Method and effort, as cwebp -z 0, 4, 9
+_ZSTD_PROFILES = {'fast': 1, 'balanced': 3, 'small': 12}
+
+
+class OutputFormat(object):
+    """
+    Base output format.
+    """
+    extension: str = ''
+    mime: str = ''
+    name: str = ''
+    requires: str = ''  # Modules required by the format
+
+    def __init__(self, compression: str = 'balanced', threads: int = 1) -> None:
+        """
+        Constructor.
+
+        :param compression: Compression profile
+        :param threads: Number of compression threads
+        """
+        self._compression = compression
+        self._threads = max(1, threads)
+
+    def available(self) -> bool:
+        """
+        :return: True if the format can be used
+        """
+        return True
+
+    def encode(self, pixels: 'np.ndarray', output: str, stages: Optional[Stages] = None) -> None:
+        """
+        Encode an image.
+
+        :param pixels: RGBA pixels
+        :param output: Output image
+        :param stages: Stages of the conversion, times the encode
+        """
+        raise NotImplementedError()
+
+    def decode(self, filename: str) -> 'np.ndarray':
+        """
+        Decode an image.
+
+        :param filename: Image file
+        :return: RGBA pixels (height, width, 4)
+        """
+        return read_pixels(filename)
+
+    def size(self, filename: str) -> Tuple[int, int]:
+        """
+        :param filename: Image file
+        :return: Width, height (px), read from the header
+        """
+        with Image.open(filename) as im:
+            return im.size
+
+
+class PngFormat(OutputFormat):
+    """
+    Lossless png, encoded by blocks of rows.
+    """
+    extension = '.png'
+    mime = 'image/png'
+    name = 'png'
+
+    def encode(self, pixels: 'np.ndarray', output: str, stages: Optional[Stages] = None) -> None:
+        write_png(pixels, output, COMPRESSION_PROFILES[self._compression], self._threads, stages)
+
+    def size(self, filename: str) -> Tuple[int, int]:
+        return png_size(filename)
+
+
+class WebpFormat(OutputFormat):
+    """
+    Lossless WebP, smaller than png; the image is encoded in memory, up to 16383 px.
+    """
+    extension = '.webp'
+    mime = 'image/webp'
+    name = 'webp'
+    requires = 'numpy, Pillow with WebP support'
+
+    def available(self) -> bool:
+        return NUMPY_MODULE and WEBP_MODULE
+
+    def encode(self, pixels: 'np.ndarray', output: str, stages: Optional[Stages] = None) -> None:
+        stages = stages if stages is not None else Stages()
+        height, width = pixels.shape[:2]
+        if max(width, height) > _WEBP_MAX_SIZE:
+            raise ValueError(f'Image size {width}x{height} exceeds the WebP limit of {_WEBP_MAX_SIZE} px')
+        method, effort = _WEBP_PROFILES[self._compression]
+        with stages.stage('encode'):
+            im = Image.fromarray(np.ascontiguousarray(pixels), 'RGBA')
+            im.save(output, 'WEBP', lossless=True, method=method, quality=effort)
+
+
+class RawFormat(OutputFormat):
+    """
+    Raw RGBA pam stream compressed with zstd, for internal pipelines. The encode and
+    decode are faster than png, the file is larger.
+    """
+    extension = '.pam.zst'
+    mime = 'application/zstd'
+    name = 'raw'
+    requires = 'numpy, zstandard'
+
+    def available(self) -> bool:
+        return NUMPY_MODULE and ZSTD_MODULE
+
+    def encode(self, pixels: 'np.ndarray', output: str, stages: Optional[Stages] = None) -> None:
+        stages = stages if stages is not None else Stages()
+        height, width = pixels.shape[:2]
+        compressor = zstandard.ZstdCompressor(level=_ZSTD_PROFILES[self._compression],
+                                              threads=self._threads if self._threads > 1 else 0)
+        with stages.stage('encode'), open(output, 'wb') as f, compressor.stream_writer(f) as writer:
+            writer.write(pam_header(width, height))
+            for y in range(0, height, _BLOCK_ROWS):
+                writer.write(np.ascontiguousarray(pixels[y:y + _BLOCK_ROWS]).tobytes())
+
+    @staticmethod
+    def _header(reader: BinaryIO) -> Tuple[int, int, bytes]:
+        """
+        :param reader: Decompressed stream
+        :return: Width, height (px) and the bytes read after the header
+        """
+        head = b''
+        while len(head) < _MAX_HEADER and b'ENDHDR\n' not in head:
+            data = reader.read(_MAX_HEADER - len(head))
+            if len(data) == 0:
+                break
+            head += data
+        width, height, offset = read_pam_header(head)
+        return width, height, head[offset:]
+
+    def decode(self, filename: str) -> 'np.ndarray':
+        with open(filename, 'rb') as f, zstandard.ZstdDecompressor().stream_reader(f) as reader:
+            width, height, start = self._header(reader)
+            pixels = np.empty((height, width, 4), dtype=np.uint8)
+            data = memoryview(pixels.reshape(-1))
+            start = start[:len(data)]
+            data[:len(start)] = start
+            pos = len(start)
+            while pos < len(data):
+                n = reader.readinto(data[pos:])
+                if n == 0:
+                    raise ValueError(f'Truncated raw image {filename}')
+                pos += n
+        return pixels
+
+    def size(self, filename: str) -> Tuple[int, int]:
+        with open(filename, 'rb') as f, zstandard.ZstdDecompressor().stream_reader(f) as reader:
+            return self._header(reader)[:2]
+
+
+FORMATS: Dict[str, Type[OutputFormat]] = {
+    PngFormat.name: PngFormat,
+    RawFormat.name: RawFormat,
+    WebpFormat.name: WebpFormat
+}
+
+
+def get_format(name: str, compression: str = 'balanced', threads: int = 1) -> OutputFormat:
+    """
+    Return an output format.
+
+    :param name: Format name
+    :param compression: Compression profile
+    :param threads: Number of compression threads
+    :return: Format
+    """
+    if name not in FORMATS:
+        raise ValueError(f'Invalid format "{name}", valid: {", ".join(FORMATS.keys())}')
+    if compression not in COMPRESSION_PROFILES:
+        raise ValueError(f'Invalid compression "{compression}", valid: {", ".join(COMPRESSION_PROFILES.keys())}')
+    return FORMATS[name](compression, threads)
@@ -0,0 +1,156 @@
+"""
+METRICS
+Timing of the conversion stages, written as JSON lines and Prometheus text records.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['MetricsWriter', 'Stages']
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+# Constants
+_PROMETHEUS_PREFIX = 'convertpdf'
+
+
+class Stages(object):
+    """
+    Accumulates the time of each stage of a conversion, and the peak memory of the
+    called programs. The time of a nested stage is not counted by its parent.
+    """
+
+    def __init__(self) -> None:
+        """
+        Constructor.
+        """
+        self._stack: List[List[Any]] = []  # [name, start]
+        self.peak_rss = 0  # bytes
+        self.times: Dict[str, float] = {}
+
+    def _add(self, name: str, t: float) -> None:
+        """
+        Add time to a stage.
+
+        :param name: Stage
+        :param t: Time (s)
+        """
+        self.times[name] = self.times.get(name, 0) + t
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time a stage.
+
+        :param name: Stage
+        """
+        now = time.perf_counter()
+        if len(self._stack) > 0:  # The parent is paused
+            self._add(self._stack[-1][0], now - self._stack[-1][1])
+        self._stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self._add(name, now - self._stack.pop()[1])
+            if len(self._stack) > 0:
+                self._stack[-1][1] = now
+
+    def child(self, rss: int) -> None:
+        """
+        Register the peak memory of a finished program.
+
+        :param rss: Peak resident set size (bytes)
+        """
+        self.peak_rss = max(self.peak_rss, rss)
+
+
+class MetricsWriter(object):
+    """
+    Writes a record for each converted page. Records are appended to a JSON lines
+    file, and the totals are written as a Prometheus text file (node exporter
+    textfile collector format).
+    """
+
+    def __init__(self, jsonl: str = '', prometheus: str = '') -> None:
+        """
+        Constructor.
+
+        :param jsonl: JSON lines file, if empty the records are not stored
+        :param prometheus: Prometheus text file, if empty the totals are not stored
+        """
+        self._jsonl = jsonl
+        self._lock = threading.Lock()
+        self._prometheus = prometheus
+        self._totals: Dict[str, Dict[str, float]] = {'bytes': {}, 'encode_seconds': {}, 'encoded_pages': {},
+                                                     'pages': {}, 'stage_seconds': {}}
+        self._peak_rss = 0
+        self._pixels = 0
+
+    @property
+    def enabled(self) -> bool:
+        """
+        :return: True if the records are stored
+        """
+        return self._jsonl != '' or self._prometheus != ''
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """
+        Store a record, can be called from several threads.
+
+        :param record: Page record
+        """
+        with self._lock:
+            if self._jsonl != '':
+                with open(self._jsonl, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, sort_keys=True) + '\n')
+            if self._prometheus != '':
+                pages = self._totals['pages']
+                pages[record['status']] = pages.get(record['status'], 0) + 1
+                for s, t in record['stages'].items():
+                    self._totals['stage_seconds'][s] = self._totals['stage_seconds'].get(s, 0) + t
+                fmt = record.get('format', 'png')
+                self._totals['bytes'][fmt] = self._totals['bytes'].get(fmt, 0) + record['bytes']
+                if record.get('encode') is not None:  # Unknown if the render program wrote the png
+                    encode, encoded = self._totals['encode_seconds'], self._totals['encoded_pages']
+                    encode[fmt] = encode.get(fmt, 0) + record['encode']
+                    encoded[fmt] = encoded.get(fmt, 0) + 1
+                self._peak_rss = max(self._peak_rss, record['peak_rss'])
+                self._pixels += record['width'] * record['height']
+                self._write_prometheus()
+
+    def _write_prometheus(self) -> None:
+        """
+        Write the totals, the file is replaced atomically.
+        """
+        p = _PROMETHEUS_PREFIX
+        lines = [f'# HELP {p}_pages_total Converted pages by status', f'# TYPE {p}_pages_total counter']
+        lines += [f'{p}_pages_total{{status="{k}"}} {v}' for k, v in sorted(self._totals['pages'].items())]
+        lines += [f'# HELP {p}_stage_seconds_total Time spent in each conversion stage',
+                  f'# TYPE {p}_stage_seconds_total counter']
+        lines += [f'{p}_stage_seconds_total{{stage="{k}"}} {v:.6f}'
+                  for k, v in sorted(self._totals['stage_seconds'].items())]
+        lines += [f'# HELP {p}_output_bytes_total Size of the converted images by format',
+                  f'# TYPE {p}_output_bytes_total counter']
+        lines += [f'{p}_output_bytes_total{{format="{k}"}} {v}' for k, v in sorted(self._totals['bytes'].items())]
+        lines += [f'# HELP {p}_encode_seconds_total Time encoding the converted images by format, excludes the png '
+                  'written by the render program (counted as render)', f'# TYPE {p}_encode_seconds_total counter']
+        lines += [f'{p}_encode_seconds_total{{format="{k}"}} {v:.6f}'
+                  for k, v in sorted(self._totals['encode_seconds'].items())]
+        lines += [f'# HELP {p}_encoded_pages_total Pages counted by encode_seconds_total, by format',
+                  f'# TYPE {p}_encoded_pages_total counter']
+        lines += [f'{p}_encoded_pages_total{{format="{k}"}} {v}'
+                  for k, v in sorted(self._totals['encoded_pages'].items())]
+        lines += [f'# HELP {p}_output_pixels_total Pixels of the converted images',
+                  f'# TYPE {p}_output_pixels_total counter', f'{p}_output_pixels_total {self._pixels}',
+                  f'# HELP {p}_child_peak_rss_bytes Peak memory of the render programs',
+                  f'# TYPE {p}_child_peak_rss_bytes gauge', f'{p}_child_peak_rss_bytes {self._peak_rss}']
+        tmp = self._prometheus + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp, self._prometheus)
+
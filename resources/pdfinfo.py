@@ -0,0 +1,578 @@
+"""
+PDFINFO
+Reads the page boxes (MediaBox, CropBox) and rotation of every page of a pdf file,
+straight from the pdf object tree, without rendering the document.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['PdfError', 'PdfPage', 'read_pages']
+
+import mmap
+import re
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+# Constants
+_DELIMITERS = b'()<>[]{}/%'
+_WHITESPACE = b'\x00\t\n\x0c\r '
+_POINTS_PER_INCH = 72
+
+_RE_INDIRECT = re.compile(rb'(\d+)\s+(\d+)\s+obj')
+_RE_NUMBER = re.compile(rb'[+-]?(?:\d+\.?\d*|\.\d+)')
+_RE_REF = re.compile(rb'(?:\s|%[^\r\n]*[\r\n])*(\d+)(?:\s|%[^\r\n]*[\r\n])+R(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])')
+_RE_SCAN = re.compile(rb'(?<![0-9])(\d+)[\x00\t\n\x0c\r ]+(\d+)[\x00\t\n\x0c\r ]+obj\b')
+_RE_XREF_ENTRY = re.compile(rb'(\d{10})[ ]+(\d{5})[ ]+([nf])')
+_RE_XREF_SUBSECTION = re.compile(rb'\s*(\d+)\s+(\d+)\s*[\r\n]')
+
+
+class PdfError(ValueError):
+    """
+    Invalid or unsupported pdf file.
+    """
+
+
+class PdfPage(NamedTuple):
+    """
+    Page boxes (in points) and rotation (deg).
+    """
+    mediabox: Tuple[float, float, float, float]
+    cropbox: Tuple[float, float, float, float]
+    rotate: int
+
+    @property
+    def width(self) -> float:
+        """
+        :return: Width of the rendered page (points), considers the rotation
+        """
+        w, h = self.mediabox[2] - self.mediabox[0], self.mediabox[3] - self.mediabox[1]
+        return abs(h if self.rotate % 180 == 90 else w)
+
+    @property
+    def height(self) -> float:
+        """
+        :return: Height of the rendered page (points), considers the rotation
+        """
+        w, h = self.mediabox[2] - self.mediabox[0], self.mediabox[3] - self.mediabox[1]
+        return abs(w if self.rotate % 180 == 90 else h)
+
+    @property
+    def size_inches(self) -> Tuple[float, float]:
+        """
+        :return: Rendered page size (width, height) in inches
+        """
+        return self.width / _POINTS_PER_INCH, self.height / _POINTS_PER_INCH
+
+
+class _Ref(NamedTuple):
+    """
+    Indirect reference.
+    """
+    num: int
+    gen: int
+
+
+class _Name(str):
+    """
+    Pdf name object.
+    """
+
+
+class _Keyword(str):
+    """
+    Pdf keyword (obj, endobj, stream, ...).
+    """
+
+
+class _Stream(NamedTuple):
+    """
+    Stream object, data is not decoded.
+    """
+    dict: Dict[str, Any]
+    start: int
+    length: int
+
+
+class _Lexer(object):
+    """
+    Pdf object parser.
+    """
+
+    def __init__(self, buf: Any) -> None:
+        """
+        Constructor.
+
+        :param buf: Buffer (bytes or mmap)
+        """
+        self._buf = buf
+
+    def _skip(self, pos: int) -> int:
+        """
+        Skip whitespace and comments.
+
+        :param pos: Position
+        :return: New position
+        """
+        buf, n = self._buf, len(self._buf)
+        while pos < n:
+            c = buf[pos:pos + 1]
+            if c in _WHITESPACE:
+                pos += 1
+            elif c == b'%':
+                while pos < n and buf[pos:pos + 1] not in (b'\r', b'\n'):
+                    pos += 1
+            else:
+                break
+        return pos
+
+    def _token_end(self, pos: int) -> int:
+        """
+        :param pos: Position
+        :return: Position where the regular token starting at pos ends
+        """
+        buf, n = self._buf, len(self._buf)
+        while pos < n:
+            c = buf[pos:pos + 1]
+            if c in _WHITESPACE or c in _DELIMITERS:
+                break
+            pos += 1
+        return pos
+
+    def parse(self, pos: int) -> Tuple[Any, int]:
+        """
+        Parse an object.
+
+        :param pos: Position
+        :return: Object, position after the object
+        """
+        buf = self._buf
+        pos = self._skip(pos)
+        c = buf[pos:pos + 1]
+        if c == b'':
+            raise PdfError('Unexpected end of file')
+        if c == b'/':
+            end = self._token_end(pos + 1)
+            name = re.sub(rb'#([0-9a-fA-F]{2})', lambda m: bytes([int(m.group(1), 16)]), buf[pos + 1:end])
+            return _Name(name.decode('latin-1')), end
+        if c == b'<':
+            if buf[pos + 1:pos + 2] == b'<':
+                d, pos = {}, pos + 2
+                while True:
+                    pos = self._skip(pos)
+                    if buf[pos:pos + 2] == b'>>':
+                        return d, pos + 2
+                    key, pos = self.parse(pos)
+                    if not isinstance(key, _Name):
+                        raise PdfError('Invalid dictionary key')
+                    d[key], pos = self.parse(pos)
+            end = buf.find(b'>', pos)
+            if end == -1:
+                raise PdfError('Unterminated hex string')
+            digits = re.sub(rb'\s', b'', buf[pos + 1:end]).decode('latin-1')
+            return bytes.fromhex(digits + '0' * (len(digits) % 2)), end + 1
+        if c == b'(':
+            depth, start, pos = 1, pos + 1, pos + 1
+            while depth > 0:
+                c = buf[pos:pos + 1]
+                if c == b'':
+                    raise PdfError('Unterminated string')
+                if c == b'\\':
+                    pos += 1
+                elif c == b'(':
+                    depth += 1
+                elif c == b')':
+                    depth -= 1
+                pos += 1
+            return buf[start:pos - 1], pos
+        if c == b'[':
+            a, pos = [], pos + 1
+            while True:
+                pos = self._skip(pos)
+                if buf[pos:pos + 1] == b']':
+                    return a, pos + 1
+                obj, pos = self.parse(pos)
+                a.append(obj)
+        m = _RE_NUMBER.match(buf, pos)
+        if m:
+            num = m.group(0)
+            if b'.' in num:
+                return float(num), m.end()
+            ref = _RE_REF.match(buf, m.end())
+            if ref and num.isdigit():
+                return _Ref(int(num), int(ref.group(1))), ref.end()
+            return int(num), m.end()
+        end = self._token_end(pos)
+        if end == pos:
+            raise PdfError(f'Unexpected delimiter at {pos}')
+        word = buf[pos:end].decode('latin-1')
+        if word in ('true', 'false'):
+            return word == 'true', end
+        if word == 'null':
+            return None, end
+        return _Keyword(word), end
+
+
+class _PdfReader(_Lexer):
+    """
+    Lazy pdf object reader. Objects are parsed only when they are requested.
+    """
+
+    def __init__(self, buf: Any) -> None:
+        """
+        Constructor.
+
+        :param buf: File buffer (bytes or mmap)
+        """
+        super(_PdfReader, self).__init__(buf)
+        self._xref: Dict[int, Tuple[int, int]] = {}  # num -> (1, offset) or (2, objstm num)
+        self._objstm: Dict[int, Tuple[bytes, Dict[int, int], int]] = {}
+        self._cache: Dict[int, Any] = {}
+        self.trailer: Dict[str, Any] = {}
+        # noinspection PyBroadException
+        try:
+            self._read_xref_chain()
+            self.resolve(self.trailer['Root'])
+        except Exception:
+            self._rebuild_xref()
+
+    def _parse_indirect(self, offset: int, num: Optional[int] = None) -> Any:
+        """
+        Parse the indirect object at the given offset.
+
+        :param offset: Offset of the object
+        :param num: Expected object number
+        :return: Object
+        """
+        pos = self._skip(offset)
+        m = _RE_INDIRECT.match(self._buf, pos)
+        if m is None or (num is not None and int(m.group(1)) != num):
+            raise PdfError(f'Invalid object at offset {offset}')
+        obj, pos = self.parse(m.end())
+        if isinstance(obj, dict):
+            pos = self._skip(pos)
+            if self._buf[pos:pos + 6] == b'stream':
+                pos += 6
+                if self._buf[pos:pos + 2] == b'\r\n':
+                    pos += 2
+                elif self._buf[pos:pos + 1] in (b'\n', b'\r'):
+                    pos += 1
+                length = obj.get('Length')
+                if isinstance(length, _Ref):
+                    length = self.resolve(length)
+                if not isinstance(length, int) or self._buf[pos + length:pos + length + 30].find(b'endstream') == -1:
+                    end = self._buf.find(b'endstream', pos)
+                    if end == -1:
+                        raise PdfError('Unterminated stream')
+                    length = end - pos
+                return _Stream(obj, pos, length)
+        return obj
+
+    # Streams
+
+    def stream_data(self, stream: _Stream) -> bytes:
+        """
+        Decode the stream data. Only FlateDecode (with png predictors) is supported,
+        which covers the xref and object streams.
+
+        :param stream: Stream
+        :return: Data
+        """
+        data = bytes(self._buf[stream.start:stream.start + stream.length])
+        filters = self.resolve(stream.dict.get('Filter', []))
+        params = self.resolve(stream.dict.get('DecodeParms', []))
+        if not isinstance(filters, list):
+            filters, params = [filters], [params]
+        elif not isinstance(params, list):
+            params = [params]
+        for i, f in enumerate(filters):
+            if f not in ('FlateDecode', 'Fl'):
+                raise PdfError(f'Unsupported stream filter {f}')
+            try:
+                data = zlib.decompress(data)
+            except zlib.error:  # Truncated streams
+                data = zlib.decompressobj().decompress(data)
+            p = self.resolve(params[i]) if i < len(params) else None
+            if isinstance(p, dict) and p.get('Predictor', 1) >= 10:
+                data = self._unpredict(data, int(p.get('Columns', 1)) * int(p.get('Colors', 1)) *
+                                       int(p.get('BitsPerComponent', 8)) // 8, int(p.get('Colors', 1)))
+        return data
+
+    @staticmethod
+    def _unpredict(data: bytes, columns: int, bpp: int) -> bytes:
+        """
+        Undo the png predictors.
+
+        :param data: Data
+        :param columns: Bytes per row
+        :param bpp: Bytes per pixel
+        :return: Data
+        """
+        out, prev = bytearray(), bytearray(columns)
+        for r in range(0, len(data) - columns, columns + 1):
+            ft, row = data[r], bytearray(data[r + 1:r + 1 + columns])
+            for i in range(len(row)):
+                a = row[i - bpp] if i >= bpp else 0
+                b = prev[i]
+                if ft == 1:
+                    row[i] = (row[i] + a) & 0xff
+                elif ft == 2:
+                    row[i] = (row[i] + b) & 0xff
+                elif ft == 3:
+                    row[i] = (row[i] + (a + b) // 2) & 0xff
+                elif ft == 4:
+                    c = prev[i - bpp] if i >= bpp else 0
+                    p = a + b - c
+                    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                    row[i] = (row[i] + (a if pa <= pb and pa <= pc else (b if pb <= pc else c))) & 0xff
+            out += row
+            prev = row
+        return bytes(out)
+
+    # Cross-reference
+
+    def _read_xref_chain(self) -> None:
+        """
+        Read all the cross-reference sections, starting from the last one.
+        """
+        tail = self._buf[max(0, len(self._buf) - 2048):]
+        i = tail.rfind(b'startxref')
+        if i == -1:
+            raise PdfError('startxref not found')
+        offset, _ = self.parse(len(self._buf) - len(tail) + i + 9)
+        visited = set()
+        while isinstance(offset, int) and offset not in visited:
+            visited.add(offset)
+            trailer = self._read_xref(offset)
+            if isinstance(trailer.get('XRefStm'), int):  # Hybrid files
+                self._read_xref(trailer['XRefStm'])
+            for k in trailer:
+                self.trailer.setdefault(k, trailer[k])
+            offset = trailer.get('Prev')
+
+    def _add_entry(self, num: int, kind: int, value: int) -> None:
+        """
+        Add a xref entry, newer sections are read first thus have priority.
+
+        :param num: Object number
+        :param kind: 0 free, 1 offset, 2 compressed in object stream
+        :param value: Offset or object stream number
+        """
+        if num not in self._xref:
+            self._xref[num] = (kind, value)
+
+    def _read_xref(self, offset: int) -> Dict[str, Any]:
+        """
+        Read a cross-reference table or stream.
+
+        :param offset: Offset
+        :return: Trailer dict
+        """
+        pos = self._skip(offset)
+        if self._buf[pos:pos + 4] == b'xref':
+            pos += 4
+            while True:
+                m = _RE_XREF_SUBSECTION.match(self._buf, pos)
+                if m is None:
+                    break
+                start, count = int(m.group(1)), int(m.group(2))
+                pos = m.end()
+                for k in range(count):
+                    e = _RE_XREF_ENTRY.search(self._buf, pos, pos + 40)
+                    if e is None:
+                        raise PdfError('Invalid xref entry')
+                    self._add_entry(start + k, 1 if e.group(3) == b'n' else 0, int(e.group(1)))
+                    pos = e.end()
+            pos = self._skip(pos)
+            if self._buf[pos:pos + 7] != b'trailer':
+                raise PdfError('Trailer not found')
+            trailer, _ = self.parse(pos + 7)
+            return trailer
+        stream = self._parse_indirect(offset)
+        if not isinstance(stream, _Stream) or stream.dict.get('Type') != 'XRef':
+            raise PdfError('Invalid xref stream')
+        w = [int(x) for x in stream.dict['W']]
+        index = stream.dict.get('Index', [0, stream.dict['Size']])
+        data, p = self.stream_data(stream), 0
+        if len(data) < sum(w) * sum(index[1::2]):
+            raise PdfError('Truncated xref stream')
+        for j in range(0, len(index), 2):
+            for num in range(index[j], index[j] + index[j + 1]):
+                fields = []
+                for width in w:
+                    fields.append(int.from_bytes(data[p:p + width], 'big'))
+                    p += width
+                kind = fields[0] if w[0] > 0 else 1
+                if kind in (1, 2):
+                    self._add_entry(num, kind, fields[1])
+                else:
+                    self._add_entry(num, 0, 0)
+        return stream.dict
+
+    def _rebuild_xref(self) -> None:
+        """
+        Rebuild the cross-reference by scanning the file, used if the xref is damaged.
+        The scan streams through the buffer, the file is not loaded in memory.
+        """
+        self._xref, self._objstm, self._cache = {}, {}, {}
+        objstms = []
+        for m in _RE_SCAN.finditer(self._buf):
+            num = int(m.group(1))
+            self._xref[num] = (1, m.start())  # Last definition wins
+        for num in list(self._xref.keys()):
+            try:
+                obj = self.get(num)
+            except PdfError:
+                continue
+            if isinstance(obj, _Stream) and obj.dict.get('Type') == 'ObjStm':
+                objstms.append(num)
+            elif isinstance(obj, dict) and obj.get('Type') == 'Catalog':
+                self.trailer['Root'] = _Ref(num, 0)
+        for s in objstms:
+            _, offsets, _ = self._load_objstm(s)
+            for num in offsets:
+                if num not in self._xref:
+                    self._xref[num] = (2, s)
+        if 'Root' not in self.trailer:
+            for num in list(self._xref.keys()):
+                obj = self.get(num)
+                if isinstance(obj, dict) and obj.get('Type') == 'Catalog':
+                    self.trailer['Root'] = _Ref(num, 0)
+                    break
+            else:
+                raise PdfError('Document catalog not found')
+
+    # Objects
+
+    def _load_objstm(self, num: int) -> Tuple[bytes, Dict[int, int], int]:
+        """
+        Load an object stream.
+
+        :param num: Object stream number
+        :return: Data, object number to offset, first offset
+        """
+        if num not in self._objstm:
+            stream = self.get(num)
+            if not isinstance(stream, _Stream):
+                raise PdfError(f'Object {num} is not an object stream')
+            data = self.stream_data(stream)
+            header = data[:stream.dict['First']].split()
+            offsets = {int(header[k]): int(header[k + 1]) for k in range(0, len(header) - 1, 2)}
+            self._objstm[num] = (data, offsets, int(stream.dict['First']))
+        return self._objstm[num]
+
+    def get(self, num: int) -> Any:
+        """
+        Return an object by its number.
+
+        :param num: Object number
+        :return: Object, None if it does not exist
+        """
+        if num in self._cache:
+            return self._cache[num]
+        kind, value = self._xref.get(num, (0, 0))
+        if kind == 1:
+            obj = self._parse_indirect(value, num)
+        elif kind == 2:
+            data, offsets, first = self._load_objstm(value)
+            if num not in offsets:
+                raise PdfError(f'Object {num} not found in object stream {value}')
+            obj, _ = _Lexer(data).parse(first + offsets[num])
+        else:
+            obj = None
+        self._cache[num] = obj
+        return obj
+
+    def resolve(self, obj: Any) -> Any:
+        """
+        Resolve an indirect reference.
+
+        :param obj: Object
+        :return: Resolved object
+        """
+        depth = 0
+        while isinstance(obj, _Ref):
+            obj = self.get(obj.num)
+            depth += 1
+            if depth > 32:
+                raise PdfError('Reference loop')
+        if isinstance(obj, _Stream):
+            return obj.dict
+        return obj
+
+    def _box(self, box: Any) -> Optional[Tuple[float, float, float, float]]:
+        """
+        Resolve a rectangle.
+
+        :param box: Box object
+        :return: Normalized box (x0, y0, x1, y1)
+        """
+        box = self.resolve(box)
+        if not isinstance(box, list) or len(box) != 4:
+            return None
+        x0, y0, x1, y1 = [float(self.resolve(v)) for v in box]
+        return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+
+    def pages(self) -> List[PdfPage]:
+        """
+        Traverse the page tree, the boxes and rotation are inherited from the parent nodes.
+
+        :return: Page list
+        """
+        root = self.resolve(self.trailer['Root'])
+        if not isinstance(root, dict) or 'Pages' not in root:
+            raise PdfError('Page tree not found')
+        pages, visited = [], set()
+        stack: List[Tuple[Any, Dict[str, Any]]] = [(root['Pages'], {})]
+        while len(stack) > 0:
+            ref, inherited = stack.pop()
+            if isinstance(ref, _Ref):
+                if ref.num in visited:
+                    continue
+                visited.add(ref.num)
+            node = self.resolve(ref)
+            if not isinstance(node, dict):
+                continue
+            attrs = dict(inherited)
+            for k in ('MediaBox', 'CropBox', 'Rotate'):
+                if k in node:
+                    attrs[k] = node[k]
+            kids = self.resolve(node.get('Kids'))
+            if node.get('Type') == 'Pages' or (node.get('Type') != 'Page' and isinstance(kids, list)):
+                for kid in reversed(kids or []):
+                    stack.append((kid, attrs))
+                continue
+            mediabox = self._box(attrs.get('MediaBox')) or (0, 0, 612, 792)  # Letter, as most readers
+            cropbox = self._box(attrs.get('CropBox')) or mediabox
+            cropbox = (max(cropbox[0], mediabox[0]), max(cropbox[1], mediabox[1]),
+                       min(cropbox[2], mediabox[2]), min(cropbox[3], mediabox[3]))
+            rotate = self.resolve(attrs.get('Rotate', 0))
+            rotate = int(rotate) % 360 if isinstance(rotate, (int, float)) else 0
+            pages.append(PdfPage(mediabox, cropbox, rotate - rotate % 90))
+        return pages
+
+
+def read_pages(filename: str) -> List[PdfPage]:
+    """
+    Read the page boxes and rotation of every page of the pdf.
+
+    :param filename: Pdf file
+    :return: Page list
+    """
+    with open(filename, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            raise PdfError(f'Empty pdf file {filename}')
+        try:
+            if buf.find(b'%PDF-', 0, 1024) == -1:
+                raise PdfError(f'File {filename} is not a pdf')
+            pages = _PdfReader(buf).pages()
+        except PdfError:
+            raise
+        except Exception as e:
+            raise PdfError(f'Invalid pdf {filename}: {e}')
+        finally:
+            buf.close()
+    if len(pages) == 0:
+        raise PdfError(f'Pdf {filename} has no pages')
+    return pages
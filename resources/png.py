@@ -0,0 +1,292 @@
+"""
+PNG
+Streaming png reader and writer, the images are processed row by row.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['COMPRESSION_PROFILES', 'PngWriter', 'png_from_rows', 'png_size', 'read_png_rows', 'recompress_png']
+
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from resources.metrics import Stages
+from typing import BinaryIO, Deque, Dict, Iterator, Optional, Tuple, Union
+
+# Constants
+COMPRESSION_PROFILES: Dict[str, int] = {'fast': 1, 'balanced': 6, 'small': 9}  # Zlib level of each profile
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_BLOCK_SIZE = 4 * 1024 * 1024  # Raw data deflated by each thread
+_IDAT_SIZE = 1024 * 1024
+_READ_SIZE = 1024 * 1024
+_RGBA_BPP = 4
+_WINDOW_SIZE = 32 * 1024
+_ZLIB_HEADER = b'\x78\x9c'
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    """
+    Create a png chunk.
+
+    :param kind: Chunk type
+    :param data: Chunk data
+    :return: Chunk
+    """
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def _deflate(data: bytes, level: int, zdict: bytes, final: bool) -> bytes:
+    """
+    Compress a block of a zlib stream as raw deflate. The block is byte aligned by a
+    sync flush, thus, the blocks compressed by several threads can be concatenated.
+
+    :param data: Raw data
+    :param level: Zlib level
+    :param zdict: Last data of the previous block, used as dictionary
+    :param final: Last block of the stream
+    :return: Compressed data
+    """
+    if len(zdict) > 0:
+        z = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        z = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return z.compress(data) + z.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def png_from_rows(width: int, height: int, rows: bytes, level: int = 6) -> bytes:
+    """
+    Create an in-memory 8-bit RGBA png from its filtered rows.
+
+    :param width: Width (px)
+    :param height: Height (px)
+    :param rows: Filtered rows (filter type and data of each row)
+    :param level: Zlib compression level, 0 stores the rows
+    :return: Png
+    """
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return PNG_SIGNATURE + _chunk(b'IHDR', header) + _chunk(b'IDAT', zlib.compress(rows, level)) + \
+        _chunk(b'IEND', b'')
+
+
+def png_size(filename: str) -> Tuple[int, int]:
+    """
+    Read the size of a png from its header.
+
+    :param filename: Png file
+    :return: Width, height
+    """
+    with open(filename, 'rb') as f:
+        header = f.read(24)
+    if header[:8] != PNG_SIGNATURE or header[12:16] != b'IHDR':
+        raise ValueError(f'File {filename} is not a png')
+    return struct.unpack('>II', header[16:24])
+
+
+def read_png_rows(source: Union[str, BinaryIO]) -> Tuple[int, int, Iterator[bytes]]:
+    """
+    Read a 8-bit RGBA non-interlaced png. The rows are not unfiltered, and the
+    image data is inflated by chunks, thus, the image is never held in memory.
+
+    :param source: Png file, or a binary stream (e.g. a pipe)
+    :return: Width, height, iterator of the filtered rows (filter type and data)
+    """
+    f = open(source, 'rb') if isinstance(source, str) else source
+    name = source if isinstance(source, str) else 'stream'
+    if f.read(8) != PNG_SIGNATURE:
+        f.close()
+        raise ValueError(f'File {name} is not a png')
+    length, kind = struct.unpack('>I4s', f.read(8))
+    if kind != b'IHDR':
+        f.close()
+        raise ValueError(f'Invalid png {name}')
+    width, height, depth, color, _, _, interlace = struct.unpack('>IIBBBBB', f.read(length))
+    f.read(4)
+    if depth != 8 or color != 6 or interlace != 0:
+        f.close()
+        raise ValueError(f'Png {name} must be 8-bit RGBA non-interlaced')
+
+    def _rows() -> Iterator[bytes]:
+        stride = 1 + width * _RGBA_BPP
+        z, buf = zlib.decompressobj(), b''
+        try:
+            while True:
+                n, k = struct.unpack('>I4s', f.read(8))
+                if k == b'IEND':
+                    f.read(4)  # The writer of a pipe fails if its output is not consumed
+                    buf += z.flush()  # Rows kept by the inflate bound
+                    rows = len(buf) // stride
+                    for r in range(rows):
+                        yield buf[r * stride:(r + 1) * stride]
+                    if not z.eof:
+                        raise ValueError(f'Truncated image data of png {name}')
+                    break
+                if k != b'IDAT':
+                    f.read(n + 4)  # Pipes cannot seek
+                    continue
+                left = n
+                while left > 0:
+                    data = f.read(min(left, _READ_SIZE))
+                    left -= len(data)
+                    while len(data) > 0:
+                        # The inflated size is bounded, blank pages have a huge compression ratio
+                        buf += z.decompress(data, max(_READ_SIZE, stride))
+                        data = z.unconsumed_tail
+                        rows = len(buf) // stride
+                        for r in range(rows):
+                            yield buf[r * stride:(r + 1) * stride]
+                        buf = buf[rows * stride:]
+                f.read(4)
+        finally:
+            f.close()
+
+    return width, height, _rows()
+
+
+def recompress_png(source: Union[str, BinaryIO], output: str, level: int = 6, threads: int = 1,
+                   stages: Optional[Stages] = None) -> None:
+    """
+    Compress a png again with other zlib level, the filtered rows are kept.
+
+    :param source: Png file, or a binary stream (e.g. a pipe)
+    :param output: Output png
+    :param level: Zlib compression level
+    :param threads: Number of compression threads
+    :param stages: Stages of the conversion, times the encode
+    """
+    width, height, rows = read_png_rows(source)
+    with PngWriter(output, width, height, level, threads, stages) as png:
+        for row in rows:
+            png.write_filtered(row)
+
+
+class PngWriter(object):
+    """
+    Writes a 8-bit RGBA png row by row. If there is more than one thread, the rows
+    are deflated by blocks in parallel, as pigz does.
+    """
+
+    def __init__(self, filename: str, width: int, height: int, level: int = 6, threads: int = 1,
+                 stages: Optional[Stages] = None) -> None:
+        """
+        Constructor.
+
+        :param filename: Output file
+        :param width: Image width
+        :param height: Image height
+        :param level: Zlib compression level
+        :param threads: Number of compression threads
+        :param stages: Stages of the conversion, times the encode
+        """
+        self._f: Optional[BinaryIO] = open(filename, 'wb')
+        self._f.write(PNG_SIGNATURE)
+        self._f.write(_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+        self._level = level
+        self._buf = b''
+        self._stages = stages if stages is not None else Stages()
+        self._threads = threads
+        if threads > 1:
+            self._pool: Optional[ThreadPoolExecutor] = ThreadPoolExecutor(threads)
+            self._pending: Deque[Future] = deque()
+            self._block = bytearray()
+            self._adler = zlib.adler32(b'')
+            self._zdict = b''
+            self._write(_ZLIB_HEADER)
+        else:
+            self._pool = None
+            self._z = zlib.compressobj(level)
+        self._stride = 1 + width * _RGBA_BPP
+        self._rows = 0
+        self.height = height
+        self.width = width
+
+    def __enter__(self) -> 'PngWriter':
+        return self
+
+    def __exit__(self, etype, value, traceback) -> None:
+        self.close(check=etype is None)
+
+    def _write(self, data: bytes) -> None:
+        """
+        Write compressed data, split in IDAT chunks.
+
+        :param data: Compressed data
+        """
+        self._buf += data
+        if len(self._buf) >= _IDAT_SIZE:
+            self._f.write(_chunk(b'IDAT', self._buf))
+            self._buf = b''
+
+    def _submit(self, final: bool) -> None:
+        """
+        Deflate the current block in the thread pool. The compressed blocks are
+        written in order, the number of blocks in memory is bounded by the threads.
+
+        :param final: Last block of the image
+        """
+        data = bytes(self._block)
+        self._block = bytearray()
+        self._adler = zlib.adler32(data, self._adler)
+        self._pending.append(self._pool.submit(_deflate, data, self._level, self._zdict, final))
+        self._zdict = (self._zdict + data)[-_WINDOW_SIZE:]
+        while len(self._pending) > (0 if final else self._threads):
+            self._write(self._pending.popleft().result())
+
+    def write_filtered(self, row: bytes) -> None:
+        """
+        Write a filtered row.
+
+        :param row: Filter type and row data
+        """
+        if len(row) != self._stride:
+            raise ValueError(f'Invalid row size {len(row)}, expected {self._stride}')
+        self.write_block(row)
+
+    def write_block(self, rows: bytes) -> None:
+        """
+        Write several filtered rows at once.
+
+        :param rows: Filter type and data of each row
+        """
+        if len(rows) % self._stride != 0:
+            raise ValueError(f'Invalid block size {len(rows)}, expected a multiple of {self._stride}')
+        self._rows += len(rows) // self._stride
+        with self._stages.stage('encode'):
+            if self._pool is None:
+                self._write(self._z.compress(rows))
+            else:
+                self._block += rows
+                if len(self._block) >= _BLOCK_SIZE:
+                    self._submit(False)
+
+    def write_row(self, row: bytes) -> None:
+        """
+        Write a RGBA row, without filtering.
+
+        :param row: Row data
+        """
+        self.write_filtered(b'\x00' + row)
+
+    def close(self, check: bool = True) -> None:
+        """
+        Finish the image.
+
+        :param check: Check that all rows were written
+        """
+        if self._f is None:
+            return
+        with self._stages.stage('encode'):
+            if self._pool is None:
+                self._write(self._z.flush())
+            else:
+                if check:
+                    self._submit(True)
+                    self._write(struct.pack('>I', self._adler))
+                self._pool.shutdown(cancel_futures=True)
+            if len(self._buf) > 0:
+                self._f.write(_chunk(b'IDAT', self._buf))
+            self._f.write(_chunk(b'IEND', b''))
+            self._f.close()
+            self._f = None
+        if check and self._rows != self.height:
+            raise ValueError(f'Png has {self._rows} rows, expected {self.height}')
@@ -0,0 +1,373 @@
+"""
+POOL
+Pool of warm Ghostscript processes. Each process renders many pages, thus, its
+fonts, profiles and resources are loaded once instead of once per page. A failed
+warm render raises PoolError, the callers render the page again with a new process.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['GhostscriptServer', 'PoolError', 'RenderPool', 'get_pool', 'process_memory']
+
+import atexit
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from resources.metrics import Stages
+from resources.utils import CancelToken, LimitExceeded, ProcessLimits, get_local_path, serve
+from typing import Dict, List, Optional, Tuple
+
+# Constants
+_MARKER = '%%CONVERTPDF'
+_MESSAGE_LINES = 10  # Output lines kept to describe a failed render
+_SOURCES = 4  # Pdf files kept within the local path by each pool
+
+
+class PoolError(Exception):
+    """
+    A warm process failed rendering a page, the page can be rendered by a new process.
+    """
+    pass
+
+
+def process_memory(pid: int) -> Tuple[int, int]:
+    """
+    Return the memory of a running process, only available on Linux.
+
+    :param pid: Process id
+    :return: Resident set size, peak resident set size (bytes), 0 if not available
+    """
+    rss, peak = 0, 0
+    try:
+        with open(f'/proc/{pid}/status', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return rss, peak
+
+
+def _ps_string(s: str) -> str:
+    """
+    :param s: String
+    :return: PostScript hex string, does not require escaping
+    """
+    return '<' + s.encode('utf-8').hex() + '>'
+
+
+def _link(src: str, dest: str) -> None:
+    """
+    Hardlink a file, or copy it if links are not supported.
+
+    :param src: Source
+    :param dest: Destination
+    """
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+class _SourceFiles(object):
+    """
+    Pdf files linked (or copied) within the app local path, which the warm processes
+    can read. Each document is linked once and shared by its pages; the least recently
+    used documents are removed once they are not rendered.
+    """
+
+    def __init__(self, limit: int = _SOURCES) -> None:
+        """
+        Constructor.
+
+        :param limit: Number of unused documents kept
+        """
+        self._count = itertools.count(1)
+        self._files: 'OrderedDict[Tuple[str, int, int], List]' = OrderedDict()  # key: [path, jobs]
+        self._folder = ''
+        self._limit = limit
+        self._lock = threading.Lock()
+
+    def acquire(self, filename: str) -> str:
+        """
+        :param filename: Pdf file
+        :return: Pdf within the local path, released after the render
+        """
+        st = os.stat(filename)
+        key = os.path.abspath(filename), st.st_mtime_ns, st.st_size
+        with self._lock:
+            if key in self._files:
+                self._files.move_to_end(key)
+                self._files[key][1] += 1
+                return self._files[key][0]
+            if self._folder == '':
+                self._folder = tempfile.mkdtemp(prefix='__pool__', dir=get_local_path())
+            path = os.path.join(self._folder, f'__input{next(self._count)}__.pdf')
+            _link(filename, path)  # Within the lock, the other pages of the document wait for it
+            self._files[key] = [path, 1]
+            return path
+
+    def release(self, path: str) -> None:
+        """
+        :param path: Pdf returned by acquire
+        """
+        with self._lock:
+            for v in self._files.values():
+                if v[0] == path:
+                    v[1] -= 1
+            unused = [k for k, v in self._files.items() if v[1] == 0]
+            for k in unused[:max(0, len(unused) - self._limit)]:  # The oldest first
+                os.remove(self._files.pop(k)[0])
+
+    def close(self) -> None:
+        """
+        Remove the files.
+        """
+        with self._lock:
+            self._files.clear()
+            if self._folder != '':
+                shutil.rmtree(self._folder, ignore_errors=True)
+                self._folder = ''
+
+
+class GhostscriptServer(object):
+    """
+    Ghostscript process that reads the render jobs from its standard input. The
+    process keeps -dSAFER, thus, it only reads and writes within the app local
+    path. As -dSAFER locks the OutputFile of the device, each process writes the
+    pages to its own folder (a file per page), then they are moved to the outputs.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, args: List[str], limits: Optional[ProcessLimits] = None) -> None:
+        """
+        Constructor.
+
+        :param args: Ghostscript arguments (device and render options), the file permissions are added
+        :param limits: Limits of each job, the cpu time is not limited as the process renders many jobs
+        """
+        root = os.path.join(get_local_path(), '')
+        self._folder = tempfile.mkdtemp(prefix='__server__', dir=get_local_path())
+        self._limits = limits if limits is not None else ProcessLimits()
+        self._process = serve(args + [f'-sOutputFile={os.path.join(self._folder, "page%d.png")}',
+                                      f'--permit-file-read={root}*', f'--permit-file-write={root}*', '-'],
+                              self._limits.memory)
+        self.jobs = 0
+
+    @property
+    def alive(self) -> bool:
+        """
+        :return: True if the process is running
+        """
+        return self._process.poll() is None
+
+    @property
+    def pid(self) -> int:
+        """
+        :return: Process id
+        """
+        return self._process.pid
+
+    def render(self, filename: str, index: int, density: float, output: str, token: Optional[CancelToken] = None,
+               stages: Optional[Stages] = None) -> None:
+        """
+        Render a page of the pdf.
+
+        :param filename: Pdf file, must be within the app local path
+        :param index: Page index (starting at 0)
+        :param density: Resolution (dpi)
+        :param output: Output png
+        :param token: Cancel token, kills the process if the conversion is cancelled
+        :param stages: Stages of the conversion, stores the peak memory of the process
+        """
+        job = next(self._ids)
+        timer: Optional[threading.Timer] = None
+        expired = threading.Event()
+        for f in os.listdir(self._folder):  # Pages of a failed job
+            os.remove(os.path.join(self._folder, f))
+        try:  # Resets the peak memory of the process
+            with open(f'/proc/{self.pid}/clear_refs', 'w') as f:
+                f.write('5')
+        except OSError:
+            pass
+        if token is not None:
+            token.register(self._process)
+        if self._limits.timeout > 0:  # The process is killed, then replaced by the pool
+            timer = threading.Timer(self._limits.timeout, self._expire, (expired,))
+            timer.daemon = True
+            timer.start()
+        try:
+            self._process.stdin.write(
+                f'{{ << /HWResolution [{density} {density}] >> setpagedevice '
+                f'{_ps_string(os.path.abspath(filename))} (r) file runpdfbegin {index + 1} pdfgetpage pdfshowpage '
+                f'runpdfend }} stopped {{ ({_MARKER} {job} ERROR ) print $error /errorname get =only (\\n) print }} '
+                f'{{ ({_MARKER} {job} OK\\n) print }} ifelse flush\n'.encode('utf-8'))
+            self._process.stdin.flush()
+            messages: List[str] = []
+            while True:
+                line = self._process.stdout.readline()
+                if line == b'':  # The process was killed or crashed
+                    if token is not None:
+                        token.check()
+                    if expired.is_set():
+                        raise LimitExceeded('timeout', f'Ghostscript exceeded the timeout of {self._limits.timeout} s')
+                    raise PoolError(f'Ghostscript server stopped: {" ".join(messages)}'.strip())
+                line = line.decode('utf-8', 'replace').strip()
+                if line.startswith(f'{_MARKER} {job} '):
+                    break
+                if line != '':
+                    messages = (messages + [line])[-_MESSAGE_LINES:]
+        except BrokenPipeError:
+            if token is not None:
+                token.check()
+            raise PoolError('Ghostscript server stopped')
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if token is not None:
+                token.unregister(self._process)
+        self.jobs += 1
+        if stages is not None:
+            stages.child(process_memory(self.pid)[1])
+        status = line.split(' ', 3)[2:]
+        if status[0] != 'OK' and status[1:] == ['/VMerror'] and self._limits.memory > 0:
+            raise LimitExceeded('memory', f'Ghostscript exceeded the memory limit of {self._limits.memory} MB')
+        if status[0] != 'OK':
+            raise PoolError(f'Ghostscript failed rendering page {index + 1}: {" ".join(status[1:] + messages)}')
+        pages = os.listdir(self._folder)
+        if len(pages) != 1:
+            raise PoolError(f'Ghostscript wrote {len(pages)} images rendering page {index + 1}')
+        shutil.move(os.path.join(self._folder, pages[0]), output)
+
+    def _expire(self, expired: threading.Event) -> None:
+        """
+        Kill the process, the job exceeded the timeout.
+
+        :param expired: Set before the kill
+        """
+        expired.set()
+        self._process.kill()
+
+    def close(self) -> None:
+        """
+        Stop the process.
+        """
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._process.wait(timeout=5)
+        except Exception:
+            self._process.kill()
+            self._process.wait()
+        shutil.rmtree(self._folder, ignore_errors=True)
+
+
+class RenderPool(object):
+    """
+    Warm Ghostscript processes, shared by the threads of a process. A process is
+    reused by the next job, and replaced after a number of jobs, after a failed
+    job, or if its memory exceeds a limit.
+    """
+
+    def __init__(self, args: List[str], max_jobs: int, max_memory: int = 0,
+                 limits: Optional[ProcessLimits] = None) -> None:
+        """
+        Constructor.
+
+        :param args: Ghostscript arguments of the processes
+        :param max_jobs: Jobs rendered by a process before it is replaced
+        :param max_memory: Memory of a process (MB) that replaces it, if 0 there is no limit
+        :param limits: Limits of each job
+        """
+        self._args = args
+        self._limits = limits
+        self._idle: List[GhostscriptServer] = []
+        self._lock = threading.Lock()
+        self._max_jobs = max_jobs
+        self._max_memory = max_memory * 1024 * 1024
+        self._pid = os.getpid()
+        self._sources = _SourceFiles()
+        self.started = 0
+
+    def render(self, filename: str, index: int, density: float, output: str, token: Optional[CancelToken] = None,
+               stages: Optional[Stages] = None) -> None:
+        """
+        Render a page of the pdf within a warm process.
+
+        :param filename: Pdf file
+        :param index: Page index (starting at 0)
+        :param density: Resolution (dpi)
+        :param output: Output png
+        :param token: Cancel token, kills the process if the conversion is cancelled
+        :param stages: Stages of the conversion, stores the peak memory of the process
+        """
+        with self._lock:
+            server = self._idle.pop() if len(self._idle) > 0 else None
+            if server is None:
+                self.started += 1
+        if server is None:
+            server = GhostscriptServer(self._args, self._limits)
+        failed = True
+        source = self._sources.acquire(filename)
+        try:
+            server.render(source, index, density, output, token, stages)
+            failed = False
+        finally:
+            self._sources.release(source)
+            recycle = failed or not server.alive or server.jobs >= self._max_jobs or \
+                      0 < self._max_memory < process_memory(server.pid)[0]
+            if recycle:
+                server.close()
+            else:
+                with self._lock:
+                    self._idle.append(server)
+
+    def close(self) -> None:
+        """
+        Stop the idle processes. The processes of a forked pool belong to its parent.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        if os.getpid() == self._pid:
+            for server in idle:
+                server.close()
+            self._sources.close()
+
+
+_pools: Dict[Tuple[int, Tuple[str, ...], int, int, Optional[ProcessLimits]], RenderPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(args: List[str], max_jobs: int, max_memory: int = 0,
+             limits: Optional[ProcessLimits] = None) -> RenderPool:
+    """
+    Return the pool of the current process for the Ghostscript arguments.
+
+    :param args: Ghostscript arguments of the processes
+    :param max_jobs: Jobs rendered by a process before it is replaced
+    :param max_memory: Memory of a process (MB) that replaces it, if 0 there is no limit
+    :param limits: Limits of each job
+    :return: Pool
+    """
+    # Forked workers do not reuse the processes of their parent
+    key = os.getpid(), tuple(args), max_jobs, max_memory, limits
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = RenderPool(args, max_jobs, max_memory, limits)
+        return _pools[key]
+
+
+@atexit.register
+def _close_pools() -> None:
+    """
+    Stop the processes of the pools.
+    """
+    for pool in list(_pools.values()):
+        pool.close()
@@ -0,0 +1,190 @@
+"""
+POSTPROCESS
+Raster post-processing of the rendered pages: crop to the content bounds, turn the
+white background into alpha and downsample. The pixels are NumPy arrays processed by
+blocks of rows, thus, there are no operations per pixel and the temporary arrays
+are bounded by the block.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['NUMPY_MODULE', 'content_bounds', 'downsample', 'read_pixels', 'rotate_pixels', 'white_to_alpha',
+           'write_png']
+
+from resources.metrics import Stages
+from resources.png import PngWriter
+from typing import Optional, Tuple
+
+# noinspection PyBroadException
+try:
+    import numpy as np
+    from PIL import Image
+
+    Image.MAX_IMAGE_PIXELS = None  # Rendered plans are larger than the decompression bomb limit
+    NUMPY_MODULE = True
+except:
+    NUMPY_MODULE = False
+
+# Constants
+_BLOCK_ROWS = 512
+_CROP_WHITE = 250  # Opaque pixels at least this white are not content of the crop
+
+
+def _white(block: 'np.ndarray', threshold: int) -> 'np.ndarray':
+    """
+    :param block: RGBA pixels
+    :param threshold: Minimum value of each channel (0-255)
+    :return: Mask of the white pixels
+    """
+    return np.minimum(np.minimum(block[..., 0], block[..., 1]), block[..., 2]) >= threshold
+
+
+def _cost(filtered: 'np.ndarray') -> 'np.ndarray':
+    """
+    :param filtered: Filtered rows
+    :return: Sum of the absolute value of each row, the bytes are signed
+    """
+    return np.minimum(filtered, np.negative(filtered)).sum(axis=1, dtype=np.int64)
+
+
+def read_pixels(filename: str) -> 'np.ndarray':
+    """
+    Decode an image.
+
+    :param filename: Image file
+    :return: RGBA pixels (height, width, 4)
+    """
+    with Image.open(filename) as im:
+        return np.array(im.convert('RGBA'))
+
+
+def rotate_pixels(pixels: 'np.ndarray', angle: float) -> 'np.ndarray':
+    """
+    Rotate an image (clockwise, same as ImageMagick -rotate). Multiples of 90 deg
+    return a view of the pixels, other angles are resampled in memory; the new
+    corners are transparent.
+
+    :param pixels: RGBA pixels
+    :param angle: Angle (deg)
+    :return: Rotated RGBA pixels
+    """
+    angle %= 360
+    if angle % 90 == 0:
+        return np.rot90(pixels, k=-int(angle) // 90)
+    im = Image.fromarray(np.asarray(pixels), 'RGBA')
+    return np.array(im.rotate(-angle, resample=Image.Resampling.BICUBIC, expand=True))
+
+
+def white_to_alpha(pixels: 'np.ndarray', threshold: int) -> None:
+    """
+    Make transparent the pixels whose red, green and blue are at least the threshold.
+
+    :param pixels: RGBA pixels, modified in place
+    :param threshold: Minimum value of each channel (0-255)
+    """
+    for y in range(0, pixels.shape[0], _BLOCK_ROWS):
+        block = pixels[y:y + _BLOCK_ROWS]
+        block[..., 3][_white(block, threshold)] = 0
+
+
+def content_bounds(pixels: 'np.ndarray', white: int = _CROP_WHITE) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Return the bounds of the content, the transparent and white pixels are background.
+
+    :param pixels: RGBA pixels
+    :param white: Minimum value of each channel of a white pixel (0-255)
+    :return: Left, top, right, bottom (exclusive), None if the image is blank
+    """
+    height, width = pixels.shape[:2]
+    rows = np.zeros(height, dtype=bool)
+    cols = np.zeros(width, dtype=bool)
+    for y in range(0, height, _BLOCK_ROWS):
+        block = pixels[y:y + _BLOCK_ROWS]
+        content = (block[..., 3] > 0) & ~_white(block, white)
+        rows[y:y + _BLOCK_ROWS] = content.any(axis=1)
+        cols |= content.any(axis=0)
+    if not rows.any():
+        return None
+    ys, xs = np.flatnonzero(rows), np.flatnonzero(cols)
+    return int(xs[0]), int(ys[0]), int(xs[-1]) + 1, int(ys[-1]) + 1
+
+
+def downsample(pixels: 'np.ndarray', factor: int) -> 'np.ndarray':
+    """
+    Reduce an image by an integer factor, each pixel is the mean of a square of pixels
+    weighted by their alpha; thus, the transparent pixels do not darken the edges.
+    The last row and column of squares are completed with transparent pixels.
+
+    :param pixels: RGBA pixels
+    :param factor: Reduction factor
+    :return: RGBA pixels (ceil(height / factor), ceil(width / factor), 4)
+    """
+    height, width = pixels.shape[:2]
+    out_width = -(-width // factor)
+    out = np.empty((-(-height // factor), out_width, 4), dtype=np.uint8)
+    step = max(1, _BLOCK_ROWS // factor) * factor
+    for y in range(0, height, step):
+        block = pixels[y:y + step]
+        rows = -(-block.shape[0] // factor)
+        target = out[y // factor:y // factor + rows]
+        if block[..., 3].min() == 255:
+            # Opaque, the weights are equal; thus, Pillow averages the squares
+            target[:] = np.asarray(Image.fromarray(np.ascontiguousarray(block), 'RGBA').reduce(factor))
+            # The squares completed with transparent pixels are partially covered
+            edge_width, edge_height = width % factor, block.shape[0] % factor
+            if edge_width > 0:
+                target[:, -1, 3] = int(255 * edge_width / factor + 0.5)
+            if edge_height > 0:
+                target[-1, :, 3] = int(255 * edge_height / factor + 0.5)
+            if edge_width > 0 and edge_height > 0:
+                target[-1, -1, 3] = int(255 * edge_width * edge_height / (factor * factor) + 0.5)
+            continue
+        # Premultiplied by the alpha, each product fits in 16 bits
+        weighted = np.zeros((rows * factor, out_width * factor, 4), dtype=np.uint16)
+        weighted[:block.shape[0], :width] = block
+        for c in range(3):  # Faster than broadcasting the alpha
+            weighted[..., c] *= weighted[..., 3]
+        total = np.zeros((rows, out_width, 4), dtype=np.uint32)
+        for i in range(factor):
+            for j in range(factor):
+                total += weighted[i::factor, j::factor]
+        alpha = total[..., 3].astype(np.float32)
+        inverse = np.divide(1, alpha, out=np.zeros_like(alpha), where=alpha > 0)
+        for c in range(3):
+            target[..., c] = total[..., c] * inverse + 0.5
+        target[..., 3] = alpha * (1 / (factor * factor)) + 0.5
+    return out
+
+
+def write_png(pixels: 'np.ndarray', output: str, level: int = 6, threads: int = 1,
+              stages: Optional[Stages] = None) -> None:
+    """
+    Encode an image as png. Each row is filtered by Sub or Up, the one with the
+    smallest sum of absolute differences (as libpng does).
+
+    :param pixels: RGBA pixels
+    :param output: Output png
+    :param level: Zlib compression level
+    :param threads: Number of compression threads
+    :param stages: Stages of the conversion, times the encode
+    """
+    stages = stages if stages is not None else Stages()
+    height, width = pixels.shape[:2]
+    previous = None
+    with PngWriter(output, width, height, level, threads, stages) as png:
+        for y in range(0, height, _BLOCK_ROWS):
+            with stages.stage('encode'):
+                # The pixels may be a view (e.g. cropped or rotated), only the block is copied
+                block = np.ascontiguousarray(pixels[y:y + _BLOCK_ROWS]).reshape(-1, width * 4)
+                sub = block.copy()
+                sub[:, 4:] -= block[:, :-4]  # Wraps modulo 256
+                up = block.copy()
+                if previous is not None:
+                    up[0] -= previous
+                up[1:] -= block[:-1]
+                previous = block[-1]
+                use_up = _cost(up) < _cost(sub)
+                filtered = np.where(use_up[:, None], up, sub)
+                kinds = np.where(use_up, 2, 1).astype(np.uint8)
+                rows = np.concatenate([kinds[:, None], filtered], axis=1).tobytes()
+            png.write_block(rows)
@@ -0,0 +1,38 @@
+"""
+PREVIEW
+Displays the rendered previews within the Tk windows.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['preview_photo']
+
+import base64
+import io
+import math
+from resources.raster import PIL_MODULE
+from tkinter import Misc, PhotoImage
+
+if PIL_MODULE:
+    from PIL import Image
+
+
+def preview_photo(master: Misc, data: bytes, size: int) -> PhotoImage:
+    """
+    Create the photo of a preview that fits a square. Pillow downsamples it with a
+    filter, which keeps the thin lines of the plans; otherwise Tk skips pixels.
+
+    :param master: Widget that owns the photo
+    :param data: Png data
+    :param size: Maximum width/height of the photo (px)
+    :return: Photo
+    """
+    if PIL_MODULE:
+        im = Image.open(io.BytesIO(data))
+        im.thumbnail((size, size), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        im.save(buffer, format='PNG', compress_level=1)
+        data = buffer.getvalue()
+    photo = PhotoImage(master=master, data=base64.b64encode(data))
+    factor = math.ceil(max(photo.width(), photo.height()) / size)
+    return photo.subsample(factor) if factor > 1 else photo
@@ -0,0 +1,99 @@
+"""
+PYRAMID
+Multi-resolution outputs of a page rendered once. The levels are derived from the
+image by successive 2x downsampling, then written as smaller images and as a Deep
+Zoom (DZI) tile tree; the tiles are encoded in parallel.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['pyramid_levels', 'resize_width', 'write_dzi']
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from resources.postprocess import downsample, write_png
+from typing import Any, Dict, List
+
+# noinspection PyBroadException
+try:
+    import numpy as np
+    from PIL import Image
+
+    Image.MAX_IMAGE_PIXELS = None  # Rendered plans are larger than the decompression bomb limit
+except:
+    pass
+
+# Constants
+_TILE_OVERLAP = 1  # Pixels shared by neighbour tiles, the viewers do not show seams
+
+
+def pyramid_levels(pixels: 'np.ndarray') -> List['np.ndarray']:
+    """
+    Return the levels of an image, from the image itself down to a single pixel.
+    Each level is half of the previous one (rounded up), as Deep Zoom defines them.
+
+    :param pixels: RGBA pixels, the first level (not copied)
+    :return: Levels, the largest first
+    """
+    levels = [pixels]
+    while max(levels[-1].shape[:2]) > 1:
+        levels.append(downsample(levels[-1], 2))
+    return levels
+
+
+def resize_width(levels: List['np.ndarray'], width: int) -> 'np.ndarray':
+    """
+    Resize an image to a width, keeping its aspect ratio. The smallest level at least
+    as wide is resampled, thus, the reduction is at most 2x.
+
+    :param levels: Levels of the image, the largest first
+    :param width: Width (px), at most the width of the image
+    :return: RGBA pixels
+    """
+    source = next(p for p in reversed(levels) if p.shape[1] >= width)
+    if source.shape[1] == width:
+        return source
+    height = max(1, round(source.shape[0] * width / source.shape[1]))
+    im = Image.fromarray(np.ascontiguousarray(source), 'RGBA')
+    return np.array(im.resize((width, height), Image.Resampling.LANCZOS))
+
+
+def write_dzi(levels: List['np.ndarray'], output: str, tile_size: int, level: int = 6,
+              workers: int = 1) -> Dict[str, Any]:
+    """
+    Write a Deep Zoom image: the descriptor and the png tiles of each level, stored
+    as <name>_files/<level>/<column>_<row>.png. The level 0 is a single pixel.
+
+    :param levels: Levels of the image, the largest first
+    :param output: Descriptor (.dzi)
+    :param tile_size: Size of the tiles (px), without the overlap
+    :param level: Zlib compression level
+    :param workers: Number of threads encoding the tiles
+    :return: Description of the tiles
+    """
+    folder = os.path.splitext(output)[0] + '_files'
+    tiles = []
+    for i, pixels in enumerate(reversed(levels)):
+        path = os.path.join(folder, str(i))
+        os.makedirs(path, exist_ok=True)
+        height, width = pixels.shape[:2]
+        for row in range(-(-height // tile_size)):
+            y0, y1 = max(0, row * tile_size - _TILE_OVERLAP), min(height, (row + 1) * tile_size + _TILE_OVERLAP)
+            for col in range(-(-width // tile_size)):
+                x0, x1 = max(0, col * tile_size - _TILE_OVERLAP), min(width, (col + 1) * tile_size + _TILE_OVERLAP)
+                tiles.append((pixels[y0:y1, x0:x1], os.path.join(path, f'{col}_{row}.png')))
+
+    # The compression releases the GIL, thus, the threads use all cores
+    with ThreadPoolExecutor(max(1, workers)) as executor:
+        for _ in executor.map(lambda t: write_png(t[0], t[1], level), tiles):
+            pass
+
+    height, width = levels[0].shape[:2]
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="png" '
+                f'Overlap="{_TILE_OVERLAP}" TileSize="{tile_size}">\n'
+                f'  <Size Width="{width}" Height="{height}"/>\n'
+                '</Image>\n')
+    return {'file': os.path.basename(output), 'format': 'png', 'tile_size': tile_size, 'overlap': _TILE_OVERLAP,
+            'levels': len(levels), 'tiles': len(tiles)}
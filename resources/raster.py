@@ -0,0 +1,47 @@
+"""
+RASTER
+In-memory raster operations applied to the rendered pages.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['PIL_MODULE', 'rotate_png']
+
+import io
+from resources.metrics import Stages
+from typing import Optional
+
+# noinspection PyBroadException
+try:
+    from PIL import Image
+
+    Image.MAX_IMAGE_PIXELS = None  # Rendered plans are larger than the decompression bomb limit
+    PIL_MODULE = True
+except:
+    PIL_MODULE = False
+
+
+def rotate_png(data: bytes, angle: float, output: str, level: int = 6, stages: Optional[Stages] = None) -> None:
+    """
+    Rotate a png (clockwise, same as ImageMagick -rotate) and save it. Multiples of
+    90 deg are transposed without resampling, other angles are resampled once; the
+    new corners are transparent.
+
+    :param data: Png data
+    :param angle: Angle (deg)
+    :param output: Output png
+    :param level: Zlib compression level
+    :param stages: Stages of the conversion, times the rotate (including the decode) and the encode
+    """
+    stages = stages if stages is not None else Stages()
+    with stages.stage('rotate'):
+        im = Image.open(io.BytesIO(data))
+        angle %= 360
+        if angle % 90 == 0:
+            method = {90: Image.Transpose.ROTATE_270, 180: Image.Transpose.ROTATE_180, 270: Image.Transpose.ROTATE_90}
+            if angle != 0:
+                im = im.transpose(method[int(angle)])
+        else:
+            im = im.convert('RGBA').rotate(-angle, resample=Image.Resampling.BICUBIC, expand=True)
+    with stages.stage('encode'):
+        im.save(output, format='PNG', compress_level=level)
@@ -0,0 +1,125 @@
+"""
+RAWIMAGE
+Raw RGBA intermediate of the conversion stages. The image is a PAM file, a short
+text header followed by the uncompressed pixels, which is memory-mapped; thus, the
+stages work on the pixels in place, and the operating system pages them to disk
+instead of holding the whole image in memory. ImageMagick writes it directly.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['create_raw', 'open_raw', 'pam_header', 'raw_from_png', 'read_pam_header']
+
+import io
+from resources.png import png_from_rows, read_png_rows
+from typing import BinaryIO, List, Tuple, Union
+
+# noinspection PyBroadException
+try:
+    import numpy as np
+    from PIL import Image
+
+    Image.MAX_IMAGE_PIXELS = None  # Rendered plans are larger than the decompression bomb limit
+except:
+    pass
+
+# Constants
+_BLOCK_SIZE = 16 * 1024 * 1024  # Rows unfiltered at once (bytes)
+_MAX_HEADER = 1024
+
+
+def pam_header(width: int, height: int) -> bytes:
+    """
+    :param width: Width (px)
+    :param height: Height (px)
+    :return: Header of an 8-bit RGBA pam image
+    """
+    return f'P7\nWIDTH {width}\nHEIGHT {height}\nDEPTH 4\nMAXVAL 255\nTUPLTYPE RGB_ALPHA\nENDHDR\n'.encode('ascii')
+
+
+def read_pam_header(head: bytes) -> Tuple[int, int, int]:
+    """
+    Parse the header of an 8-bit RGBA pam image.
+
+    :param head: First bytes of the image, at least the header
+    :return: Width, height (px) and size of the header (bytes)
+    """
+    end = head.find(b'ENDHDR\n', 0, _MAX_HEADER)
+    if not head.startswith(b'P7\n') or end < 0:
+        raise ValueError('Invalid pam header')
+    fields = {}
+    for line in head[:end].decode('ascii').splitlines()[1:]:
+        if line.strip() != '' and not line.startswith('#'):
+            key, _, value = line.partition(' ')
+            fields[key] = value.strip()
+    if fields.get('DEPTH') != '4' or fields.get('MAXVAL') != '255':
+        raise ValueError('Invalid pam header, expected 8-bit RGBA pixels')
+    return int(fields['WIDTH']), int(fields['HEIGHT']), end + len(b'ENDHDR\n')
+
+
+def create_raw(filename: str, width: int, height: int) -> 'np.memmap':
+    """
+    Create a raw image, the pixels are zero (transparent).
+
+    :param filename: Raw image file
+    :param width: Width (px)
+    :param height: Height (px)
+    :return: Memory-mapped RGBA pixels (height, width, 4)
+    """
+    header = pam_header(width, height)
+    with open(filename, 'wb') as f:
+        f.write(header)
+        f.truncate(len(header) + width * height * 4)  # Sparse, the pages are allocated as they are written
+    return np.memmap(filename, dtype=np.uint8, mode='r+', offset=len(header), shape=(height, width, 4))
+
+
+def open_raw(filename: str, mode: str = 'r+') -> 'np.memmap':
+    """
+    Map a raw image.
+
+    :param filename: Raw image file
+    :param mode: Memory map mode, r+ writes the changes to the file
+    :return: Memory-mapped RGBA pixels (height, width, 4)
+    """
+    with open(filename, 'rb') as f:
+        width, height, offset = read_pam_header(f.read(_MAX_HEADER))
+    return np.memmap(filename, dtype=np.uint8, mode=mode, offset=offset, shape=(height, width, 4))
+
+
+def _unfilter(pixels: 'np.memmap', top: int, prior: bytes, rows: List[bytes]) -> None:
+    """
+    Unfilter a block of png rows into a raw image. The rows are decoded by Pillow as
+    a png whose first row is the last decoded one, as the filters refer to it.
+
+    :param pixels: Raw image
+    :param top: First row of the block
+    :param prior: Unfiltered row above the block
+    :param rows: Filtered rows
+    """
+    data = png_from_rows(pixels.shape[1], len(rows) + 1, b'\x00' + prior + b''.join(rows), level=0)
+    with Image.open(io.BytesIO(data)) as im:
+        pixels[top:top + len(rows)] = np.asarray(im)[1:]
+
+
+def raw_from_png(source: Union[str, BinaryIO], output: str) -> 'np.memmap':
+    """
+    Decode a 8-bit RGBA png into a raw image. The rows are streamed into the memory
+    map by blocks, thus, neither the png nor the pixels are held in memory.
+
+    :param source: Png file or binary stream (e.g. a pipe)
+    :param output: Raw image file
+    :return: Memory-mapped RGBA pixels (height, width, 4)
+    """
+    width, height, rows = read_png_rows(source)
+    pixels = create_raw(output, width, height)
+    block_rows = max(1, _BLOCK_SIZE // (width * 4))
+    top, prior, block = 0, bytes(width * 4), []  # The first row is predicted from a row of zeros
+    for row in rows:
+        block.append(row)
+        if len(block) == block_rows or top + len(block) == height:
+            _unfilter(pixels, top, prior, block)
+            top += len(block)
+            prior, block = pixels[top - 1].tobytes(), []
+    if top != height:
+        raise ValueError(f'Truncated png, decoded {top} of {height} rows')
+    return pixels
@@ -0,0 +1,374 @@
+"""
+SERVER
+Local HTTP conversion service, several front-ends share the same render queue.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['ConversionServer']
+
+import json
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from resources.backends import BACKENDS
+from resources.converter import PageJob, parse_page_range
+from resources.formats import FORMATS
+from resources.pdfinfo import PdfError, read_pages
+from resources.png import COMPRESSION_PROFILES
+from resources.utils import get_local_path, make_path_if_not_exists, print_console
+from resources.worker import ConversionJob, ConversionWorker, JOB_FAILED, JOB_QUEUED, JOB_RUNNING
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+
+# Constants
+_CHUNK_SIZE = 1024 * 1024
+_RE_JOB = re.compile(r'^/jobs/(\d+)$')
+_RE_IMAGE = re.compile(r'^/jobs/(\d+)/images/(\d+)$')
+_RETRY_AFTER = 5  # Suggested wait of a client if the queue is full (s)
+
+
+class ConversionServer(object):
+    """
+    Serves the conversion queue through HTTP:
+
+    - POST /jobs: queue a pdf, the body is the pdf (application/pdf) or a json
+      object with its path ({"path": "..."}). The conversion settings are given
+      as query parameters (maxwidth, angle, pages, backend, tiled, compression, format,
+      crop, white); the service does not write derivatives, sizes or tiles.
+      The images of a path are written next to the pdf, if they exist the request
+      is rejected with 409 unless the overwrite parameter is given.
+      Returns 202 and the job, or 429 if the queue is full.
+    - GET /jobs/<id>: state of a job.
+    - GET /jobs/<id>/images/<n>: image of the n-th converted page (starting at 1).
+    - DELETE /jobs/<id>: cancel a job.
+    - GET /status: state of the queue.
+    """
+
+    def __init__(
+            self,
+            lang: Dict[str, str],
+            conversion: Dict[str, Union[int, float, str]],
+            options: Dict[str, Any],
+            host: str = '127.0.0.1',
+            port: int = 8600,
+            workers: int = 1,
+            queue_size: int = 16,
+            keep_jobs: int = 100,
+            max_upload: int = 256,
+            printer: Optional[Callable[..., None]] = None
+    ) -> None:
+        """
+        Constructor.
+
+        :param lang: Language dict
+        :param conversion: Default conversion settings, replaced by the query parameters of each job
+        :param options: Converter options (memory_limit, cache_size, ...)
+        :param host: Address of the server, only local by default
+        :param port: Port of the server
+        :param workers: Number of concurrent conversions
+        :param queue_size: Maximum number of queued jobs
+        :param keep_jobs: Number of finished jobs kept for the clients, the older ones are removed
+        :param max_upload: Maximum size of an uploaded pdf (MB)
+        :param printer: Print function, uses the same signature as App._print
+        """
+        self._conversion = dict(conversion)
+        self._folder = make_path_if_not_exists(os.path.join(get_local_path(), 'server'))
+        self._keep_jobs = keep_jobs
+        self._lang = lang
+        self._lock = threading.Lock()
+        self._max_upload = max_upload * 1024 * 1024
+        self._print = printer if printer is not None else print_console
+        self._uploads: Dict[int, str] = {}  # Job id -> folder of the uploaded pdf
+        self._worker = ConversionWorker(lang, options, workers, queue_size)
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """
+        :return: Host and port of the server
+        """
+        return self._httpd.server_address[0], self._httpd.server_address[1]
+
+    def _job_settings(self, query: Dict[str, List[str]]) -> Dict[str, Union[int, float, str]]:
+        """
+        Return the conversion settings of a job.
+
+        :param query: Query parameters
+        :return: Conversion settings
+        :raises ValueError: If a parameter is not valid
+        """
+        conversion = dict(self._conversion)
+        value = {k: v[-1] for k, v in query.items()}
+        if 'maxwidth' in value:
+            conversion['MAXWIDTH'] = int(value['maxwidth'])
+            if conversion['MAXWIDTH'] <= 0:
+                raise ValueError(f'Invalid maxwidth "{value["maxwidth"]}"')
+        if 'angle' in value:
+            conversion['ANGLE'] = float(value['angle'])
+        if 'pages' in value:
+            parse_page_range(value['pages'], 1)
+            conversion['PAGES'] = value['pages']
+        if 'backend' in value:
+            if value['backend'] not in BACKENDS:
+                raise ValueError(f'Invalid backend "{value["backend"]}", valid: {", ".join(BACKENDS.keys())}')
+            conversion['BACKEND'] = value['backend']
+        if 'tiled' in value:
+            conversion['TILED'] = value['tiled'].lower() in ('1', 'true', 'yes')
+        if 'compression' in value:
+            if value['compression'] not in COMPRESSION_PROFILES:
+                raise ValueError(f'Invalid compression "{value["compression"]}", '
+                                 f'valid: {", ".join(COMPRESSION_PROFILES.keys())}')
+            conversion['COMPRESSION'] = value['compression']
+        if 'format' in value:
+            if value['format'] not in FORMATS:
+                raise ValueError(f'Invalid format "{value["format"]}", valid: {", ".join(FORMATS.keys())}')
+            conversion['FORMAT'] = value['format']
+        if 'crop' in value:
+            conversion['CROP'] = value['crop'].lower() in ('1', 'true', 'yes')
+        if 'white' in value:
+            conversion['WHITE'] = int(value['white'])
+            if not 0 <= conversion['WHITE'] <= 255:
+                raise ValueError(f'Invalid white "{value["white"]}"')
+        conversion['DERIVATIVES'] = []  # Not served
+        conversion['SIZES'] = []
+        conversion['TILE_SIZE'] = 0
+        return conversion
+
+    def _describe(self, job: ConversionJob) -> Dict[str, Any]:
+        """
+        :param job: Job
+        :return: Json description of a job
+        """
+        return {'id': job.id, 'file': os.path.basename(job.filename), 'state': job.state, 'error': job.error,
+                'images': [f'/jobs/{job.id}/images/{i + 1}' for i in range(len(job.images))],
+                'conversion': job.conversion}
+
+    def _status(self) -> Dict[str, Any]:
+        """
+        :return: Json description of the queue
+        """
+        jobs = list(self._worker.jobs)
+        return {'queued': sum(1 for j in jobs if j.state == JOB_QUEUED),
+                'running': sum(1 for j in jobs if j.state == JOB_RUNNING), 'jobs': len(jobs)}
+
+    @staticmethod
+    def _existing(filename: str, conversion: Dict[str, Union[int, float, str]]) -> List[str]:
+        """
+        Return the images of a pdf that already exist.
+
+        :param filename: Pdf file
+        :param conversion: Conversion settings
+        :return: Existing images
+        """
+        try:
+            pages = read_pages(filename)
+            selected = parse_page_range(str(conversion.get('PAGES', '')), len(pages))
+        except PdfError:  # The job fails with the error
+            return []
+        extension = FORMATS[str(conversion.get('FORMAT', 'png'))].extension
+        images = [PageJob(filename, i, len(pages), pages[i], extension=extension).final_image for i in selected]
+        return [i for i in images if os.path.exists(i)]
+
+    def submit(
+            self,
+            filename: str,
+            conversion: Dict[str, Union[int, float, str]],
+            upload: str = '',
+            overwrite: bool = False
+    ) -> ConversionJob:
+        """
+        Queue a pdf, the finished jobs exceeding the number of kept jobs are removed.
+
+        :param filename: Pdf file
+        :param conversion: Conversion settings
+        :param upload: Folder of the uploaded pdf, removed with the job
+        :param overwrite: Replace the existing images of the pdf
+        :return: Job
+        :raises queue.Full: If the queue is full
+        """
+        with self._lock:
+            finished = [j for j in self._worker.jobs if j.state not in (JOB_QUEUED, JOB_RUNNING)]
+            for j in finished[:max(0, len(finished) - self._keep_jobs + 1)]:
+                self._worker.remove(j)
+                if j.id in self._uploads:
+                    shutil.rmtree(self._uploads.pop(j.id), ignore_errors=True)
+            job = self._worker.submit(filename, conversion, {'overwrite': overwrite})
+            if upload != '':
+                self._uploads[job.id] = upload
+            return job
+
+    def _log(self) -> None:
+        """
+        Print the progress of the conversions.
+        """
+        while True:
+            kind, data = self._worker.events.get()
+            if kind == 'print':
+                self._print(*data)
+            elif kind == 'state':
+                job, state = data
+                self._print(self._lang['SERVER_JOB_STATE'].format(job.id, os.path.basename(job.filename), state),
+                            hour=True)
+                if state == JOB_FAILED:
+                    self._print(job.error)
+
+    def _handler(self) -> type:
+        """
+        :return: Request handler class bound to the server
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """
+            Handles the requests of the service.
+            """
+            protocol_version = 'HTTP/1.1'
+
+            # noinspection PyShadowingBuiltins
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def _json(self, code: int, data: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _error(self, code: int, msg: str, headers: Optional[Dict[str, str]] = None) -> None:
+                self._json(code, {'error': msg}, headers)
+
+            def _job(self, path: str) -> Optional[ConversionJob]:
+                m = _RE_JOB.match(path) or _RE_IMAGE.match(path)
+                job = server._worker.get(int(m.group(1))) if m is not None else None
+                if job is None:
+                    self._error(404, 'Job not found')
+                return job
+
+            def do_GET(self) -> None:
+                path = urlsplit(self.path).path
+                if path == '/status':
+                    return self._json(200, server._status())
+                if _RE_JOB.match(path):
+                    job = self._job(path)
+                    if job is not None:
+                        self._json(200, server._describe(job))
+                    return
+                m = _RE_IMAGE.match(path)
+                if m is None:
+                    return self._error(404, 'Not found')
+                job = self._job(path)
+                if job is None:
+                    return
+                n = int(m.group(2))
+                if job.state in (JOB_QUEUED, JOB_RUNNING):
+                    return self._error(409, f'Job is {job.state}')
+                if not 1 <= n <= len(job.images) or not os.path.isfile(job.images[n - 1]):
+                    return self._error(404, 'Image not found')
+                # The image is streamed by chunks, it is not held in memory
+                with open(job.images[n - 1], 'rb') as f:
+                    self.send_response(200)
+                    self.send_header('Content-Type', FORMATS[job.conversion.get('FORMAT', 'png')].mime)
+                    self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+                    self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(f.name)}"')
+                    self.end_headers()
+                    shutil.copyfileobj(f, self.wfile, _CHUNK_SIZE)
+
+            def do_POST(self) -> None:
+                url = urlsplit(self.path)
+                if url.path != '/jobs':
+                    self.close_connection = True
+                    return self._error(404, 'Not found')
+                length = int(self.headers.get('Content-Length', 0))
+                if length > server._max_upload:
+                    self.close_connection = True
+                    return self._error(413, 'Pdf exceeds the upload limit')
+                try:
+                    conversion = server._job_settings(parse_qs(url.query))
+                except ValueError as e:
+                    self.close_connection = True
+                    return self._error(400, str(e))
+                if server._worker.pending >= server._worker.max_queued > 0:  # Before reading the upload
+                    self.close_connection = True
+                    return self._error(429, 'Queue is full', {'Retry-After': str(_RETRY_AFTER)})
+                content = self.headers.get('Content-Type', '').split(';')[0].strip()
+                upload = ''
+                overwrite = parse_qs(url.query).get('overwrite', ['0'])[-1].lower() in ('1', 'true', 'yes')
+                if content == 'application/json':
+                    try:
+                        filename = os.path.abspath(str(json.loads(self.rfile.read(length))['path']))
+                    except (ValueError, KeyError, TypeError):
+                        return self._error(400, 'Invalid json, expected {"path": "..."}')
+                    if not os.path.isfile(filename) or not filename.lower().endswith('.pdf'):
+                        return self._error(400, f'Pdf "{filename}" not found')
+                    existing = [] if overwrite else server._existing(filename, conversion)
+                    if len(existing) > 0:
+                        names = ', '.join(os.path.basename(i) for i in existing)
+                        return self._error(409, f'Images already exist ({names}), use overwrite=1 to replace them')
+                elif content == 'application/pdf':
+                    name = os.path.basename(parse_qs(url.query).get('name', ['upload.pdf'])[-1]) or 'upload.pdf'
+                    if not name.lower().endswith('.pdf'):
+                        name += '.pdf'
+                    upload = make_path_if_not_exists(os.path.join(server._folder, f'{time.time_ns()}'))
+                    filename = os.path.join(upload, name)
+                    with open(filename, 'wb') as f:
+                        remaining = length
+                        while remaining > 0:
+                            chunk = self.rfile.read(min(_CHUNK_SIZE, remaining))
+                            if chunk == b'':
+                                break
+                            f.write(chunk)
+                            remaining -= len(chunk)
+                    if remaining > 0:
+                        shutil.rmtree(upload, ignore_errors=True)
+                        return self._error(400, 'Incomplete upload')
+                else:
+                    self.close_connection = True
+                    return self._error(415, 'Expected application/pdf or application/json')
+                try:
+                    job = server.submit(filename, conversion, upload, overwrite)
+                except queue.Full:
+                    if upload != '':
+                        shutil.rmtree(upload, ignore_errors=True)
+                    return self._error(429, 'Queue is full', {'Retry-After': str(_RETRY_AFTER)})
+                self._json(202, server._describe(job), {'Location': f'/jobs/{job.id}'})
+
+            def do_DELETE(self) -> None:
+                path = urlsplit(self.path).path
+                if not _RE_JOB.match(path):
+                    return self._error(404, 'Not found')
+                job = self._job(path)
+                if job is not None:
+                    server._worker.cancel(job)
+                    self._json(202, server._describe(job))
+
+        return Handler
+
+    def serve(self, stop: Optional[threading.Event] = None) -> None:
+        """
+        Serve the requests until the stop event is set.
+
+        :param stop: Stop event
+        """
+        threading.Thread(target=self._log, daemon=True).start()
+        host, port = self.address
+        self._print(self._lang['SERVER_START'].format(host, port), hour=True)
+        if stop is not None:
+            threading.Thread(target=lambda: stop.wait() or self._httpd.shutdown(), daemon=True).start()
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._httpd.server_close()
+            self._worker.close()
+            self._print(self._lang['SERVER_STOP'], hour=True)
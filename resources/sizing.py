@@ -0,0 +1,58 @@
+"""
+SIZING
+Computes the render resolution from the exact page size, thus, the image has the
+requested size within a single render, without resampling it afterwards.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['output_extent', 'render_density', 'render_size']
+
+import math
+from resources.pdfinfo import PdfPage
+from typing import Tuple
+
+# Constants
+_POINTS_PER_INCH = 72
+
+
+def output_extent(page: PdfPage, angle: float = 0) -> Tuple[float, float]:
+    """
+    Return the size of the converted image in points, that is, the bounding box
+    of the rendered page (which considers the page rotation) rotated by the angle.
+
+    :param page: Page
+    :param angle: Rotation angle of the image (deg)
+    :return: Width, height (points)
+    """
+    w, h = page.width, page.height
+    if angle % 90 == 0:  # Exact, avoids the rounding of sin/cos
+        return (h, w) if angle % 180 == 90 else (w, h)
+    a = math.radians(angle)
+    c, s = abs(math.cos(a)), abs(math.sin(a))
+    return w * c + h * s, w * s + h * c
+
+
+def render_density(page: PdfPage, maxwidth: int, angle: float = 0) -> float:
+    """
+    Return the resolution whose image has its largest side equal to the maximum
+    width. The resolution is fractional, the rasterizers accept it.
+
+    :param page: Page
+    :param maxwidth: Maximum width/height of the image (px)
+    :param angle: Rotation angle of the image (deg)
+    :return: Resolution (dpi)
+    """
+    return abs(maxwidth) * _POINTS_PER_INCH / max(output_extent(page, angle))
+
+
+def render_size(page: PdfPage, density: float) -> Tuple[int, int]:
+    """
+    Return the size of the rendered page, rounded as Ghostscript sizes its device.
+
+    :param page: Page
+    :param density: Resolution (dpi)
+    :return: Width, height (px)
+    """
+    return (int(page.width * density / _POINTS_PER_INCH + 0.5),
+            int(page.height * density / _POINTS_PER_INCH + 0.5))
@@ -4,13 +4,35 @@ UTILS
 Author: Pablo Pizarro R. @ ppizarror.com
 """
 
-__all__ = ['Cd', 'get_local_path']
+__all__ = ['CancelToken', 'Cd', 'ConversionCancelled', 'LimitExceeded', 'ProcessLimits', 'acall', 'call',
+           'get_local_path', 'pipe', 'print_console', 'serve']
 
+import asyncio
 import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from resources.metrics import Stages
+from typing import BinaryIO, Callable, Iterator, List, NamedTuple, Optional, Set, Union
+
+try:
+    import resource
+
+    RESOURCE_MODULE = hasattr(resource, 'prlimit')  # Linux only
+except ImportError:
+    resource = None
+    RESOURCE_MODULE = False
 
 # Constants
 CREATE_NO_WINDOW = 0x08000000
+_CPU_GRACE = 5  # Time between the cpu limit signal and the kill (s)
+_MEMORY_ERRORS = (b'VMerror', b'memory allocation failed', b'cache resources exhausted', b'bad_alloc',
+                  b'Cannot allocate memory', b'out of memory')
 
 
 class Cd(object):
@@ -29,6 +51,366 @@ class Cd(object):
         os.chdir(self.savedPath)
 
 
+class ConversionCancelled(Exception):
+    """
+    The conversion was cancelled by the user.
+    """
+
+
+def _kill(p: Union[subprocess.Popen, asyncio.subprocess.Process]) -> None:
+    """
+    Kill a program, it may have finished already.
+
+    :param p: Process
+    """
+    try:
+        p.kill()
+    except ProcessLookupError:
+        pass
+
+
+class LimitExceeded(Exception):
+    """
+    An external program exceeded a limit, the status is timeout, memory or cpu.
+    """
+
+    def __init__(self, status: str, message: str) -> None:
+        """
+        Constructor.
+
+        :param status: Exceeded limit
+        :param message: Message
+        """
+        super().__init__(message)
+        self.status = status
+
+
+class ProcessLimits(NamedTuple):
+    """
+    Limits of each external program, 0 disables a limit. The memory and cpu
+    limits are only applied on Linux.
+    """
+    timeout: float = 0  # Wall-clock time (s)
+    memory: int = 0  # Address space (MB)
+    cpu: int = 0  # Cpu time (s)
+    disk: int = 0  # Disk used by the ImageMagick pixel cache (MB)
+
+
+def _child_limits(memory: int = 0, cpu: int = 0) -> Optional[Callable[[], None]]:
+    """
+    Return the function that limits the address space and the cpu time of a new
+    process, only available on Linux. It runs within the child before the program
+    starts, thus, the program never runs without its limits.
+
+    :param memory: Address space (MB), if 0 there is no limit
+    :param cpu: Cpu time (s), if 0 there is no limit
+    :return: Function run by the child (preexec_fn), None if there are no limits
+    """
+    if not RESOURCE_MODULE or (memory <= 0 and cpu <= 0):
+        return None  # Without a preexec_fn the process is spawned faster
+    limits = []
+    if memory > 0:
+        limits.append((resource.RLIMIT_AS, (memory * 1024 * 1024, memory * 1024 * 1024)))
+    if cpu > 0:  # The process receives SIGXCPU, then it is killed after the grace time
+        limits.append((resource.RLIMIT_CPU, (cpu, cpu + _CPU_GRACE)))
+
+    def _limit() -> None:
+        # Only calls setrlimit, the child of a threaded process must not take locks
+        for kind, limit in limits:
+            try:
+                resource.setrlimit(kind, limit)
+            except (OSError, ValueError):  # Greater than the hard limit, the program keeps the lower one
+                pass
+
+    return _limit
+
+
+class _Limiter(object):
+    """
+    Applies the limits to an external program, then classifies its exit. The
+    errors of the program are stored to detect a failed allocation.
+    """
+
+    def __init__(self, limits: Optional[ProcessLimits]) -> None:
+        """
+        Constructor.
+
+        :param limits: Limits of the program
+        """
+        self._limits = limits if limits is not None else ProcessLimits()
+        self._timer: Optional[threading.Timer] = None
+        self.expired = False
+        self.preexec_fn = _child_limits(self._limits.memory, self._limits.cpu)
+        self.stderr = tempfile.TemporaryFile() if self._limits.memory > 0 else None
+
+    def start(self, p: Union[subprocess.Popen, asyncio.subprocess.Process], timer: bool = True) -> None:
+        """
+        Start the timeout of a started program, the other limits are set by preexec_fn.
+
+        :param p: Process
+        :param timer: Kill the program once the timeout expires, asyncio uses its own timeout
+        """
+        if timer and self._limits.timeout > 0:
+            self._timer = threading.Timer(self._limits.timeout, self.expire, (p,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def expire(self, p: Union[subprocess.Popen, asyncio.subprocess.Process]) -> None:
+        """
+        Kill the program, it exceeded the timeout.
+
+        :param p: Process
+        """
+        self.expired = True
+        _kill(p)
+
+    def stop(self, args: List[str], returncode: int, cpu_time: float = 0) -> Optional[LimitExceeded]:
+        """
+        Stop the timer, then check if the finished program exceeded a limit.
+
+        :param args: Program arguments
+        :param returncode: Exit code, negative if killed by a signal
+        :param cpu_time: Cpu time used by the program (s), 0 if not available
+        :return: Exceeded limit, None if the program was within the limits
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+        errors = b''
+        if self.stderr is not None:
+            self.stderr.seek(0)
+            errors = self.stderr.read()
+            self.stderr.close()
+            if errors != b'' and sys.stderr is not None:  # The errors are still shown
+                sys.stderr.buffer.write(errors)
+                sys.stderr.flush()
+        name, limits = os.path.basename(args[0]), self._limits
+        if self.expired:
+            return LimitExceeded('timeout', f'{name} exceeded the timeout of {limits.timeout} s')
+        if limits.cpu > 0 and hasattr(signal, 'SIGXCPU') and \
+                (returncode == -signal.SIGXCPU or (returncode == -signal.SIGKILL and cpu_time >= limits.cpu)):
+            return LimitExceeded('cpu', f'{name} exceeded the cpu time limit of {limits.cpu} s')
+        if limits.memory > 0 and returncode != 0 and \
+                (any(e in errors for e in _MEMORY_ERRORS) or returncode in (-signal.SIGSEGV, -signal.SIGABRT)):
+            return LimitExceeded('memory', f'{name} exceeded the memory limit of {limits.memory} MB')
+        return None
+
+
+class CancelToken(object):
+    """
+    Cancels a conversion from another thread, the running external programs are killed.
+    """
+
+    def __init__(self) -> None:
+        """
+        Constructor.
+        """
+        self._lock = threading.Lock()
+        self._processes: Set[Union[subprocess.Popen, asyncio.subprocess.Process]] = set()
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """
+        Cancel the conversion.
+        """
+        with self._lock:
+            self.cancelled = True
+            for p in self._processes:
+                _kill(p)
+
+    def check(self) -> None:
+        """
+        Raise if the conversion was cancelled.
+        """
+        if self.cancelled:
+            raise ConversionCancelled()
+
+    def register(self, p: Union[subprocess.Popen, asyncio.subprocess.Process]) -> None:
+        """
+        Register a running program, it is killed if the conversion was already cancelled.
+
+        :param p: Process
+        """
+        with self._lock:
+            self._processes.add(p)
+            if self.cancelled:
+                _kill(p)
+
+    def unregister(self, p: Union[subprocess.Popen, asyncio.subprocess.Process]) -> None:
+        """
+        Unregister a finished program.
+
+        :param p: Process
+        """
+        with self._lock:
+            self._processes.discard(p)
+
+
+def _popen(args: List[str], stdout: Optional[int], token: Optional[CancelToken], stdin: Optional[int] = None,
+           limiter: Optional[_Limiter] = None, preexec_fn: Optional[Callable[[], None]] = None) -> subprocess.Popen:
+    """
+    Start an external program without spawning a shell.
+
+    :param args: Program arguments
+    :param stdout: Standard output
+    :param token: Cancel token
+    :param stdin: Standard input
+    :param limiter: Limits of the program
+    :param preexec_fn: Function run by the child before the program, replaced by the one of the limiter
+    :return: Process
+    """
+    flags = CREATE_NO_WINDOW if os.name == 'nt' else 0
+    if limiter is not None:
+        preexec_fn = limiter.preexec_fn
+    p = subprocess.Popen(args, stdin=stdin, stdout=stdout, stderr=limiter.stderr if limiter is not None else None,
+                         creationflags=flags, preexec_fn=preexec_fn)
+    if token is not None:
+        token.register(p)
+    if limiter is not None:
+        limiter.start(p)
+    return p
+
+
+def _wait(p: subprocess.Popen, args: List[str], token: Optional[CancelToken], stages: Optional[Stages],
+          limiter: _Limiter, failed: bool = False) -> None:
+    """
+    Wait for an external program, raise if it was cancelled, exceeded a limit or failed.
+
+    :param p: Process
+    :param args: Program arguments
+    :param token: Cancel token
+    :param stages: Stages of the conversion, stores the peak memory of the program
+    :param limiter: Limits of the program
+    :param failed: The output could not be consumed, the program is killed
+    """
+    if failed:
+        p.kill()
+    cpu_time = 0
+    try:
+        if not hasattr(os, 'wait4'):
+            raise ChildProcessError()
+        # The usage of each program is only available if it is waited by its pid
+        _, status, usage = os.wait4(p.pid, 0)
+        p.returncode = os.waitstatus_to_exitcode(status)
+        cpu_time = usage.ru_utime + usage.ru_stime
+        if stages is not None:
+            stages.child(usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024))
+    except ChildProcessError:  # Already waited by a concurrent kill
+        p.wait()
+    exceeded = limiter.stop(args, p.returncode, cpu_time)
+    if token is not None:
+        token.unregister(p)
+        token.check()  # The output of a killed program is not valid
+    if exceeded is not None:
+        raise exceeded
+    if p.returncode != 0 and not failed:
+        raise subprocess.CalledProcessError(p.returncode, args)
+
+
+def call(args: List[str], output: bool = False, token: Optional[CancelToken] = None,
+         stages: Optional[Stages] = None, limits: Optional[ProcessLimits] = None) -> bytes:
+    """
+    Call an external program without spawning a shell.
+
+    :param args: Program arguments
+    :param output: Return the standard output of the program
+    :param token: Cancel token, kills the program if the conversion is cancelled
+    :param stages: Stages of the conversion, stores the peak memory of the program
+    :param limits: Limits of the program, raises LimitExceeded if exceeded
+    :return: Output
+    """
+    limiter = _Limiter(limits)
+    p = _popen(args, subprocess.PIPE if output else None, token, limiter=limiter)
+    out = b''
+    try:
+        if output:  # Only the output is piped, thus, it cannot deadlock
+            out = p.stdout.read()
+            p.stdout.close()
+    except BaseException:
+        _wait(p, args, token, stages, limiter, failed=True)
+        raise
+    _wait(p, args, token, stages, limiter)
+    return out
+
+
+@contextmanager
+def pipe(args: List[str], token: Optional[CancelToken] = None, stages: Optional[Stages] = None,
+         limits: Optional[ProcessLimits] = None) -> Iterator[BinaryIO]:
+    """
+    Call an external program without spawning a shell, its standard output is
+    streamed. The program is killed if the output is not consumed.
+
+    :param args: Program arguments
+    :param token: Cancel token, kills the program if the conversion is cancelled
+    :param stages: Stages of the conversion, stores the peak memory of the program
+    :param limits: Limits of the program, raises LimitExceeded if exceeded
+    :return: Standard output
+    """
+    limiter = _Limiter(limits)
+    p = _popen(args, subprocess.PIPE, token, limiter=limiter)
+    try:
+        yield p.stdout
+    except BaseException:
+        p.stdout.close()
+        _wait(p, args, token, stages, limiter, failed=True)
+        raise
+    p.stdout.close()
+    _wait(p, args, token, stages, limiter)
+
+
+async def acall(args: List[str], token: Optional[CancelToken] = None, limits: Optional[ProcessLimits] = None) -> None:
+    """
+    Call an external program from asyncio without spawning a shell. The program
+    is killed if the task is cancelled, for example, by a timeout.
+
+    :param args: Program arguments
+    :param token: Cancel token, kills the program if the conversion is cancelled
+    :param limits: Limits of the program, raises LimitExceeded if exceeded
+    """
+    flags = CREATE_NO_WINDOW if os.name == 'nt' else 0
+    limiter = _Limiter(limits)
+    p = await asyncio.create_subprocess_exec(*args, stderr=limiter.stderr, creationflags=flags,
+                                             preexec_fn=limiter.preexec_fn)
+    if token is not None:
+        token.register(p)
+    limiter.start(p, timer=False)
+    try:
+        timeout = limits.timeout if limits is not None and limits.timeout > 0 else None
+        returncode = await asyncio.wait_for(p.wait(), timeout)
+    except asyncio.TimeoutError:
+        limiter.expire(p)
+        returncode = await p.wait()  # Reaps the killed program
+    except BaseException:
+        _kill(p)
+        try:
+            # Reaps the killed program, the wait is shielded from another cancel of the task
+            await asyncio.shield(p.wait())
+        finally:
+            limiter.stop(args, -1)
+        raise
+    finally:
+        if token is not None:
+            token.unregister(p)
+    exceeded = limiter.stop(args, returncode)
+    if token is not None:
+        token.check()  # The output of a killed program is not valid
+    if exceeded is not None:
+        raise exceeded
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, args)
+
+
+def serve(args: List[str], memory: int = 0) -> subprocess.Popen:
+    """
+    Start a long-lived external program without spawning a shell, its standard
+    input and output are piped.
+
+    :param args: Program arguments
+    :param memory: Address space of the program (MB), if 0 there is no limit
+    :return: Process
+    """
+    return _popen(args, subprocess.PIPE, None, subprocess.PIPE, preexec_fn=_child_limits(memory))
+
+
 def get_user_path() -> str:
     """
     :return: Returns the user path
@@ -48,6 +430,19 @@ def get_local_path() -> str:
     return make_path_if_not_exists(path)
 
 
+def print_console(msg: str, hour: bool = False, end: Optional[str] = None) -> None:
+    """
+    Print a message on stdout, uses the same signature as App._print.
+
+    :param msg: Message
+    :param hour: Hour
+    :param end: Line end
+    """
+    if hour:
+        msg = '[{0}] {1}'.format(time.ctime(time.time())[11:19], msg)
+    print(msg, end=end, flush=True)
+
+
 def make_path_if_not_exists(path: str) -> str:
     """
     Create the path if not exists.
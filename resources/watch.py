@@ -0,0 +1,274 @@
+"""
+WATCH
+Watches a folder tree and converts the new or changed pdf files.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['Watcher']
+
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from resources.cache import file_digest
+from resources.converter import Converter, expand_inputs
+from resources.utils import print_console
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+# Constants
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ISDIR = 0x40000000
+_IN_EVENT = struct.Struct('iIII')
+
+
+class _Inotify(object):
+    """
+    Recursive inotify watch (Linux only), uses libc through ctypes.
+    """
+
+    def __init__(self, root: str) -> None:
+        """
+        Constructor.
+
+        :param root: Folder to watch
+        """
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init()
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init failed')
+        self._dirs: Dict[int, str] = {}
+        for d, _, _ in os.walk(root):
+            self._add(d)
+
+    def _add(self, path: str) -> None:
+        """
+        Watch a folder.
+
+        :param path: Folder
+        """
+        mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd >= 0:
+            self._dirs[wd] = path
+
+    def read(self, timeout: float) -> Tuple[List[str], bool]:
+        """
+        Wait for events.
+
+        :param timeout: Timeout (s)
+        :return: Written files, True if events were lost and the tree must be scanned again
+        """
+        files, overflow = [], False
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return files, overflow
+        data, pos = os.read(self._fd, 64 * 1024), 0
+        while pos + _IN_EVENT.size <= len(data):
+            wd, mask, _, length = _IN_EVENT.unpack_from(data, pos)
+            name = data[pos + _IN_EVENT.size:pos + _IN_EVENT.size + length].rstrip(b'\0')
+            pos += _IN_EVENT.size + length
+            if mask & _IN_Q_OVERFLOW:
+                overflow = True
+            elif wd in self._dirs:
+                path = os.path.join(self._dirs[wd], os.fsdecode(name))
+                if mask & _IN_ISDIR:
+                    for d, _, fs in os.walk(path):  # Files may be created before the watch is added
+                        self._add(d)
+                        files += [os.path.join(d, f) for f in fs]
+                else:
+                    files.append(path)
+        return files, overflow
+
+    def close(self) -> None:
+        """
+        Close the watch.
+        """
+        os.close(self._fd)
+
+
+class Watcher(object):
+    """
+    Converts the pdf files of a folder tree as they are written. A file is converted
+    once its size and modification time do not change for the debounce time. The
+    state of the converted files is stored, thus, only the pdf files that changed
+    since the last run are converted.
+    """
+
+    def __init__(
+            self,
+            converter: Converter,
+            lang: Dict[str, str],
+            root: str,
+            state_file: str,
+            interval: float = 2,
+            debounce: float = 5,
+            poll: bool = False,
+            printer: Optional[Callable[..., None]] = None
+    ) -> None:
+        """
+        Constructor.
+
+        :param converter: Converter, it must overwrite the images of the changed files
+        :param lang: Language dict
+        :param root: Folder to watch
+        :param state_file: State index file
+        :param interval: Polling interval (s)
+        :param debounce: Time a file must remain unchanged before its conversion (s)
+        :param poll: Scan the folder instead of using inotify
+        :param printer: Print function, uses the same signature as App._print
+        """
+        self._converter = converter
+        self._lang = lang
+        self._root = os.path.abspath(root)
+        self._state_file = state_file
+        self._interval = interval
+        self._debounce = debounce
+        self._poll = poll or not sys.platform.startswith('linux')
+        self._print = printer if printer is not None else print_console
+        self._state = self._load_state()
+        self._pending: Dict[str, Tuple[int, float, float]] = {}  # file -> (size, mtime, last change)
+
+    def _load_state(self) -> Dict[str, Dict[str, Dict[str, Union[float, str, bool]]]]:
+        """
+        :return: State index of all watched folders
+        """
+        if not os.path.isfile(self._state_file):
+            return {}
+        with open(self._state_file) as json_data:
+            return json.load(json_data)
+
+    def _save_state(self) -> None:
+        """
+        Save the state index.
+        """
+        tmp = self._state_file + '.tmp'
+        with open(tmp, 'w') as outfile:
+            json.dump(self._state, outfile)
+        os.replace(tmp, self._state_file)
+
+    @property
+    def _files(self) -> Dict[str, Dict[str, Union[float, str, bool]]]:
+        """
+        :return: State of the files of the watched folder
+        """
+        return self._state.setdefault(self._root, {})
+
+    def _changed(self, filename: str) -> bool:
+        """
+        :param filename: Pdf file
+        :return: True if the size or modification time changed since the last conversion
+        """
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return False
+        s = self._files.get(filename)
+        return s is None or s['size'] != st.st_size or s['mtime'] != st.st_mtime
+
+    def _scan(self) -> List[str]:
+        """
+        :return: All pdf files of the watched folder tree
+        """
+        return expand_inputs([os.path.join(self._root, '**', '*.[pP][dD][fF]')])
+
+    def _queue(self, files: List[str]) -> None:
+        """
+        Add files to the pending queue.
+
+        :param files: Files
+        """
+        for f in files:
+            f = os.path.abspath(f)
+            if f.lower().endswith('.pdf') and f not in self._pending and self._changed(f):
+                self._pending[f] = (-1, -1, time.time())
+
+    def _ready(self) -> List[str]:
+        """
+        :return: Pending files that did not change within the debounce time
+        """
+        ready, now = [], time.time()
+        for f, (size, mtime, since) in list(self._pending.items()):
+            try:
+                st = os.stat(f)
+            except OSError:  # Removed
+                del self._pending[f]
+                continue
+            if (st.st_size, st.st_mtime) != (size, mtime):
+                self._pending[f] = (st.st_size, st.st_mtime, now)
+            elif now - since >= self._debounce:
+                del self._pending[f]
+                ready.append(f)
+        return ready
+
+    def _convert(self, files: List[str]) -> None:
+        """
+        Convert the files whose content changed, then update the state.
+
+        :param files: Pdf files
+        """
+        changed, states = [], {}
+        for f in files:
+            st = None
+            try:
+                st = os.stat(f)
+                digest = file_digest(f)
+            except OSError as e:  # Removed or unreadable after the debounce
+                self._print(self._lang['BATCH_FILE_FAILED'].format(f, e), hour=True)
+                if st is not None:  # Not read again until it changes
+                    self._files[f] = {'size': st.st_size, 'mtime': st.st_mtime, 'digest': '', 'failed': True}
+                continue
+            states[f] = {'size': st.st_size, 'mtime': st.st_mtime, 'digest': digest}
+            if self._files.get(f, {}).get('digest') == digest:  # Touched but not modified
+                self._files[f] = states[f]
+            else:
+                changed.append(f)
+        if len(changed) > 0:
+            self._print(self._lang['WATCH_CHANGED'].format(len(changed)), hour=True)
+            _, failed = self._converter.convert_many(changed)
+            for f in changed:
+                # Failed files are not converted again until they change
+                self._files[f] = dict(states[f], failed=f in failed)
+        self._save_state()
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        """
+        Watch the folder until the stop event is set.
+
+        :param stop: Stop event
+        """
+        stop = stop if stop is not None else threading.Event()
+        inotify = None
+        if not self._poll:
+            try:
+                inotify = _Inotify(self._root)
+            except (OSError, AttributeError, TypeError):
+                self._poll = True
+        self._print(self._lang['WATCH_START'].format(self._root, 'polling' if self._poll else 'inotify'), hour=True)
+        self._queue(self._scan())
+        try:
+            while not stop.is_set():
+                if inotify is not None:
+                    files, overflow = inotify.read(min(self._interval, self._debounce))
+                    if overflow:
+                        files = self._scan()
+                    self._queue(files)
+                else:
+                    stop.wait(self._interval)
+                    self._queue(self._scan())
+                ready = self._ready()
+                if len(ready) > 0:
+                    self._convert(ready)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if inotify is not None:
+                inotify.close()
+            self._print(self._lang['WATCH_STOP'], hour=True)
@@ -0,0 +1,245 @@
+"""
+WORKER
+Runs the conversions of the app in background threads, the progress is sent back through a queue.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+__all__ = ['ConversionJob', 'ConversionWorker', 'JOB_CANCELLED', 'JOB_DONE', 'JOB_FAILED', 'JOB_QUEUED',
+           'JOB_RUNNING']
+
+import itertools
+import queue
+import threading
+import traceback
+from resources.converter import Converter
+from resources.utils import CancelToken, ConversionCancelled
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# Constants
+JOB_CANCELLED = 'cancelled'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+
+
+class ConversionJob(object):
+    """
+    Pdf queued for conversion, stores a snapshot of the conversion settings.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(
+            self,
+            filename: str,
+            conversion: Dict[str, Union[int, float, str]],
+            options: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Constructor.
+
+        :param filename: Pdf file
+        :param conversion: Conversion settings, copied when the job is queued
+        :param options: Converter options of the job, they replace the ones of the worker
+        """
+        self.conversion = dict(conversion)
+        self.error = ''
+        self.filename = filename
+        self.id = next(ConversionJob._ids)
+        self.images: List[str] = []
+        self.options = dict(options or {})
+        self.state = JOB_QUEUED
+        self.token = CancelToken()
+
+
+class ConversionWorker(object):
+    """
+    Converts the queued jobs within background threads, in the same order they were
+    queued. Tk is not thread-safe, thus, the progress is sent as events that the
+    main loop consumes: ('print', (msg, hour, end)), ('state', (job, state)) and
+    ('preview', (tag, filename, data, error)). The state is sent within the event, as
+    the job may change again before the event is consumed.
+    """
+
+    def __init__(self, lang: Dict[str, str], options: Dict[str, Any], workers: int = 1, max_queued: int = 0) -> None:
+        """
+        Constructor.
+
+        :param lang: Language dict
+        :param options: Converter options (memory_limit, cache_size, ...)
+        :param workers: Number of concurrent conversions
+        :param max_queued: Maximum number of queued jobs, if 0 there is no limit
+        """
+        self._jobs: 'queue.Queue[Optional[ConversionJob]]' = queue.Queue()
+        self._lock = threading.Lock()
+        self.max_queued = max_queued
+        self._lang = lang
+        self._options = options
+        self.events: 'queue.Queue[Tuple[str, Any]]' = queue.Queue()
+        self.jobs: List[ConversionJob] = []
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(max(1, workers))]
+        for t in self._threads:
+            t.start()
+
+    def _printer(self, msg: str, hour: bool = False, end: Optional[str] = None) -> None:
+        """
+        Print function of the converter, uses the same signature as App._print.
+        """
+        self.events.put(('print', (msg, hour, end)))
+
+    def _set_state(self, job: ConversionJob, state: str) -> None:
+        """
+        Update the state of a job.
+
+        :param job: Job
+        :param state: State
+        """
+        job.state = state
+        self.events.put(('state', (job, state)))
+
+    @property
+    def busy(self) -> bool:
+        """
+        :return: True if there are queued or running jobs
+        """
+        return any(j.state in (JOB_QUEUED, JOB_RUNNING) for j in self.jobs)
+
+    @property
+    def running(self) -> List[ConversionJob]:
+        """
+        :return: Running jobs
+        """
+        return [j for j in self.jobs if j.state == JOB_RUNNING]
+
+    @property
+    def pending(self) -> int:
+        """
+        :return: Number of queued jobs
+        """
+        return sum(1 for j in self.jobs if j.state == JOB_QUEUED)
+
+    def submit(
+            self,
+            filename: str,
+            conversion: Dict[str, Union[int, float, str]],
+            options: Optional[Dict[str, Any]] = None
+    ) -> ConversionJob:
+        """
+        Queue a pdf.
+
+        :param filename: Pdf file
+        :param conversion: Conversion settings
+        :param options: Converter options of the job, they replace the ones of the worker
+        :return: Job
+        :raises queue.Full: If the queue has the maximum number of jobs
+        """
+        with self._lock:
+            if 0 < self.max_queued <= self.pending:
+                raise queue.Full()
+            job = ConversionJob(filename, conversion, options)
+            self.jobs.append(job)
+        self._jobs.put(job)
+        return job
+
+    def remove(self, job: ConversionJob) -> None:
+        """
+        Forget a finished job.
+
+        :param job: Job
+        """
+        with self._lock:
+            if job in self.jobs and job.state not in (JOB_QUEUED, JOB_RUNNING):
+                self.jobs.remove(job)
+
+    def get(self, job_id: int) -> Optional[ConversionJob]:
+        """
+        :param job_id: Job id
+        :return: Job, None if not found
+        """
+        for j in self.jobs:
+            if j.id == job_id:
+                return j
+        return None
+
+    @staticmethod
+    def cancel(job: ConversionJob) -> None:
+        """
+        Cancel a job, the running external programs are killed.
+
+        :param job: Job
+        """
+        if job.state in (JOB_QUEUED, JOB_RUNNING):
+            job.token.cancel()
+
+    def render_preview(self, filename: str, conversion: Dict[str, Union[int, float, str]], width: int,
+                       cache_size: int = 0) -> bytes:
+        """
+        Render the preview of a pdf within the calling thread.
+
+        :param filename: Pdf file
+        :param conversion: Conversion settings, the preview uses the angle and the page range
+        :param width: Maximum width/height of the preview (px)
+        :param cache_size: Size of the preview cache (MB)
+        :return: Png data
+        """
+        # Previews are not tiled, and their records are not stored as conversion metrics
+        options = {k: v for k, v in self._options.items() if k in ('memory_limit', 'threads', 'limits')}
+        converter = Converter(self._lang, dict(conversion, TILED=False), self._printer, **options)
+        return converter.preview(filename, width, cache_size)
+
+    def preview(self, filename: str, conversion: Dict[str, Union[int, float, str]], width: int,
+                cache_size: int = 0, tag: Any = None) -> None:
+        """
+        Render the preview of a pdf within a new thread, thus, it does not wait for
+        the queued conversions. The result is sent as a preview event.
+
+        :param filename: Pdf file
+        :param conversion: Conversion settings
+        :param width: Maximum width/height of the preview (px)
+        :param cache_size: Size of the preview cache (MB)
+        :param tag: Returned by the event
+        """
+
+        def _run() -> None:
+            data, error = b'', ''
+            try:
+                data = self.render_preview(filename, conversion, width, cache_size)
+            except Exception as e:
+                error = str(e)
+            self.events.put(('preview', (tag, filename, data, error)))
+
+        threading.Thread(target=_run, daemon=True).start()
+
+    def close(self) -> None:
+        """
+        Cancel all jobs and stop the threads.
+        """
+        for j in self.jobs:
+            self.cancel(j)
+        for _ in self._threads:
+            self._jobs.put(None)
+
+    def _run(self) -> None:
+        """
+        Convert the queued jobs.
+        """
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            if job.token.cancelled:
+                self._set_state(job, JOB_CANCELLED)
+                continue
+            self._set_state(job, JOB_RUNNING)
+            try:
+                converter = Converter(self._lang, job.conversion, self._printer, token=job.token,
+                                      **dict(self._options, **job.options))
+                job.images = converter.convert(job.filename)
+                state = JOB_DONE
+            except ConversionCancelled:
+                state = JOB_CANCELLED
+            except Exception:
+                job.error = traceback.format_exc()
+                state = JOB_CANCELLED if job.token.cancelled else JOB_FAILED
+            self._set_state(job, state)
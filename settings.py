@@ -9,6 +9,8 @@ __all__ = ['SettingsDialog']
 
 import os
 import tkinter.messagebox
+from resources.converter import parse_page_range
+from resources.preview import preview_photo
 from tkinter import *
 
 
@@ -28,6 +30,14 @@ def is_number(s):
     return False
 
 
+def is_page_range(s):
+    try:
+        parse_page_range(s, 1)  # Same grammar as the conversion
+        return True
+    except ValueError:
+        return False
+
+
 # Constants
 if os.name == 'nt':  # Windows
     DEFAULT_FONT_TITLE = 'Arial', 10
@@ -38,6 +48,7 @@ elif os.name == 'posix':  # Linux
 else:
     DEFAULT_FONT_TITLE = 'Arial', 10
 COMMENT_COLOR = '#666666'
+PREVIEW_SIZE = 200
 
 
 def del_matrix(matrix):
@@ -59,6 +70,8 @@ class SettingsDialog(object):
         type_object = properties[2]
         size = properties[3]
         inputs = properties[4]
+        self._preview = properties[5] if len(properties) > 5 else None  # Renders the preview of an angle
+        self._size = size
         self.w = Tk()
         self.w.protocol('WM_DELETE_WINDOW', self.kill)
         self.values = []
@@ -95,8 +108,31 @@ class SettingsDialog(object):
             self.angle.insert(END, inputs['ANGLE'])
             self.angle.pack(side=LEFT, padx=5)
 
+            # Pages
+            f = Frame(self.w, border=3)
+            f.pack()
+            Label(f, text=self.lang['SETTINGS_PAGES'], width=23, anchor=E).pack(side=LEFT)
+            self.pages = Entry(f, relief=GROOVE, width=24)
+            self.pages.insert(END, inputs['PAGES'])
+            self.pages.pack(side=LEFT, padx=5)
+
+            # Tiled
+            f = Frame(self.w, border=3)
+            f.pack()
+            Label(f, text=self.lang['SETTINGS_TILED'], width=23, anchor=E).pack(side=LEFT)
+            self.tiled = IntVar(self.w, value=int(inputs['TILED']))
+            Checkbutton(f, variable=self.tiled, width=20, anchor=W).pack(side=LEFT, padx=5)
+
             Label(self.w, text='', height=1).pack()
-            Button(self.w, text=self.lang['SAVE_SETTINGS'], relief=GROOVE, command=self.send).pack()
+            f = Frame(self.w)
+            f.pack()
+            Button(f, text=self.lang['SAVE_SETTINGS'], relief=GROOVE, command=self.send).pack(side=LEFT, padx=5)
+            if self._preview is not None:
+                self._previewbutton = Button(f, text=self.lang['PREVIEW_BUTTON'], relief=GROOVE,
+                                             command=self.show_preview)
+                self._previewbutton.pack(side=LEFT, padx=5)
+            self.preview = Label(self.w)
+            self.preview.pack(pady=5)
             self.w.bind('<Escape>', self.destroy)
 
     def focus(self) -> None:
@@ -105,6 +141,34 @@ class SettingsDialog(object):
         """
         self.w.focus_force()
 
+    def show_preview(self) -> None:
+        """
+        Request the preview with the angle of the dialog, it is rendered in background.
+        """
+        angle = self.angle.get().strip()
+        if self._preview is None or not is_number(angle):
+            return
+        self._previewbutton.configure(state='disabled')
+        self._preview(float(angle))
+
+    def preview_done(self, data: bytes, error: str) -> None:
+        """
+        Show a rendered preview, the window grows to show it.
+
+        :param data: Png data
+        :param error: Error message, empty if rendered
+        """
+        if self._preview is None:  # The dialog was closed
+            return
+        self._previewbutton.configure(state='normal')
+        if error != '':
+            tkinter.messagebox.showwarning(self.lang['ERROR'], error)
+            return
+        photo = preview_photo(self.w, data, PREVIEW_SIZE)
+        self.preview.configure(image=photo)
+        self.preview.image = photo
+        self.w.geometry('%dx%d' % (self._size[0], self._size[1] + photo.height() + 10))
+
     def send(self) -> None:
         """
         Send the configs back to the app, then store them.
@@ -112,13 +176,20 @@ class SettingsDialog(object):
         del_matrix(self.values)
         max_width = self.maxwidth.get().strip()
         angle = self.angle.get().strip()
+        pages = self.pages.get().strip()
         if is_number(max_width) and is_number(max_width) and is_number(angle):
-            sz_min, sz_max = 1920, 12500
+            tiled = self.tiled.get() == 1
+            sz_min, sz_max = 1920, 40000 if tiled else 12500
             if not sz_min <= int(max_width) <= sz_max:
                 tkinter.messagebox.showwarning(self.lang['SETTINGS_MAX_WIDTH_ERROR_CONTENT'], self.lang['SETTINGS_MAX_WIDTH_ERROR_CONTENT'].format(sz_min, sz_max))
                 return
+            if not is_page_range(pages):
+                tkinter.messagebox.showwarning(self.lang['SETTINGS_PAGES_ERROR_TITLE'], self.lang['SETTINGS_PAGES_ERROR_CONTENT'])
+                return
             self.values.append(max_width)
             self.values.append(angle)
+            self.values.append(pages)
+            self.values.append(tiled)
             self.sent = True
             self.destroy()
 
@@ -129,6 +200,7 @@ class SettingsDialog(object):
 
         :param e: Event
         """
+        self._preview = None
         self.w.destroy()
 
     def kill(self) -> None:
@@ -136,4 +208,5 @@ class SettingsDialog(object):
         Destroy the window without sending data.
         """
         self.sent = False
+        self._preview = None
         self.w.destroy()
@@ -0,0 +1,6 @@
+"""
+TEST
+Tests of the conversion core, they do not require a display, Ghostscript or ImageMagick.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
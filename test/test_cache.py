@@ -0,0 +1,87 @@
+"""
+TEST CACHE
+Test the render cache.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+import os
+import tempfile
+import time
+import unittest
+from resources.cache import RenderCache
+
+# Constants
+_ENTRY_SIZE = 400 * 1024  # Two entries fit a cache of 1 MB
+
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache = RenderCache(1, os.path.join(self._tmp.name, 'cache'))
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def _image(self, name: str, data: bytes = b'a') -> str:
+        """
+        :return: Image file
+        """
+        image = os.path.join(self._tmp.name, name)
+        with open(image, 'wb') as f:
+            f.write(data * _ENTRY_SIZE)
+        return image
+
+    def _put(self, name: str) -> str:
+        """
+        :return: Key of the stored image
+        """
+        key = self.cache.key(name, 0, {})
+        self.cache.put(key, self._image(name + '.png'))
+        time.sleep(0.02)  # The recency is the modification time
+        return key
+
+    def test_format(self) -> None:
+        """
+        Test the output format is part of the key and of the entry name.
+        """
+        png, webp = self.cache.key('pdf', 0, {}), self.cache.key('pdf', 0, {}, '.webp')
+        self.assertTrue(png.endswith('.png'))
+        self.assertTrue(webp.endswith('.webp'))
+        self.assertNotEqual(png[:-4], webp[:-5])
+        self.cache.put(webp, self._image('page.webp'))
+        output = os.path.join(self._tmp.name, 'out.png')
+        self.assertFalse(self.cache.get(png, output))
+        self.assertFalse(os.path.exists(output))
+
+    def test_copy(self) -> None:
+        """
+        Test the entries do not share a file with the outputs.
+        """
+        image = self._image('page.png')
+        key = self.cache.key('pdf', 0, {})
+        self.cache.put(key, image)
+        with open(image, 'ab') as f:
+            f.write(b'edit')
+        output = os.path.join(self._tmp.name, 'out.png')
+        mtime = os.stat(image).st_mtime_ns
+        self.assertTrue(self.cache.get(key, output))
+        with open(output, 'ab') as f:
+            f.write(b'edit')
+        self.assertTrue(self.cache.get(key, os.path.join(self._tmp.name, 'other.png')))
+        self.assertEqual(os.path.getsize(os.path.join(self._tmp.name, 'other.png')), _ENTRY_SIZE)
+        self.assertEqual(os.stat(image).st_mtime_ns, mtime)
+
+    def test_evict(self) -> None:
+        """
+        Test the least recently used entry is removed, a hit makes an entry recent.
+        """
+        a, b = self._put('a'), self._put('b')
+        self.assertTrue(self.cache.get(a, os.path.join(self._tmp.name, 'out.png')))
+        time.sleep(0.02)
+        c = self._put('c')
+        output = os.path.join(self._tmp.name, 'restored.png')
+        self.assertFalse(self.cache.get(b, output))
+        self.assertTrue(self.cache.get(a, output))
+        self.assertTrue(self.cache.get(c, output))
@@ -0,0 +1,77 @@
+"""
+TEST CONSOLE
+Test the bounded log of the app console.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+import unittest
+from resources.console import ConsoleBuffer
+
+
+class ConsoleTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.console = ConsoleBuffer(3)
+        self.text = ''  # Text of the widget
+
+    def _draw(self) -> None:
+        """
+        Apply the changes to the widget text, as the app does, and check it shows the buffer.
+        """
+        reset, text, remove = self.console.flush()
+        if reset:
+            self.text = ''
+        self.text += text
+        self.text = ''.join(self.text.splitlines(keepends=True)[remove:])
+        self.assertEqual(self.text.splitlines(), list(self.console.lines))
+
+    def test_capacity(self) -> None:
+        """
+        Test appending past the capacity, the oldest lines are removed.
+        """
+        for i in range(5):
+            self.console.write(f'line {i}')
+        self.assertEqual(list(self.console.lines), ['line 2', 'line 3', 'line 4'])
+        self.assertEqual(self.console.flush(), (False, 'line 0\nline 1\nline 2\nline 3\nline 4\n', 2))
+        self.assertEqual(self.console.flush(), (False, '', 0))
+
+    def test_flush(self) -> None:
+        """
+        Test the flushes after some lines were dropped, including a continued line.
+        """
+        self.console.write('a')
+        self.console.write('b')
+        self._draw()
+        self.console.write('c')
+        self.console.write('d')  # Drops a
+        self._draw()
+        self.console.write('e ', end='')  # Drops b
+        self.console.write('continued')
+        self._draw()
+        self.assertEqual(list(self.console.lines), ['c', 'd', 'e continued'])
+        self.console.write('d')  # Not equal to the last line
+        self.console.write('d')  # Ignored
+        self._draw()
+        self.assertEqual(list(self.console.lines), ['d', 'e continued', 'd'])
+
+    def test_reset(self) -> None:
+        """
+        Test the buffer is drawn again if all the drawn lines were replaced, and the clear.
+        """
+        self.console.write('a')
+        self._draw()
+        for i in range(5):  # Three lines dropped
+            self.console.write(f'line {i}')
+        self.assertEqual(self.console.flush(), (True, 'line 2\nline 3\nline 4\n', 0))
+        self.console.write('open', end='')
+        self.text = 'stale\n'  # Replaced by the reset
+        self.console.write('x')
+        self.console.write('y')
+        self.console.write('z')
+        self._draw()
+        self.console.clear()
+        self.assertEqual(len(self.console), 0)
+        self.assertEqual(self.console.flush(), (False, '', 0))
+        self.console.write('a')
+        self.assertEqual(self.console.flush(), (False, 'a\n', 0))
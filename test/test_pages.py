@@ -0,0 +1,30 @@
+"""
+TEST PAGES
+Test the parse of the page ranges.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+import unittest
+from resources.converter import parse_page_range
+
+
+class PagesTest(unittest.TestCase):
+
+    def test_parse(self) -> None:
+        """
+        Test the selected pages, they start at 0 and keep the order of the range.
+        """
+        self.assertEqual(parse_page_range('', 3), [0, 1, 2])
+        self.assertEqual(parse_page_range(' 2 ', 3), [1])
+        self.assertEqual(parse_page_range('1-3,5,8-', 10), [0, 1, 2, 4, 7, 8, 9])
+        self.assertEqual(parse_page_range('4, 1 - 2, 2', 10), [3, 0, 1])
+        self.assertEqual(parse_page_range('2-', 1), [])
+        self.assertEqual(parse_page_range('3-9', 4), [2, 3])  # Pages greater than the count are ignored
+
+    def test_invalid(self) -> None:
+        """
+        Test the invalid ranges.
+        """
+        for pages in (',5', '5,', '1,,2', '0', '0-3', '3-1', '-2', 'a', '1-2-3'):
+            self.assertRaises(ValueError, parse_page_range, pages, 10)
@@ -0,0 +1,176 @@
+"""
+TEST PDFINFO
+Test the page boxes read from small generated pdf files.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+import os
+import tempfile
+import unittest
+import zlib
+from resources.pdfinfo import PdfError, PdfPage, _PdfReader, read_pages
+from typing import Dict, List, Tuple
+from unittest import mock
+
+# Constants
+_HEADER = b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n'
+_OBJECTS = {  # The first page inherits the box and rotation of the tree, the second one of a nested node
+    1: b'<< /Type /Catalog /Pages 2 0 R >>',
+    2: b'<< /Type /Pages /Kids [3 0 R 5 0 R] /Count 2 /MediaBox [0 0 595 842] /Rotate 90 >>',
+    3: b'<< /Type /Page /Parent 2 0 R >>',
+    4: b'<< /Type /Page /Parent 5 0 R /Rotate 0 /CropBox [10 10 500 500] >>',
+    5: b'<< /Type /Pages /Parent 2 0 R /Kids [4 0 R] /Count 1 /MediaBox [842 595 0 0] >>'
+}
+_PAGES = [PdfPage((0, 0, 595, 842), (0, 0, 595, 842), 90), PdfPage((0, 0, 842, 595), (10, 10, 500, 500), 0)]
+
+
+def _body(objects: Dict[int, bytes], offset: int) -> Tuple[bytes, Dict[int, int]]:
+    """
+    :param objects: Objects by number
+    :param offset: Offset of the body within the file
+    :return: Indirect objects, offset of each object
+    """
+    body, offsets = b'', {}
+    for num, obj in objects.items():
+        offsets[num] = offset + len(body)
+        body += b'%d 0 obj\n%s\nendobj\n' % (num, obj)
+    return body, offsets
+
+
+def _end(offset: int) -> bytes:
+    """
+    :return: End of the file, pointing to the last cross-reference section
+    """
+    return b'startxref\n%d\n%%%%EOF\n' % offset
+
+
+def _classic(objects: Dict[int, bytes], startxref: int = 0) -> Tuple[bytes, int]:
+    """
+    Create a pdf with a classic cross-reference table.
+
+    :param objects: Objects by number
+    :param startxref: Offset added to the startxref value, damages the file if not 0
+    :return: Pdf, offset of the table
+    """
+    body, offsets = _body(objects, len(_HEADER))
+    xref = len(_HEADER) + len(body)
+    table = b'xref\n0 1\n0000000000 65535 f \n' + b''.join(
+        b'%d 1\n%010d 00000 n \n' % (num, offsets[num]) for num in sorted(offsets))
+    trailer = b'trailer\n<< /Size %d /Root 1 0 R >>\n' % (max(objects) + 1)
+    return _HEADER + body + table + trailer + _end(xref + startxref), xref
+
+
+def _update(pdf: bytes, prev: int, objects: Dict[int, bytes]) -> bytes:
+    """
+    Append an incremental update, which replaces some objects.
+
+    :param pdf: Pdf
+    :param prev: Offset of the previous cross-reference table
+    :param objects: New version of the objects
+    :return: Updated pdf
+    """
+    body, offsets = _body(objects, len(pdf))
+    xref = len(pdf) + len(body)
+    table = b'xref\n' + b''.join(b'%d 1\n%010d 00000 n \n' % (num, offsets[num]) for num in sorted(offsets))
+    trailer = b'trailer\n<< /Size 6 /Root 1 0 R /Prev %d >>\n' % prev
+    return pdf + body + table + trailer + _end(xref)
+
+
+def _predict_up(rows: List[bytes]) -> bytes:
+    """
+    :return: Rows encoded with the png Up predictor
+    """
+    out, prev = b'', bytes(len(rows[0]))
+    for row in rows:
+        out += b'\x02' + bytes((r - p) & 0xff for r, p in zip(row, prev))
+        prev = row
+    return out
+
+
+def _compressed(startxref: int = 0) -> bytes:
+    """
+    Create a pdf whose objects are within an object stream, referenced by a cross
+    reference stream with png predictors.
+
+    :param startxref: Offset added to the startxref value, damages the file if not 0
+    :return: Pdf
+    """
+    header, data = [], b''
+    for num, obj in _OBJECTS.items():
+        header.append(b'%d %d' % (num, len(data)))
+        data += obj + b'\n'
+    first = b' '.join(header) + b'\n'
+    objstm = zlib.compress(first + data)
+    body, offsets = _body({6: b'<< /Type /ObjStm /N %d /First %d /Filter /FlateDecode /Length %d >>\nstream\n%s'
+                                 b'\nendstream' % (len(_OBJECTS), len(first), len(objstm), objstm)}, len(_HEADER))
+    xref = len(_HEADER) + len(body)
+    rows = [b'\x00\x00\x00\x00\x00\xff\xff']  # Free object 0
+    rows += [b'\x02' + (6).to_bytes(4, 'big') + i.to_bytes(2, 'big') for i in range(len(_OBJECTS))]
+    rows += [b'\x01' + offsets[6].to_bytes(4, 'big') + b'\x00\x00', b'\x01' + xref.to_bytes(4, 'big') + b'\x00\x00']
+    stream = zlib.compress(_predict_up(rows))
+    body += b'7 0 obj\n<< /Type /XRef /Size 8 /W [1 4 2] /Root 1 0 R /Filter /FlateDecode ' \
+            b'/DecodeParms << /Predictor 12 /Columns 7 >> /Length %d >>\nstream\n%s\nendstream\nendobj\n' % (
+                len(stream), stream)
+    return _HEADER + body + _end(xref + startxref)
+
+
+class PdfInfoTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def _read(self, pdf: bytes, rebuild: bool = False) -> List[PdfPage]:
+        """
+        :param pdf: Pdf
+        :param rebuild: The cross-reference is expected to be rebuilt
+        :return: Pages of the pdf
+        """
+        filename = os.path.join(self._tmp.name, 'test.pdf')
+        with open(filename, 'wb') as f:
+            f.write(pdf)
+        # noinspection PyProtectedMember
+        with mock.patch.object(_PdfReader, '_rebuild_xref', autospec=True,
+                               side_effect=_PdfReader._rebuild_xref) as rebuilt:
+            pages = read_pages(filename)
+        self.assertEqual(rebuilt.called, rebuild)
+        return pages
+
+    def test_classic(self) -> None:
+        """
+        Test a classic cross-reference table, the boxes and rotation are inherited.
+        """
+        self.assertEqual(self._read(_classic(_OBJECTS)[0]), _PAGES)
+
+    def test_compressed(self) -> None:
+        """
+        Test a cross-reference stream with png predictors and an object stream.
+        """
+        self.assertEqual(self._read(_compressed()), _PAGES)
+
+    def test_incremental(self) -> None:
+        """
+        Test an incremental update, the newest version of each object is used.
+        """
+        pdf, xref = _classic(_OBJECTS)
+        pdf = _update(pdf, xref, {4: b'<< /Type /Page /Parent 5 0 R /Rotate -90 >>'})
+        self.assertEqual(self._read(pdf), [_PAGES[0], PdfPage((0, 0, 842, 595), (0, 0, 842, 595), 270)])
+
+    def test_rebuild(self) -> None:
+        """
+        Test a wrong startxref offset, the cross-reference is rebuilt by scanning the file.
+        """
+        self.assertEqual(self._read(_classic(_OBJECTS, startxref=7)[0], rebuild=True), _PAGES)
+        self.assertEqual(self._read(_compressed(startxref=-3), rebuild=True), _PAGES)
+
+    def test_invalid(self) -> None:
+        """
+        Test files that are not a pdf, or have no pages.
+        """
+        self.assertRaises(PdfError, self._read, b'')
+        self.assertRaises(PdfError, self._read, b'not a pdf')
+        self.assertRaises(PdfError, self._read, _classic({1: b'<< /Type /Catalog /Pages 2 0 R >>',
+                                                          2: b'<< /Type /Pages /Kids [] /Count 0 >>'})[0])
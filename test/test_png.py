@@ -0,0 +1,87 @@
+"""
+TEST PNG
+Test the streaming png writer and reader.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+import io
+import numpy as np
+import os
+import struct
+import tempfile
+import unittest
+import zlib
+from PIL import Image
+from resources import png
+from resources.png import PngWriter, png_from_rows, read_png_rows
+from unittest import mock
+
+
+def _idat(filename: str) -> bytes:
+    """
+    :param filename: Png file
+    :return: Zlib stream of the image data, joined from the IDAT chunks
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    pos, stream = 8, b''
+    while pos < len(data):
+        n, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        if kind == b'IDAT':
+            stream += data[pos + 8:pos + 8 + n]
+        pos += 12 + n
+    return stream
+
+
+class PngTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self._tmp.name, 'page.png')
+        rng = np.random.default_rng(0)
+        self.pixels = rng.integers(0, 256, (61, 37, 4), dtype=np.uint8)
+        self.pixels[20:40] = 255  # Compressible rows
+        self.rows = [b'\x00' + row.tobytes() for row in self.pixels]
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def test_round_trip(self) -> None:
+        """
+        Test the image written by one or several threads, the parallel blocks form a single zlib stream.
+        """
+        for threads, block in ((1, png._BLOCK_SIZE), (2, 1000), (3, 4096), (4, 1 << 20)):
+            with mock.patch.object(png, '_BLOCK_SIZE', block), mock.patch.object(png, '_IDAT_SIZE', 500):
+                with PngWriter(self.output, 37, 61, threads=threads) as writer:
+                    for row in self.rows[:10]:
+                        writer.write_filtered(row)
+                    writer.write_block(b''.join(self.rows[10:]))
+            self.assertEqual(zlib.decompress(_idat(self.output)), b''.join(self.rows), threads)
+            with Image.open(self.output) as im:
+                np.testing.assert_array_equal(np.array(im), self.pixels)
+            width, height, rows = read_png_rows(self.output)
+            self.assertEqual((width, height, list(rows)), (37, 61, self.rows))
+
+    def test_rows(self) -> None:
+        """
+        Test a missing row raises, the file is finished anyway.
+        """
+        with self.assertRaises(ValueError):
+            with PngWriter(self.output, 37, 61, threads=2) as writer:
+                writer.write_block(b''.join(self.rows[1:]))
+        with Image.open(self.output) as im:
+            self.assertEqual(im.size, (37, 61))
+
+    def test_read(self) -> None:
+        """
+        Test the rows kept by the inflate bound are read, and a truncated zlib stream raises.
+        """
+        data = b''.join(self.rows)
+        with mock.patch.object(png, '_READ_SIZE', 64):
+            _, _, rows = read_png_rows(io.BytesIO(png_from_rows(37, 61, data)))
+            self.assertEqual(list(rows), self.rows)
+        truncated = png_from_rows(37, 61, data)[:33] + png._chunk(b'IDAT', zlib.compress(data)[:-4]) + \
+            png._chunk(b'IEND', b'')
+        _, _, rows = read_png_rows(io.BytesIO(truncated))
+        self.assertRaises(ValueError, list, rows)
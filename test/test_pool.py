@@ -0,0 +1,149 @@
+"""
+TEST POOL
+Test the warm Ghostscript pool, the processes are replaced by a script that speaks
+the same protocol. If Ghostscript is installed, the protocol is also tested with it.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from resources.backends import GhostscriptBackend
+from resources.pool import PoolError, RenderPool
+from resources.postprocess import read_pixels
+from test.test_pdfinfo import _classic
+from unittest import mock
+
+# Writes a file per page to the -sOutputFile template, or fails each job as Ghostscript
+# does if -dSAFER rejects the setpagedevice
+_SERVER = r'''
+import re, sys
+template = [a[len('-sOutputFile='):] for a in sys.argv if a.startswith('-sOutputFile=')][0]
+page = 0
+for line in sys.stdin:
+    job = re.search(r'%%CONVERTPDF (\d+) OK', line).group(1)
+    if sys.argv[1] == 'fail':
+        print(f'%%CONVERTPDF {job} ERROR /invalidaccess', flush=True)
+        continue
+    page += 1
+    with open(template % page, 'wb') as f:
+        f.write(line.encode('utf-8'))
+    print(f'%%CONVERTPDF {job} OK', flush=True)
+'''
+
+# Two pages of 1 inch, the first one has a black square, the second one is blank
+_CONTENT = b'0 0 0 rg 18 18 36 36 re f'
+_PDF = _classic({
+    1: b'<< /Type /Catalog /Pages 2 0 R >>',
+    2: b'<< /Type /Pages /Kids [3 0 R 5 0 R] /Count 2 /MediaBox [0 0 72 72] >>',
+    3: b'<< /Type /Page /Parent 2 0 R /Contents 4 0 R >>',
+    4: b'<< /Length %d >>\nstream\n%s\nendstream' % (len(_CONTENT), _CONTENT),
+    5: b'<< /Type /Page /Parent 2 0 R >>'
+})[0]
+
+
+class PoolTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._tmp = tempfile.mkdtemp()
+        self._script = os.path.join(self._tmp, 'server.py')
+        with open(self._script, 'w', encoding='utf-8') as f:
+            f.write(_SERVER)
+        self._pdf = os.path.join(self._tmp, 'plan.pdf')
+        with open(self._pdf, 'wb') as f:
+            f.write(b'%PDF-1.4\n')
+        self._pools = []
+
+    def tearDown(self) -> None:
+        for pool in self._pools:
+            pool.close()
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+    def _pool(self, mode: str) -> RenderPool:
+        pool = RenderPool([sys.executable, self._script, mode], 10)
+        self._pools.append(pool)
+        return pool
+
+    def test_render(self) -> None:
+        """
+        Test the pages are moved from the folder of the process to the outputs.
+        """
+        pool = self._pool('ok')
+        for i in range(3):
+            output = os.path.join(self._tmp, f'page{i}.png')
+            pool.render(self._pdf, i, 72, output)
+            with open(output, encoding='utf-8') as f:
+                job = f.read()
+            self.assertIn(f' {i + 1} pdfgetpage', job)
+            self.assertNotIn('/OutputFile', job)  # Locked by -dSAFER
+        self.assertEqual(pool.started, 1)
+
+    def test_failure(self) -> None:
+        """
+        Test a failed job raises PoolError and replaces the process.
+        """
+        pool = self._pool('fail')
+        for _ in range(2):
+            with self.assertRaises(PoolError):
+                pool.render(self._pdf, 0, 72, os.path.join(self._tmp, 'page.png'))
+        self.assertEqual(pool.started, 2)
+
+    def test_fallback(self) -> None:
+        """
+        Test the backend renders the page with a new process if the warm process fails.
+        """
+        backend = GhostscriptBackend()
+        backend.pool = self._pool('fail')
+        output = os.path.join(self._tmp, 'page.png')
+        with mock.patch('resources.backends.call') as call:
+            backend.render(self._pdf, 1, 72, output)
+        call.assert_called_once()
+        args = call.call_args[0][0]
+        self.assertIn(f'-sOutputFile={output}', args)
+        self.assertIn('-dFirstPage=2', args)
+        self.assertEqual(args[-1], self._pdf)
+
+    def test_sources(self) -> None:
+        """
+        Test the pdf is linked once for all its pages.
+        """
+        pool = self._pool('ok')
+        with mock.patch('resources.pool._link', wraps=shutil.copyfile) as link:
+            for i in range(3):
+                pool.render(self._pdf, i, 72, os.path.join(self._tmp, f'page{i}.png'))
+        link.assert_called_once()
+
+
+@unittest.skipIf(shutil.which('gs') is None, 'Ghostscript is not installed')
+class GhostscriptPoolTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._tmp = tempfile.mkdtemp()  # Outside the app local path, the pdf is linked within it
+        self._pdf = os.path.join(self._tmp, 'plan.pdf')
+        with open(self._pdf, 'wb') as f:
+            f.write(_PDF)
+        self.pool = RenderPool(GhostscriptBackend().server_args(), 10)
+
+    def tearDown(self) -> None:
+        self.pool.close()
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+    def test_render(self) -> None:
+        """
+        Test Ghostscript renders the pages of a pdf under -dSAFER, within the same process.
+        """
+        pixels = []
+        for i in (1, 0, 1):
+            output = os.path.join(self._tmp, f'page{i}.png')
+            self.pool.render(self._pdf, i, 144, output)
+            pixels.append(read_pixels(output))
+        self.assertEqual(self.pool.started, 1)
+        blank, page = pixels[0], pixels[1]
+        self.assertEqual(page.shape, (144, 144, 4))
+        self.assertEqual(blank[..., 3].max(), 0)  # Transparent
+        self.assertEqual(tuple(page[72, 72]), (0, 0, 0, 255))
+        self.assertAlmostEqual(page[..., 3].sum() / 255, 72 * 72, delta=4 * 72)  # Antialiased edges
+        self.assertTrue((pixels[2] == blank).all())
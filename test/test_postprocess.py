@@ -0,0 +1,82 @@
+"""
+TEST POSTPROCESS
+Test the raster post-processing of the rendered pages.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+import numpy as np
+import unittest
+from resources import postprocess
+from resources.postprocess import content_bounds, downsample, white_to_alpha
+from unittest import mock
+
+
+def _downsample(pixels: 'np.ndarray', factor: int) -> 'np.ndarray':
+    """
+    Reduce an image pixel by pixel, the squares are completed with transparent pixels.
+
+    :param pixels: RGBA pixels
+    :param factor: Reduction factor
+    :return: RGBA pixels
+    """
+    height, width = pixels.shape[:2]
+    out = np.zeros((-(-height // factor), -(-width // factor), 4))
+    for y in range(out.shape[0]):
+        for x in range(out.shape[1]):
+            square = pixels[y * factor:(y + 1) * factor, x * factor:(x + 1) * factor].reshape(-1, 4).astype(float)
+            alpha = square[:, 3].sum()
+            if alpha > 0:
+                out[y, x, :3] = (square[:, :3] * square[:, 3:]).sum(axis=0) / alpha
+            out[y, x, 3] = alpha / (factor * factor)
+    return out
+
+
+class PostprocessTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.pixels = np.full((9, 7, 4), 255, dtype=np.uint8)  # White page
+
+    def test_white_to_alpha(self) -> None:
+        """
+        Test only the pixels whose channels are at least the threshold become transparent.
+        """
+        self.pixels[1, 2] = (250, 255, 255, 255)
+        self.pixels[3, 4] = (255, 249, 255, 255)
+        self.pixels[5, 6] = (0, 0, 0, 128)
+        with mock.patch.object(postprocess, '_BLOCK_ROWS', 4):
+            white_to_alpha(self.pixels, 250)
+        alpha = np.zeros((9, 7), dtype=np.uint8)
+        alpha[3, 4], alpha[5, 6] = 255, 128
+        np.testing.assert_array_equal(self.pixels[..., 3], alpha)
+        self.assertEqual(tuple(self.pixels[3, 4]), (255, 249, 255, 255))
+
+    def test_content_bounds(self) -> None:
+        """
+        Test the bounds of the content across the blocks, a blank page has no bounds.
+        """
+        self.assertIsNone(content_bounds(self.pixels))
+        self.pixels[2, 3] = (0, 0, 0, 0)  # Transparent
+        self.pixels[4, 5] = (249, 255, 255, 255)
+        self.assertIsNone(content_bounds(self.pixels, white=249))
+        self.assertEqual(content_bounds(self.pixels), (5, 4, 6, 5))
+        self.pixels[7, 1] = (0, 0, 0, 255)
+        with mock.patch.object(postprocess, '_BLOCK_ROWS', 4):
+            self.assertEqual(content_bounds(self.pixels), (1, 4, 6, 8))
+
+    def test_downsample(self) -> None:
+        """
+        Test odd sizes, the opaque and transparent blocks are the mean of the squares weighted by the alpha.
+        """
+        pixels = np.random.default_rng(0).integers(0, 256, (11, 7, 4), dtype=np.uint8)
+        pixels[:6, :, 3] = 255  # Opaque blocks, then transparent ones
+        pixels[8, 2, 3] = 0
+        for rows in (3, 512):
+            for factor in (1, 2, 3, 4, 8):
+                with mock.patch.object(postprocess, '_BLOCK_ROWS', rows):
+                    out = downsample(pixels, factor)
+                expected = _downsample(pixels, factor)
+                self.assertEqual(out.shape, expected.shape)
+                self.assertLessEqual(np.abs(out - expected).max(), 1, (rows, factor))
+        opaque = np.full((5, 3, 4), 255, dtype=np.uint8)
+        np.testing.assert_array_equal(downsample(opaque, 2)[..., 3], [[255, 128], [255, 128], [128, 64]])
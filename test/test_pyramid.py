@@ -0,0 +1,68 @@
+"""
+TEST PYRAMID
+Test the levels and the Deep Zoom tiles of a small image.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+import numpy as np
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ElementTree
+from resources.postprocess import read_pixels
+from resources.pyramid import pyramid_levels, write_dzi
+
+# Constants
+_DZI_NS = '{http://schemas.microsoft.com/deepzoom/2008}'
+
+
+class PyramidTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.pixels = np.random.default_rng(0).integers(0, 256, (7, 10, 4), dtype=np.uint8)
+        self.pixels[..., 3] = 255
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def test_levels(self) -> None:
+        """
+        Test each level is half of the previous one, rounded up, down to a single pixel.
+        """
+        levels = pyramid_levels(self.pixels)
+        self.assertIs(levels[0], self.pixels)
+        self.assertEqual([p.shape[:2] for p in levels], [(7, 10), (4, 5), (2, 3), (1, 2), (1, 1)])
+
+    def test_dzi(self) -> None:
+        """
+        Test the tiles of each level, the edge tiles are smaller, and the descriptor.
+        """
+        levels = pyramid_levels(self.pixels)
+        output = os.path.join(self._tmp.name, 'page.dzi')
+        info = write_dzi(levels, output, 4, workers=2)
+        self.assertEqual(info, {'file': 'page.dzi', 'format': 'png', 'tile_size': 4, 'overlap': 1, 'levels': 5,
+                                'tiles': 11})
+
+        # Level: columns, rows
+        folder = os.path.join(self._tmp.name, 'page_files')
+        grid = {'0': (1, 1), '1': (1, 1), '2': (1, 1), '3': (2, 1), '4': (3, 2)}
+        self.assertEqual(sorted(os.listdir(folder)), sorted(grid))
+        for name, (cols, rows) in grid.items():
+            self.assertEqual(sorted(os.listdir(os.path.join(folder, name))),
+                             sorted(f'{c}_{r}.png' for c in range(cols) for r in range(rows)))
+
+        # Width, height of the tiles of the largest level, they overlap by a pixel
+        sizes = {'0_0': (5, 5), '1_0': (6, 5), '2_0': (3, 5), '0_1': (5, 4), '1_1': (6, 4), '2_1': (3, 4)}
+        for tile, (width, height) in sizes.items():
+            pixels = read_pixels(os.path.join(folder, '4', tile + '.png'))
+            self.assertEqual(pixels.shape[:2], (height, width))
+        np.testing.assert_array_equal(read_pixels(os.path.join(folder, '4', '2_1.png')), self.pixels[3:, 7:])
+        np.testing.assert_array_equal(read_pixels(os.path.join(folder, '3', '1_0.png')), levels[1][:, 3:])
+        np.testing.assert_array_equal(read_pixels(os.path.join(folder, '0', '0_0.png')), levels[-1])
+
+        image = ElementTree.parse(output).getroot()
+        self.assertEqual(image.tag, _DZI_NS + 'Image')
+        self.assertEqual(image.attrib, {'Format': 'png', 'Overlap': '1', 'TileSize': '4'})
+        self.assertEqual(image.find(_DZI_NS + 'Size').attrib, {'Width': '10', 'Height': '7'})
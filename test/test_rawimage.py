@@ -0,0 +1,86 @@
+"""
+TEST RAWIMAGE
+Test the decode of streamed png rows into a raw image.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+import io
+import numpy as np
+import os
+import tempfile
+import unittest
+from resources import rawimage
+from resources.png import png_from_rows
+from resources.rawimage import open_raw, raw_from_png
+from unittest import mock
+
+
+def _filter(row: 'np.ndarray', prior: 'np.ndarray', ft: int) -> bytes:
+    """
+    Filter a row of a png, the filters refer to the unfiltered pixels.
+
+    :param row: Row (bytes of the pixels)
+    :param prior: Row above
+    :param ft: Filter type
+    :return: Filtered row
+    """
+    a = np.concatenate([np.zeros(4, dtype=np.int16), row[:-4].astype(np.int16)])
+    b = prior.astype(np.int16)
+    c = np.concatenate([np.zeros(4, dtype=np.int16), prior[:-4].astype(np.int16)])
+    x = row.astype(np.int16)
+    if ft == 1:
+        x = x - a
+    elif ft == 2:
+        x = x - b
+    elif ft == 3:
+        x = x - (a + b) // 2
+    elif ft == 4:
+        p = a + b - c
+        pa, pb, pc = np.abs(p - a), np.abs(p - b), np.abs(p - c)
+        x = x - np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+    return bytes([ft]) + (x & 0xff).astype(np.uint8).tobytes()
+
+
+class RawImageTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.raw = os.path.join(self._tmp.name, 'page.pam')
+        self.pixels = np.random.default_rng(0).integers(0, 256, (23, 17, 4), dtype=np.uint8)
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def _png(self) -> io.BytesIO:
+        """
+        :return: Png of the pixels, the rows use each filter type in turn
+        """
+        height, width = self.pixels.shape[:2]
+        rows, prior = [], np.zeros(width * 4, dtype=np.uint8)
+        for y in range(height):
+            row = self.pixels[y].reshape(-1)
+            rows.append(_filter(row, prior, y % 5))
+            prior = row
+        return io.BytesIO(png_from_rows(width, height, b''.join(rows)))
+
+    def test_decode(self) -> None:
+        """
+        Test the rows are unfiltered across the blocks.
+        """
+        for block in (17 * 4, 3 * 17 * 4, 1 << 20):  # One row, three rows and the whole image per block
+            with mock.patch.object(rawimage, '_BLOCK_SIZE', block):
+                pixels = raw_from_png(self._png(), self.raw)
+                pixels.flush()
+                del pixels
+            np.testing.assert_array_equal(open_raw(self.raw, 'r'), self.pixels)
+
+    def test_truncated(self) -> None:
+        """
+        Test a png with less rows than its height.
+        """
+        data = self._png().getvalue()
+        width, height = self.pixels.shape[1], self.pixels.shape[0] + 1
+        header = png_from_rows(width, height, b'')[:33]  # Signature and IHDR chunk
+        png = header + data[33:]
+        self.assertRaises(ValueError, raw_from_png, io.BytesIO(png), self.raw)
@@ -0,0 +1,81 @@
+"""
+TEST SERVER
+Test the jobs queued through the conversion service.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+import http.client
+import json
+import os
+import tempfile
+import threading
+import unittest
+from resources.server import ConversionServer
+from resources.worker import JOB_QUEUED, JOB_RUNNING
+from test.test_pdfinfo import _OBJECTS, _classic
+from typing import Any, Dict, Tuple
+from unittest import mock
+
+
+class ServerTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.pdf = os.path.join(self._tmp.name, 'plan.pdf')
+        with open(self.pdf, 'wb') as f:
+            f.write(_classic(_OBJECTS)[0])  # Two pages
+        patcher = mock.patch('resources.worker.Converter')
+        self.converter = patcher.start()
+        self.converter.return_value.convert.return_value = []
+        self.addCleanup(patcher.stop)
+        self.server = ConversionServer({}, {'PAGES': '', 'FORMAT': 'png'}, {}, port=0)
+        threading.Thread(target=self.server._httpd.serve_forever, daemon=True).start()
+
+    def tearDown(self) -> None:
+        self.server._httpd.shutdown()
+        self.server._httpd.server_close()
+        self.server._worker.close()
+        self._tmp.cleanup()
+
+    def _post(self, query: str = '') -> Tuple[int, Dict[str, Any]]:
+        """
+        Queue the pdf by its path.
+
+        :param query: Query parameters
+        :return: Status and json of the response
+        """
+        conn = http.client.HTTPConnection(*self.server.address, timeout=10)
+        try:
+            conn.request('POST', '/jobs' + query, json.dumps({'path': self.pdf}),
+                         {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            conn.close()
+
+    def _overwrite(self, data: Dict[str, Any]) -> bool:
+        """
+        :return: Overwrite option of the converter of the job
+        """
+        job = self.server._worker.get(data['id'])
+        while job.state in (JOB_QUEUED, JOB_RUNNING):
+            self.server._worker.events.get(timeout=10)
+        return self.converter.call_args.kwargs.get('overwrite', False)
+
+    def test_existing(self) -> None:
+        """
+        Test the images next to the pdf are only replaced if the request asks for it.
+        """
+        status, data = self._post()
+        self.assertEqual(status, 202)
+        self.assertFalse(self._overwrite(data))
+        open(os.path.join(self._tmp.name, 'plan-2.png'), 'wb').close()
+        status, data = self._post()
+        self.assertEqual(status, 409)
+        self.assertIn('plan-2.png', data['error'])
+        status, _ = self._post('?pages=1')  # Only the first page
+        self.assertEqual(status, 202)
+        status, data = self._post('?overwrite=1')
+        self.assertEqual(status, 202)
+        self.assertTrue(self._overwrite(data))
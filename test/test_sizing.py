@@ -0,0 +1,103 @@
+"""
+TEST SIZING
+Test the render resolution and size of portrait, landscape and rotated pages.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+import math
+import unittest
+from resources.pdfinfo import PdfPage
+from resources.sizing import output_extent, render_density, render_size
+from typing import Tuple
+
+# Constants
+_A4 = (0, 0, 595.28, 841.89)  # Portrait
+_A1 = (0, 0, 2383.94, 1683.78)  # Landscape
+
+
+def _page(mediabox: Tuple[float, float, float, float], rotate: int = 0) -> PdfPage:
+    """
+    :return: Page whose CropBox is its MediaBox
+    """
+    return PdfPage(mediabox, mediabox, rotate)
+
+
+def _image_size(page: PdfPage, maxwidth: int, angle: float = 0) -> Tuple[float, float]:
+    """
+    :return: Size of the converted image (px), the rendered page rotated by the angle
+    """
+    w, h = render_size(page, render_density(page, maxwidth, angle))
+    if angle % 90 == 0:
+        return (h, w) if angle % 180 == 90 else (w, h)
+    a = math.radians(angle)
+    c, s = abs(math.cos(a)), abs(math.sin(a))
+    return w * c + h * s, w * s + h * c
+
+
+class SizingTest(unittest.TestCase):
+
+    def test_portrait(self) -> None:
+        """
+        Test the height of a portrait page is the maximum width.
+        """
+        page = _page(_A4)
+        density = render_density(page, 9600)
+        self.assertAlmostEqual(density, 9600 * 72 / 841.89)
+        self.assertEqual(render_size(page, density), (6788, 9600))
+
+    def test_landscape(self) -> None:
+        """
+        Test the width of a landscape page is the maximum width.
+        """
+        page = _page(_A1)
+        density = render_density(page, 9600)
+        self.assertAlmostEqual(density, 9600 * 72 / 2383.94)
+        self.assertEqual(render_size(page, density), (9600, 6780))
+
+    def test_origin(self) -> None:
+        """
+        Test the size of a MediaBox that does not start at the origin.
+        """
+        page = _page((100, 200, 100 + 595.28, 200 + 841.89))
+        self.assertEqual(render_size(page, render_density(page, 1920)), (1358, 1920))
+
+    def test_rotate(self) -> None:
+        """
+        Test the /Rotate 90 and 270 pages swap their width and height.
+        """
+        for rotate in (90, 270, -90):
+            page = _page(_A4, rotate)
+            self.assertAlmostEqual(page.width, 841.89)
+            self.assertAlmostEqual(page.height, 595.28)
+            self.assertEqual(render_size(page, render_density(page, 9600)), (9600, 6788))
+            page = _page(_A1, rotate)
+            self.assertEqual(render_size(page, render_density(page, 4800)), (3390, 4800))
+        self.assertEqual(render_size(_page(_A4, 180), render_density(_page(_A4, 180), 9600)), (6788, 9600))
+
+    def test_angle(self) -> None:
+        """
+        Test the image rotated by the angle has the maximum width.
+        """
+        for rotate in (0, 90, 270):
+            for mediabox in (_A4, _A1):
+                page = _page(mediabox, rotate)
+                self.assertEqual(output_extent(page, 90), (page.height, page.width))
+                self.assertEqual(output_extent(page, 180), (page.width, page.height))
+                for angle in (30, 45, 90, 135, 270, -60):
+                    self.assertAlmostEqual(max(output_extent(page, angle)) * render_density(page, 9600, angle) / 72,
+                                           9600)
+
+    def test_maxwidth(self) -> None:
+        """
+        Test the converted image never exceeds the maximum width by more than the rounding.
+        """
+        for rotate in (0, 90, 180, 270):
+            for mediabox in (_A4, _A1, (0, 0, 612, 792), (0, 0, 14400, 200)):
+                for maxwidth in (800, 1920, 4800, 9600, 40000):
+                    for angle in (0, 15, 90, 200, 270):
+                        size = _image_size(_page(mediabox, rotate), maxwidth, angle)
+                        self.assertLessEqual(max(size), maxwidth + 2)
+                        self.assertGreaterEqual(max(size), maxwidth - 2)
+                    size = render_size(_page(mediabox, rotate), render_density(_page(mediabox, rotate), maxwidth))
+                    self.assertEqual(max(size), maxwidth)
@@ -0,0 +1,43 @@
+"""
+TEST WORKER
+Test the events of the conversion worker.
+
+Author: Pablo Pizarro R. @ ppizarror.com
+"""
+
+import unittest
+from resources.worker import ConversionWorker, JOB_DONE, JOB_FAILED, JOB_RUNNING
+from typing import Any, List, Tuple
+from unittest import mock
+
+
+class WorkerTest(unittest.TestCase):
+
+    @staticmethod
+    def _states(worker: ConversionWorker, count: int) -> List[Tuple[Any, str]]:
+        """
+        :return: Job and state of the first state events
+        """
+        states = []
+        while len(states) < count:
+            kind, data = worker.events.get(timeout=10)
+            if kind == 'state':
+                states.append(data)
+        return states
+
+    def test_states(self) -> None:
+        """
+        Test each event keeps its own state, although the job finished before the events are read.
+        """
+        with mock.patch('resources.worker.Converter') as converter:
+            converter.return_value.convert.side_effect = [ValueError('invalid pdf'), ['page.png']]
+            worker = ConversionWorker({}, {})
+            try:
+                failed = worker.submit('failed.pdf', {})
+                done = worker.submit('done.pdf', {})
+                states = self._states(worker, 4)
+            finally:
+                worker.close()
+        self.assertEqual(states, [(failed, JOB_RUNNING), (failed, JOB_FAILED), (done, JOB_RUNNING), (done, JOB_DONE)])
+        self.assertIn('invalid pdf', failed.error)
+        self.assertEqual(done.images, ['page.png'])